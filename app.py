@@ -1,621 +1,4651 @@
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
-from flask_cors import CORS
-import sqlite3
-import json
-import qrcode
-import io
-import base64
-from datetime import datetime
-import os
-
-app = Flask(__name__)
-CORS(app)
-
-# Database setup
-def init_db():
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    
-    # Create books table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            isbn TEXT UNIQUE NOT NULL,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            category TEXT,
-            publication_year INTEGER,
-            description TEXT,
-            copies INTEGER DEFAULT 1,
-            available INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create borrowing history table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS borrow_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            isbn TEXT NOT NULL,
-            borrower_name TEXT NOT NULL,
-            borrower_email TEXT,
-            borrow_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            return_date TIMESTAMP,
-            status TEXT DEFAULT 'borrowed',
-            FOREIGN KEY (isbn) REFERENCES books (isbn)
-        )
-    ''')
-        # Insert sample data including CSE books
-    sample_books = [
-        # Original fiction books
-        ('9780142424179', 'The Fault in Our Stars', 'John Green', 'Fiction', 2012, 
-         'A touching story about two teenagers with cancer who fall in love.', 3, 2),
-        ('9780545010221', 'Harry Potter and the Deathly Hallows', 'J.K. Rowling', 'Fiction', 2007,
-         'The final installment in the Harry Potter series.', 5, 1),
-        ('9780316769488', 'The Catcher in the Rye', 'J.D. Salinger', 'Fiction', 1951,
-         'A classic coming-of-age story about Holden Caulfield.', 2, 0),
-
-        # Already present CSE books
-        ('9780262033848', 'Introduction to Algorithms', 'Thomas H. Cormen, Charles E. Leiserson', 'Computer Science', 2009,
-         'Comprehensive introduction to algorithms and data structures', 5, 4),
-        ('9780134494166', 'Clean Code: A Handbook of Agile Software Craftsmanship', 'Robert C. Martin', 'Programming', 2008,
-         'Best practices for writing clean, maintainable code', 3, 2),
-        ('9780135957059', 'The Pragmatic Programmer', 'David Thomas, Andrew Hunt', 'Programming', 2019,
-         'Your journey to mastery in software development', 4, 3),
-        ('9781449355739', 'Designing Data-Intensive Applications', 'Martin Kleppmann', 'Database', 2017,
-         'The big ideas behind reliable, scalable, and maintainable systems', 3, 1),
-        ('9780596007126', 'Head First Design Patterns', 'Eric Freeman, Elisabeth Robson', 'Software Engineering', 2004,
-         'A brain-friendly guide to design patterns', 2, 2),
-        ('9780134052502', 'Operating System Concepts', 'Abraham Silberschatz, Peter Baer Galvin', 'Operating Systems', 2018,
-         'Comprehensive introduction to operating systems', 4, 3),
-        ('9780134685991', 'Effective Java', 'Joshua Bloch', 'Programming', 2017,
-         'Best practices for the Java programming language', 3, 3),
-        ('9781593279509', 'Eloquent JavaScript', 'Marijn Haverbeke', 'Web Development', 2018,
-         'A modern introduction to programming with JavaScript', 4, 2),
-        ('9780132350884', 'Clean Architecture', 'Robert C. Martin', 'Software Architecture', 2017,
-         'A craftsman\'s guide to software structure and design', 3, 1),
-        ('9780596516178', 'JavaScript: The Good Parts', 'Douglas Crockford', 'Web Development', 2008,
-         'Unearthing the excellence in JavaScript', 2, 0),
-        ('9780262046305', 'Artificial Intelligence: A Modern Approach', 'Stuart Russell, Peter Norvig', 'Artificial Intelligence', 2020,
-         'Comprehensive introduction to artificial intelligence', 5, 3),
-
-        # ✅ Additional 20 CSE Books
-        ('9780131103627', 'The C Programming Language', 'Brian W. Kernighan, Dennis M. Ritchie', 'Programming', 1988,
-         'Classic reference for C programming by the creators of the language', 4, 3),
-        ('9780201633610', 'Design Patterns: Elements of Reusable Object-Oriented Software', 'Erich Gamma, Richard Helm, Ralph Johnson, John Vlissides', 'Software Engineering', 1994,
-         'The Gang of Four book on design patterns', 3, 2),
-        ('9780262035613', 'Deep Learning', 'Ian Goodfellow, Yoshua Bengio, Aaron Courville', 'Artificial Intelligence', 2016,
-         'Foundational textbook on deep learning and neural networks', 5, 4),
-        ('9780262510875', 'Structure and Interpretation of Computer Programs', 'Harold Abelson, Gerald Jay Sussman', 'Programming Languages', 1996,
-         'A legendary introduction to computer science concepts', 3, 2),
-        ('9780131101630', 'Computer Networks', 'Andrew S. Tanenbaum, David J. Wetherall', 'Networking', 2011,
-         'Comprehensive textbook on computer networks', 5, 4),
-        ('9780132143011', 'Database System Concepts', 'Abraham Silberschatz, Henry Korth, S. Sudarshan', 'Database', 2010,
-         'Comprehensive introduction to database systems', 4, 3),
-        ('9780123748560', 'Computer Organization and Design', 'David A. Patterson, John L. Hennessy', 'Computer Architecture', 2014,
-         'Textbook on computer organization and design principles', 5, 4),
-        ('9781558606043', 'Modern Operating Systems', 'Andrew S. Tanenbaum', 'Operating Systems', 2001,
-         'Classic OS textbook by Tanenbaum', 4, 3),
-        ('9780596009205', 'Learning Python', 'Mark Lutz', 'Programming', 2013,
-         'Comprehensive guide to Python programming', 5, 4),
-        ('9781449331818', 'Fluent Python', 'Luciano Ramalho', 'Programming', 2015,
-         'Best practices for writing Pythonic code', 3, 2),
-        ('9781491903995', 'Python for Data Analysis', 'Wes McKinney', 'Data Science', 2017,
-         'Practical guide for analyzing data with Python and Pandas', 4, 3),
-        ('9781788622212', 'Mastering React', 'Adam Horton, Ryan Vice', 'Web Development', 2018,
-         'Advanced guide for mastering React.js', 3, 2),
-        ('9781492051367', 'Learning React', 'Alex Banks, Eve Porcello', 'Web Development', 2020,
-         'Beginner-friendly guide to learning React.js', 4, 3),
-        ('9781492052203', 'Kubernetes: Up and Running', 'Kelsey Hightower, Brendan Burns, Joe Beda', 'Cloud Computing', 2019,
-         'Guide to deploying and managing applications with Kubernetes', 3, 2),
-        ('9781491950357', 'Site Reliability Engineering', 'Niall Richard Murphy, Betsy Beyer', 'DevOps', 2016,
-         'Google’s guide to building reliable, scalable systems', 2, 1),
-        ('9781118026472', 'Cybersecurity and Cyberwar: What Everyone Needs to Know', 'P.W. Singer, Allan Friedman', 'Cybersecurity', 2014,
-         'Essential introduction to cybersecurity concepts', 3, 2),
-        ('9783319924263', 'Computer Vision: Algorithms and Applications', 'Richard Szeliski', 'Artificial Intelligence', 2022,
-         'Comprehensive book on modern computer vision techniques', 4, 3),
-        ('9781119706670', 'Hands-On Machine Learning with Scikit-Learn, Keras, and TensorFlow', 'Aurélien Géron', 'Machine Learning', 2019,
-         'Practical guide for machine learning and deep learning', 5, 4),
-        ('9780262039246', 'Algorithms to Live By', 'Brian Christian, Tom Griffiths', 'Computer Science', 2016,
-         'How computer science algorithms apply to everyday life', 3, 2),
-        ('9780133594140', 'Computer Security: Principles and Practice', 'William Stallings, Lawrie Brown', 'Cybersecurity', 2017,
-         'Comprehensive introduction to computer security concepts', 4, 3)
-    ]
-
-    
-    for book in sample_books:
-        c.execute('''
-            INSERT OR IGNORE INTO books 
-            (isbn, title, author, category, publication_year, description, copies, available)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', book)
-    
-    conn.commit()
-    conn.close()
-
-# Database helper functions
-def get_db_connection():
-    conn = sqlite3.connect('library.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def book_to_dict(book_row):
-    return {
-        'id': book_row['id'],
-        'isbn': book_row['isbn'],
-        'title': book_row['title'],
-        'author': book_row['author'],
-        'category': book_row['category'],
-        'publication_year': book_row['publication_year'],
-        'description': book_row['description'],
-        'copies': book_row['copies'],
-        'available': book_row['available'],
-        'created_at': book_row['created_at']
-    }
-
-# QR Code generation
-def generate_qr_code(isbn):
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(isbn)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64 string
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_str}"
-
-# API Routes
-
-@app.route('/')
-def home():
-    return jsonify({
-        "message": "Library Management System API",
-        "endpoints": {
-            "GET /api/books": "Get all books",
-            "GET /api/books/<isbn>": "Get specific book by ISBN",
-            "POST /api/books": "Add new book",
-            "PUT /api/books/<isbn>": "Update book",
-            "DELETE /api/books/<isbn>": "Delete book",
-            "GET /api/books/<isbn>/qr": "Get QR code for book",
-            "POST /api/books/<isbn>/borrow": "Borrow book",
-            "POST /api/books/<isbn>/return": "Return book",
-            "GET /api/search": "Search books"
-        }
-    })
-
-@app.route('/api/books', methods=['GET'])
-def get_all_books():
-    try:
-        conn = get_db_connection()
-        books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-        conn.close()
-        
-        return jsonify([book_to_dict(book) for book in books])
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books/<isbn>', methods=['GET'])
-def get_book(isbn):
-    try:
-        conn = get_db_connection()
-        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        conn.close()
-        
-        if book:
-            return jsonify(book_to_dict(book))
-        else:
-            return jsonify({'error': 'Book not found'}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books', methods=['POST'])
-def add_book():
-    try:
-        data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ['isbn', 'title', 'author']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'{field} is required'}), 400
-        
-        # Validate ISBN format (13 digits)
-        isbn = data['isbn'].replace('-', '').replace(' ', '')
-        if not isbn.isdigit() or len(isbn) != 13:
-            return jsonify({'error': 'ISBN must be 13 digits'}), 400
-        
-        conn = get_db_connection()
-        
-        # Check if book already exists
-        existing = conn.execute('SELECT id FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        if existing:
-            conn.close()
-            return jsonify({'error': 'Book with this ISBN already exists'}), 400
-        
-        # Insert new book
-        copies = int(data.get('copies', 1))
-        conn.execute('''
-            INSERT INTO books (isbn, title, author, category, publication_year, 
-                             description, copies, available)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            isbn,
-            data['title'],
-            data['author'],
-            data.get('category'),
-            data.get('publication_year'),
-            data.get('description'),
-            copies,
-            copies
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'message': 'Book added successfully', 'isbn': isbn}), 201
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books/<isbn>', methods=['PUT'])
-def update_book(isbn):
-    try:
-        data = request.get_json()
-        
-        conn = get_db_connection()
-        
-        # Check if book exists
-        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        if not book:
-            conn.close()
-            return jsonify({'error': 'Book not found'}), 404
-        
-        # Update book
-        conn.execute('''
-            UPDATE books 
-            SET title = ?, author = ?, category = ?, publication_year = ?, 
-                description = ?, copies = ?, available = ?
-            WHERE isbn = ?
-        ''', (
-            data.get('title', book['title']),
-            data.get('author', book['author']),
-            data.get('category', book['category']),
-            data.get('publication_year', book['publication_year']),
-            data.get('description', book['description']),
-            data.get('copies', book['copies']),
-            data.get('available', book['available']),
-            isbn
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'message': 'Book updated successfully'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books/<isbn>', methods=['DELETE'])
-def delete_book(isbn):
-    try:
-        conn = get_db_connection()
-        
-        # Check if book exists
-        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        if not book:
-            conn.close()
-            return jsonify({'error': 'Book not found'}), 404
-        
-        # Delete book
-        conn.execute('DELETE FROM books WHERE isbn = ?', (isbn,))
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'message': 'Book deleted successfully'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books/<isbn>/qr', methods=['GET'])
-def get_book_qr(isbn):
-    try:
-        conn = get_db_connection()
-        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        conn.close()
-        
-        if not book:
-            return jsonify({'error': 'Book not found'}), 404
-        
-        qr_code = generate_qr_code(isbn)
-        
-        return jsonify({
-            'isbn': isbn,
-            'title': book['title'],
-            'qr_code': qr_code
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books/<isbn>/borrow', methods=['POST'])
-def borrow_book(isbn):
-    try:
-        data = request.get_json()
-        borrower_name = data.get('borrower_name')
-        borrower_email = data.get('borrower_email', '')
-        
-        if not borrower_name:
-            return jsonify({'error': 'Borrower name is required'}), 400
-        
-        conn = get_db_connection()
-        
-        # Check if book exists and is available
-        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        if not book:
-            conn.close()
-            return jsonify({'error': 'Book not found'}), 404
-        
-        if book['available'] <= 0:
-            conn.close()
-            return jsonify({'error': 'Book not available for borrowing'}), 400
-        
-        # Record borrowing
-        conn.execute('''
-            INSERT INTO borrow_history (isbn, borrower_name, borrower_email, status)
-            VALUES (?, ?, ?, 'borrowed')
-        ''', (isbn, borrower_name, borrower_email))
-        
-        # Update available count
-        conn.execute('''
-            UPDATE books SET available = available - 1 WHERE isbn = ?
-        ''', (isbn,))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'message': 'Book borrowed successfully'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/books/<isbn>/return', methods=['POST'])
-def return_book(isbn):
-    try:
-        data = request.get_json()
-        borrower_name = data.get('borrower_name')
-        
-        if not borrower_name:
-            return jsonify({'error': 'Borrower name is required'}), 400
-        
-        conn = get_db_connection()
-        
-        # Check if book exists
-        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-        if not book:
-            conn.close()
-            return jsonify({'error': 'Book not found'}), 404
-        
-        # Find active borrow record
-        borrow_record = conn.execute('''
-            SELECT * FROM borrow_history 
-            WHERE isbn = ? AND borrower_name = ? AND status = 'borrowed'
-            ORDER BY borrow_date DESC LIMIT 1
-        ''', (isbn, borrower_name)).fetchone()
-        
-        if not borrow_record:
-            conn.close()
-            return jsonify({'error': 'No active borrow record found'}), 404
-        
-        # Update borrow record
-        conn.execute('''
-            UPDATE borrow_history 
-            SET return_date = CURRENT_TIMESTAMP, status = 'returned'
-            WHERE id = ?
-        ''', (borrow_record['id'],))
-        
-        # Update available count
-        conn.execute('''
-            UPDATE books SET available = available + 1 WHERE isbn = ?
-        ''', (isbn,))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'message': 'Book returned successfully'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/search', methods=['GET'])
-def search_books():
-    try:
-        query = request.args.get('q', '').strip()
-        if not query:
-            return jsonify({'error': 'Search query is required'}), 400
-        
-        conn = get_db_connection()
-        
-        # Search in title, author, isbn, and category
-        search_pattern = f'%{query}%'
-        books = conn.execute('''
-            SELECT * FROM books 
-            WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ? OR category LIKE ?
-            ORDER BY title
-        ''', (search_pattern, search_pattern, search_pattern, search_pattern)).fetchall()
-        
-        conn.close()
-        
-        return jsonify([book_to_dict(book) for book in books])
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/borrow-history', methods=['GET'])
-def get_borrow_history():
-    try:
-        conn = get_db_connection()
-        
-        history = conn.execute('''
-            SELECT bh.*, b.title, b.author 
-            FROM borrow_history bh
-            JOIN books b ON bh.isbn = b.isbn
-            ORDER BY bh.borrow_date DESC
-        ''').fetchall()
-        
-        conn.close()
-        
-        return jsonify([dict(record) for record in history])
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/frontend')
-def serve_frontend():
-    """Serve the HTML frontend"""
-    try:
-        # Try to find the HTML file in current directory
-        if os.path.exists('index.html'):
-            return send_from_directory('.', 'index.html')
-        else:
-            # If index.html doesn't exist, return a simple message with instructions
-            return f'''
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Library Management System</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px; }}
-                    .error {{ background: #f8d7da; border: 1px solid #f5c6cb; padding: 15px; border-radius: 5px; }}
-                    .info {{ background: #d1ecf1; border: 1px solid #bee5eb; padding: 15px; border-radius: 5px; }}
-                    pre {{ background: #f8f9fa; padding: 10px; border-radius: 5px; overflow-x: auto; }}
-                </style>
-            </head>
-            <body>
-                <h1>📚 Library Management System</h1>
-                
-                <div class="error">
-                    <h3>❌ HTML Frontend Not Found</h3>
-                    <p>The <code>index.html</code> file is not in the same directory as your Flask app.</p>
-                </div>
-                
-                <div class="info">
-                    <h3>🔧 How to Fix This:</h3>
-                    
-                    <h4>Option 1: Save the HTML file (Recommended)</h4>
-                    <ol>
-                        <li>Copy the HTML code from Claude's artifact</li>
-                        <li>Save it as <code>index.html</code> in the same folder as your <code>app.py</code></li>
-                        <li>Refresh this page</li>
-                    </ol>
-                    
-                    <h4>Option 2: Use a separate server</h4>
-                    <ol>
-                        <li>Open a new terminal in your HTML file location</li>
-                        <li>Run: <pre>python3 -m http.server 8080</pre></li>
-                        <li>Access: <a href="http://localhost:8080/index.html">http://localhost:8080/index.html</a></li>
-                    </ol>
-                    
-                    <h4>Option 3: Use the API directly</h4>
-                    <p>Test the API endpoints:</p>
-                    <ul>
-                        <li><a href="/api/books">View all books</a></li>
-                        <li><a href="/api/stats">View library statistics</a></li>
-                        <li><a href="/generate-frontend-qr">Generate QR code</a></li>
-                    </ul>
-                </div>
-                
-                <div class="info">
-                    <h3>📱 API Endpoints Available:</h3>
-                    <ul>
-                        <li><strong>GET /api/books</strong> - Get all books</li>
-                        <li><strong>GET /api/books/&lt;isbn&gt;</strong> - Get specific book</li>
-                        <li><strong>POST /api/books</strong> - Add new book</li>
-                        <li><strong>GET /api/search?q=&lt;query&gt;</strong> - Search books</li>
-                        <li><strong>GET /generate-frontend-qr</strong> - Generate QR for frontend</li>
-                    </ul>
-                </div>
-            </body>
-            </html>
-            '''
-    except Exception as e:
-        return jsonify({'error': f'Error serving frontend: {str(e)}'}), 500
-
-@app.route('/generate-frontend-qr')
-def generate_frontend_qr_endpoint():
-    """Generate QR code for the frontend URL"""
-    try:
-        frontend_url = request.url_root + 'frontend'  # e.g., http://localhost:5000/frontend
-        qr_code = generate_qr_code(frontend_url)
-        
-        return jsonify({
-            'url': frontend_url,
-            'qr_code': qr_code,
-            'message': 'QR code for frontend access'
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/stats', methods=['GET'])
-def get_library_stats():
-    try:
-        conn = get_db_connection()
-        
-        # Get total books
-        total_books = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
-        
-        # Get total copies
-        total_copies = conn.execute('SELECT SUM(copies) as total FROM books').fetchone()['total'] or 0
-        
-        # Get available copies
-        available_copies = conn.execute('SELECT SUM(available) as total FROM books').fetchone()['total'] or 0
-        
-        # Get borrowed books
-        borrowed_books = total_copies - available_copies
-        
-        # Get categories
-        categories = conn.execute('''
-            SELECT category, COUNT(*) as count 
-            FROM books 
-            WHERE category IS NOT NULL 
-            GROUP BY category
-            ORDER BY count DESC
-        ''').fetchall()
-        
-        # Get recent borrowing activity
-        recent_activity = conn.execute('''
-            SELECT bh.*, b.title, b.author 
-            FROM borrow_history bh
-            JOIN books b ON bh.isbn = b.isbn
-            ORDER BY bh.borrow_date DESC
-            LIMIT 10
-        ''').fetchall()
-        
-        conn.close()
-        
-        return jsonify({
-            'total_books': total_books,
-            'total_copies': total_copies,
-            'available_copies': available_copies,
-            'borrowed_books': borrowed_books,
-            'categories': [dict(cat) for cat in categories],
-            'recent_activity': [dict(activity) for activity in recent_activity]
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-# Error handlers
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({'error': 'Endpoint not found'}), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({'error': 'Internal server error'}), 500
-
-if __name__ == '__main__':
-    # Initialize database
-    init_db()
-    
-    # Run the app
-    app.run(debug=True, host='0.0.0.0', port=6969)
\ No newline at end of file
+from flask import Flask, Response, g, has_request_context, request, jsonify, render_template_string, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+from flask_cors import CORS
+from PIL import Image, ImageDraw, ImageFont
+import click
+import sqlite3
+import json
+import qrcode
+import qrcode.image.svg
+import io
+import base64
+import csv
+import hashlib
+import multiprocessing
+import tempfile
+import zlib
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from datetime import datetime
+from bisect import bisect_left, insort
+from functools import lru_cache
+from urllib.parse import quote
+import atexit
+import heapq
+import os
+import queue
+import random
+import re
+import threading
+import time
+import unicodedata
+
+# Optional accelerators: each one is used when installed and skipped otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
+app = Flask(__name__)
+CORS(app)
+
+# Configuration
+HOST = os.environ.get('LIBRARY_HOST', '0.0.0.0')
+PORT = int(os.environ.get('LIBRARY_PORT', '6969'))
+SERVER_MODE = os.environ.get('LIBRARY_SERVER', 'wsgi')  # wsgi or asgi
+DEBUG = os.environ.get('LIBRARY_DEBUG', '0') == '1'
+WORKERS = int(os.environ.get('LIBRARY_WORKERS', '1'))
+DATABASE = os.environ.get('LIBRARY_DB', 'library.db')
+# Comma-separated branch names, each optionally name=path; unset means one 'main' branch on LIBRARY_DB
+BRANCHES = os.environ.get('LIBRARY_BRANCHES', '')
+BRANCH_DIR = os.environ.get('LIBRARY_BRANCH_DIR', os.path.dirname(DATABASE) or '.')
+BRANCH_HEADER = 'X-Library-Branch'
+FANOUT_WORKERS = int(os.environ.get('LIBRARY_FANOUT_WORKERS', '16'))
+DB_POOL_SIZE = int(os.environ.get('LIBRARY_DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('LIBRARY_DB_POOL_TIMEOUT', '30'))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('LIBRARY_DB_BUSY_TIMEOUT_MS', '5000'))
+DB_CACHE_SIZE_KB = int(os.environ.get('LIBRARY_DB_CACHE_SIZE_KB', '16384'))
+DB_MMAP_SIZE = int(os.environ.get('LIBRARY_DB_MMAP_SIZE', str(128 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.environ.get('LIBRARY_DB_STATEMENT_CACHE', '256'))
+SLOW_QUERY_MS = float(os.environ.get('LIBRARY_SLOW_QUERY_MS', '0'))  # 0 disables the slow-query log
+SERVER_TIMING = os.environ.get('LIBRARY_SERVER_TIMING', '1') == '1'
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('LIBRARY_SEARCH_LIMIT', '100'))
+SEARCH_MAX_LIMIT = 1000
+BOOKS_MAX_LIMIT = int(os.environ.get('LIBRARY_BOOKS_MAX_LIMIT', '1000'))
+STREAM_FETCH_SIZE = 500
+IMPORT_BATCH_SIZE = int(os.environ.get('LIBRARY_IMPORT_BATCH_SIZE', '1000'))
+IMPORT_MAX_REPORTED_ERRORS = 1000
+DB_WRITE_RETRIES = int(os.environ.get('LIBRARY_DB_WRITE_RETRIES', '5'))
+DB_RETRY_BACKOFF = float(os.environ.get('LIBRARY_DB_RETRY_BACKOFF', '0.02'))
+# Group commit: opt-in single writer per branch that batches borrow/return/add writes
+GROUP_COMMIT = os.environ.get('LIBRARY_GROUP_COMMIT', '0') == '1'
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('LIBRARY_GROUP_COMMIT_MAX_BATCH', '64'))
+GROUP_COMMIT_MAX_WAIT = float(os.environ.get('LIBRARY_GROUP_COMMIT_MAX_WAIT_MS', '2')) / 1000
+GROUP_COMMIT_QUEUE_SIZE = int(os.environ.get('LIBRARY_GROUP_COMMIT_QUEUE_SIZE', '1024'))
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('LIBRARY_GROUP_COMMIT_TIMEOUT', '5'))
+# Read replicas: off, memory (an in-process copy) or file (snapshot files in LIBRARY_REPLICA_DIR)
+REPLICA_MODE = os.environ.get('LIBRARY_REPLICA_MODE', 'off')
+REPLICA_DIR = os.environ.get('LIBRARY_REPLICA_DIR', BRANCH_DIR)
+REPLICA_REFRESH = float(os.environ.get('LIBRARY_REPLICA_REFRESH', '5'))
+REPLICA_REFRESH_WRITES = int(os.environ.get('LIBRARY_REPLICA_REFRESH_WRITES', '1000'))
+REPLICA_MAX_STALENESS = float(os.environ.get('LIBRARY_REPLICA_MAX_STALENESS', '30'))
+REPLICA_STALENESS_HEADER = 'X-Library-Max-Staleness'
+CHECKOUT_MAX_ITEMS = int(os.environ.get('LIBRARY_CHECKOUT_MAX_ITEMS', '50'))
+RECENT_ACTIVITY_SIZE = 10
+HISTORY_MAX_LIMIT = int(os.environ.get('LIBRARY_HISTORY_MAX_LIMIT', '1000'))
+ARCHIVE_BATCH_SIZE = 900
+CACHE_BACKEND = os.environ.get('LIBRARY_CACHE_BACKEND', 'memory')  # memory, redis or none
+CACHE_TTL = int(os.environ.get('LIBRARY_CACHE_TTL', '60'))
+CACHE_MAX_ITEMS = int(os.environ.get('LIBRARY_CACHE_MAX_ITEMS', '10000'))
+CACHE_REDIS_URL = os.environ.get('LIBRARY_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_KEY_PREFIX = os.environ.get('LIBRARY_CACHE_KEY_PREFIX', 'library:')
+QR_CACHE_SIZE = int(os.environ.get('LIBRARY_QR_CACHE_SIZE', '1024'))
+QR_CACHE_DIR = os.environ.get('LIBRARY_QR_CACHE_DIR', 'qr_cache')  # empty disables the disk tier
+QR_CACHE_MAX_AGE = int(os.environ.get('LIBRARY_QR_CACHE_MAX_AGE', '86400'))
+LABEL_WORKERS = int(os.environ.get('LIBRARY_LABEL_WORKERS', str(os.cpu_count() or 2)))
+LABEL_MAX_ITEMS = int(os.environ.get('LIBRARY_LABEL_MAX_ITEMS', '20000'))
+JSON_BACKEND = os.environ.get('LIBRARY_JSON_BACKEND', 'auto')  # auto (orjson when installed) or std
+# Content-Encodings in server preference order; an empty value disables compression
+COMPRESS_ENCODINGS = [e for e in os.environ.get('LIBRARY_COMPRESS', 'zstd,br,gzip').split(',') if e]
+COMPRESS_MIN_SIZE = int(os.environ.get('LIBRARY_COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVELS = {'gzip': 6, 'br': 4, 'zstd': 3}
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+SUGGEST_SCAN_LIMIT = 5000  # index entries examined per lookup, which bounds latency for 1-letter prefixes
+SUGGEST_MAX_WORDS = 8  # word suffixes indexed per title or author name
+SUGGEST_KEY_LENGTH = 48
+FUZZY_THRESHOLD = float(os.environ.get('LIBRARY_FUZZY_THRESHOLD', '0.7'))
+FUZZY_CANDIDATES = 200  # trigram hits re-scored with edit distance, best-overlap first
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_LIMIT = 5000
+CHANGES_POLL_INTERVAL = float(os.environ.get('LIBRARY_CHANGES_POLL_INTERVAL', '1.0'))
+CHANGES_BUFFER = 1000  # recent changes each feed keeps in memory for subscribers
+SSE_HEARTBEAT = 15
+BATCH_MAX_ITEMS = int(os.environ.get('LIBRARY_BATCH_MAX_ITEMS', '1000'))
+RECOMMEND_DEFAULT_LIMIT = 10
+RECOMMEND_MAX_LIMIT = 50
+RECOMMEND_REFRESH = int(os.environ.get('LIBRARY_RECOMMEND_REFRESH', '900'))
+# SQLite's default SQLITE_MAX_VARIABLE_NUMBER is 999 on older builds
+SQL_IN_CHUNK_SIZE = 900
+# bm25() column weights for books_fts: title, author, isbn, category, description
+SEARCH_WEIGHTS = (10.0, 6.0, 4.0, 2.0, 1.0)
+
+# Instrumentation
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in pairs) + '}'
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, label_values, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, label_values, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class CounterMetric:
+    """Prometheus-style monotonically increasing counter"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+request_latency = Histogram(
+    'library_http_request_duration_seconds', 'HTTP request latency by route.',
+    ('method', 'route', 'status')
+)
+response_size = Histogram(
+    'library_http_response_size_bytes', 'Size of non-streamed response bodies by route.',
+    ('route',), SIZE_BUCKETS
+)
+query_latency = Histogram(
+    'library_db_query_duration_seconds', 'SQLite statement time including row fetches.',
+    ('statement',)
+)
+query_rows = CounterMetric(
+    'library_db_rows_returned_total', 'Rows fetched from SQLite by statement.', ('statement',)
+)
+group_commit_batch_size = Histogram(
+    'library_group_commit_batch_size', 'Writes applied per group-commit transaction.',
+    (), (1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+qr_render_latency = Histogram(
+    'library_qr_render_duration_seconds', 'Time spent rendering QR codes on cache misses.',
+    ('format',)
+)
+
+# Per-request accumulators behind the Server-Timing header
+request_timing = threading.local()
+
+def record_timing(kind, seconds, count=1):
+    if getattr(request_timing, 'active', False):
+        setattr(request_timing, kind, getattr(request_timing, kind) + seconds)
+        setattr(request_timing, kind + '_count', getattr(request_timing, kind + '_count') + count)
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Collapse a SQL string into a bounded-cardinality metric label"""
+    sql = ' '.join(sql.split())
+    sql = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)  # IN lists of any length
+    return sql[:160]
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute plus fetches and counts returned rows.
+
+    The observation is recorded when the cursor is dropped, which CPython does
+    as soon as the calling expression (e.g. execute(...).fetchone()) finishes.
+    """
+
+    def __init__(self, cursor, sql, elapsed):
+        self._cursor = cursor
+        self._sql = sql
+        self._elapsed = elapsed
+        self._rows = 0
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._rows += row is not None
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._timed(self._cursor.fetchmany, size)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def finish(self):
+        if self._done:
+            return
+        self._done = True
+        label = statement_label(self._sql)
+        query_latency.observe((label,), self._elapsed)
+        if self._rows:
+            query_rows.inc((label,), self._rows)
+        record_timing('db', self._elapsed)
+        if SLOW_QUERY_MS and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            app.logger.warning('Slow query (%.1f ms, %d rows): %s', self._elapsed * 1000, self._rows, label)
+
+    def __del__(self):
+        self.finish()
+
+# Connection pool
+def connect_db(database=DATABASE):
+    """Open a connection with WAL mode and the tuned pragmas applied"""
+    conn = sqlite3.connect(
+        database,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    return conn
+
+class PooledConnection:
+    """Checked-out pool connection; close() hands it back instead of closing it"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        cursor = self._conn.execute(sql, parameters)
+        return InstrumentedCursor(cursor, sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        cursor = self._conn.executemany(sql, seq_of_parameters)
+        return InstrumentedCursor(cursor, sql, time.perf_counter() - started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self.close()
+
+    def close(self):
+        self._pool.release()
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived SQLite connections with per-thread checkout.
+
+    A thread that calls acquire() again before releasing gets the connection it
+    already holds, so nested helpers never deadlock on an exhausted pool.
+    """
+
+    def __init__(self, database=DATABASE, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, connect=connect_db):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.connect = connect
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+
+    def acquire(self):
+        # Connections must not cross a fork (gunicorn --preload); start over
+        if self._pid != os.getpid():
+            self._reset()
+
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeError('Timed out waiting for a database connection')
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self.connect(self.database)
+            except Exception:
+                self._slots.release()
+                raise
+
+        self._local.conn = PooledConnection(self, conn)
+        self._local.depth = 1
+        return self._local.conn
+
+    def release(self, force=False):
+        held = getattr(self._local, 'conn', None)
+        if held is None:
+            return
+
+        self._local.depth -= 1
+        if self._local.depth > 0 and not force:
+            return
+
+        self._local.conn = None
+        conn = held._conn
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+# Branch shards
+def parse_branches(spec):
+    """Branch name -> database path from LIBRARY_BRANCHES"""
+    branches = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, path = entry.partition('=')
+        branches[name.strip()] = path.strip() or os.path.join(BRANCH_DIR, f'{name.strip()}.db')
+    return branches or {'main': DATABASE}
+
+BRANCH_DATABASES = parse_branches(BRANCHES)
+DEFAULT_BRANCH = os.environ.get('LIBRARY_DEFAULT_BRANCH') or next(iter(BRANCH_DATABASES))
+if DEFAULT_BRANCH not in BRANCH_DATABASES:
+    raise ValueError(f'LIBRARY_DEFAULT_BRANCH {DEFAULT_BRANCH!r} is not in LIBRARY_BRANCHES')
+SHARDED = len(BRANCH_DATABASES) > 1
+
+# One pool per shard, so a busy branch never holds up writers elsewhere
+db_pools = {name: ConnectionPool(path) for name, path in BRANCH_DATABASES.items()}
+
+branch_context = threading.local()
+
+def current_branch():
+    """Branch of the active use_branch() block or request; the default branch otherwise"""
+    branch = getattr(branch_context, 'name', None)
+    if branch is None and has_request_context():
+        branch = g.get('branch')
+    return branch or DEFAULT_BRANCH
+
+@contextmanager
+def use_branch(name):
+    previous = getattr(branch_context, 'name', None)
+    branch_context.name = name
+    try:
+        yield
+    finally:
+        branch_context.name = previous
+
+_fanout_executor = None
+_fanout_executor_lock = threading.Lock()
+
+def get_fanout_executor():
+    global _fanout_executor
+    with _fanout_executor_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(
+                max_workers=min(FANOUT_WORKERS, len(db_pools)),
+                thread_name_prefix='library-fanout'
+            )
+        return _fanout_executor
+
+def fan_out(fn, *args, branches=None):
+    """Run fn(conn, *args) against each branch in parallel; returns {branch: result}"""
+    branches = list(branches or db_pools)
+    # Resolved here because the workers have no request to pick a replica from
+    pools = {branch: read_pool(branch) for branch in branches}
+
+    def run(branch):
+        with use_branch(branch):
+            conn = pools[branch].acquire()
+            try:
+                return fn(conn, *args)
+            finally:
+                conn.close()
+
+    if len(branches) == 1:
+        return {branches[0]: run(branches[0])}
+    futures = {branch: get_fanout_executor().submit(run, branch) for branch in branches}
+    return {branch: future.result() for branch, future in futures.items()}
+
+def _sqlite_has_fts5():
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE fts5_probe USING fts5(body)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+FTS5_AVAILABLE = _sqlite_has_fts5()
+
+def _sqlite_has_trigram_tokenizer():
+    # The FTS5 trigram tokenizer arrived in SQLite 3.34
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE trigram_probe USING fts5(body, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+TRIGRAM_AVAILABLE = FTS5_AVAILABLE and _sqlite_has_trigram_tokenizer()
+
+# Schema migrations
+# Each migration runs once, in order, inside its own transaction, and
+# PRAGMA user_version records the last one applied. Append new entries;
+# never edit a migration that has already shipped.
+def migrate_core_tables(c):
+    # IF NOT EXISTS: databases created before migrations were tracked
+    # already have these tables at user_version 0
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            isbn TEXT UNIQUE NOT NULL,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            category TEXT,
+            publication_year INTEGER,
+            description TEXT,
+            copies INTEGER DEFAULT 1,
+            available INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS borrow_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            isbn TEXT NOT NULL,
+            borrower_name TEXT NOT NULL,
+            borrower_email TEXT,
+            borrow_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            return_date TIMESTAMP,
+            status TEXT DEFAULT 'borrowed',
+            FOREIGN KEY (isbn) REFERENCES books (isbn)
+        )
+    ''')
+
+def migrate_search_index(c):
+    """External-content FTS5 table over books, kept in sync by triggers"""
+    if not FTS5_AVAILABLE:
+        return
+
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone()
+
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author, isbn, category, description,
+            content='books', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author, isbn, category, description)
+            VALUES (new.id, new.title, new.author, new.isbn, new.category, new.description);
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, isbn, category, description)
+            VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category, old.description);
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update
+        AFTER UPDATE OF title, author, isbn, category, description ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, isbn, category, description)
+            VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category, old.description);
+            INSERT INTO books_fts (rowid, title, author, isbn, category, description)
+            VALUES (new.id, new.title, new.author, new.isbn, new.category, new.description);
+        END
+    ''')
+
+    # Backfill books that were inserted before the index existed
+    if not exists:
+        c.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+def migrate_indexes(c):
+    # Keyset pagination on GET /api/books
+    c.execute('CREATE INDEX IF NOT EXISTS idx_books_title_id ON books (title, id)')
+
+    # Category counts and per-category listings
+    c.execute('CREATE INDEX IF NOT EXISTS idx_books_category ON books (category, title, id)')
+
+    # Active loans only: the lookup in return_book and open-loan counts
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_history_active
+        ON borrow_history (isbn, borrower_name, borrow_date)
+        WHERE status = 'borrowed'
+    ''')
+
+    # Newest-first history listings
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_history_borrow_date
+        ON borrow_history (borrow_date)
+    ''')
+
+def migrate_stats_tables(c):
+    """Summary tables behind /api/stats, maintained by triggers on every write"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS library_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_books INTEGER NOT NULL DEFAULT 0,
+            total_copies INTEGER NOT NULL DEFAULT 0,
+            available_copies INTEGER NOT NULL DEFAULT 0,
+            active_loans INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS category_stats (
+            category TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_stats_insert AFTER INSERT ON books BEGIN
+            UPDATE library_stats SET
+                total_books = total_books + 1,
+                total_copies = total_copies + COALESCE(new.copies, 0),
+                available_copies = available_copies + COALESCE(new.available, 0)
+            WHERE id = 1;
+            INSERT INTO category_stats (category, count)
+            SELECT new.category, 1 WHERE new.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET count = count + 1;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_stats_delete AFTER DELETE ON books BEGIN
+            UPDATE library_stats SET
+                total_books = total_books - 1,
+                total_copies = total_copies - COALESCE(old.copies, 0),
+                available_copies = available_copies - COALESCE(old.available, 0)
+            WHERE id = 1;
+            UPDATE category_stats SET count = count - 1 WHERE category = old.category;
+            DELETE FROM category_stats WHERE category = old.category AND count <= 0;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_stats_update
+        AFTER UPDATE OF copies, available ON books BEGIN
+            UPDATE library_stats SET
+                total_copies = total_copies - COALESCE(old.copies, 0) + COALESCE(new.copies, 0),
+                available_copies = available_copies - COALESCE(old.available, 0) + COALESCE(new.available, 0)
+            WHERE id = 1;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_stats_recategorize
+        AFTER UPDATE OF category ON books
+        WHEN old.category IS NOT new.category BEGIN
+            UPDATE category_stats SET count = count - 1 WHERE category = old.category;
+            DELETE FROM category_stats WHERE category = old.category AND count <= 0;
+            INSERT INTO category_stats (category, count)
+            SELECT new.category, 1 WHERE new.category IS NOT NULL
+            ON CONFLICT (category) DO UPDATE SET count = count + 1;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS borrow_history_stats_insert
+        AFTER INSERT ON borrow_history WHEN new.status = 'borrowed' BEGIN
+            UPDATE library_stats SET active_loans = active_loans + 1 WHERE id = 1;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS borrow_history_stats_update
+        AFTER UPDATE OF status ON borrow_history
+        WHEN (old.status = 'borrowed') IS NOT (new.status = 'borrowed') BEGIN
+            UPDATE library_stats SET
+                active_loans = active_loans + (new.status = 'borrowed') - (old.status = 'borrowed')
+            WHERE id = 1;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS borrow_history_stats_delete
+        AFTER DELETE ON borrow_history WHEN old.status = 'borrowed' BEGIN
+            UPDATE library_stats SET active_loans = active_loans - 1 WHERE id = 1;
+        END
+    ''')
+
+    # Backfill from whatever is already in the tables
+    c.execute('''
+        INSERT OR REPLACE INTO library_stats
+            (id, total_books, total_copies, available_copies, active_loans)
+        SELECT 1,
+               (SELECT COUNT(*) FROM books),
+               (SELECT COALESCE(SUM(copies), 0) FROM books),
+               (SELECT COALESCE(SUM(available), 0) FROM books),
+               (SELECT COUNT(*) FROM borrow_history WHERE status = 'borrowed')
+    ''')
+    c.execute('DELETE FROM category_stats')
+    c.execute('''
+        INSERT INTO category_stats (category, count)
+        SELECT category, COUNT(*) FROM books WHERE category IS NOT NULL GROUP BY category
+    ''')
+
+def migrate_catalog_version(c):
+    """Counter bumped by every write to books; catalog ETags and cache keys use it"""
+    c.execute('ALTER TABLE library_stats ADD COLUMN catalog_version INTEGER NOT NULL DEFAULT 0')
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS books_version_{event.lower()} AFTER {event} ON books BEGIN
+                UPDATE library_stats SET catalog_version = catalog_version + 1 WHERE id = 1;
+            END
+        ''')
+
+def migrate_history_archive(c):
+    # Filtered history listings, newest first within each filter
+    c.execute('CREATE INDEX IF NOT EXISTS idx_borrow_history_isbn ON borrow_history (isbn, borrow_date)')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_history_borrower
+        ON borrow_history (borrower_name, borrow_date)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_history_status
+        ON borrow_history (status, borrow_date)
+    ''')
+
+    # Cold storage for returned loans moved out of the hot table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS borrow_history_archive (
+            id INTEGER PRIMARY KEY,
+            isbn TEXT NOT NULL,
+            borrower_name TEXT NOT NULL,
+            borrower_email TEXT,
+            borrow_date TIMESTAMP,
+            return_date TIMESTAMP,
+            status TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def migrate_trigram_index(c):
+    """Trigram FTS5 table over titles and authors for typo-tolerant search"""
+    if not TRIGRAM_AVAILABLE:
+        return
+
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_trigram USING fts5(
+            title, author,
+            content='books', content_rowid='id',
+            tokenize='trigram'
+        )
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_trigram_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_trigram (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_trigram_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_trigram (books_trigram, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_trigram_update AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_trigram (books_trigram, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_trigram (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''')
+
+    c.execute("INSERT INTO books_trigram (books_trigram) VALUES ('rebuild')")
+
+BOOK_CHANGE_PAYLOAD = '''json_object(
+    'isbn', new.isbn, 'title', new.title, 'author', new.author, 'category', new.category,
+    'publication_year', new.publication_year, 'description', new.description,
+    'copies', new.copies, 'available', new.available
+)'''
+
+def migrate_change_log(c):
+    """Sequenced log of book changes behind /api/changes, written by triggers"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS book_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            isbn TEXT NOT NULL,
+            op TEXT NOT NULL,
+            book TEXT,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS book_changes_insert AFTER INSERT ON books BEGIN
+            INSERT INTO book_changes (isbn, op, book) VALUES (new.isbn, 'insert', {BOOK_CHANGE_PAYLOAD});
+        END
+    ''')
+
+    # Upserts that rewrite identical values are not changes
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS book_changes_update AFTER UPDATE ON books
+        WHEN old.isbn IS NOT new.isbn OR old.title IS NOT new.title OR old.author IS NOT new.author
+          OR old.category IS NOT new.category OR old.publication_year IS NOT new.publication_year
+          OR old.description IS NOT new.description OR old.copies IS NOT new.copies
+          OR old.available IS NOT new.available
+        BEGIN
+            INSERT INTO book_changes (isbn, op, book) VALUES (new.isbn, 'update', {BOOK_CHANGE_PAYLOAD});
+        END
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_changes_delete AFTER DELETE ON books BEGIN
+            INSERT INTO book_changes (isbn, op) VALUES (old.isbn, 'delete');
+        END
+    ''')
+
+    # Keep the newest 100000 entries; clients further behind than that resync
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_changes_prune AFTER INSERT ON book_changes BEGIN
+            DELETE FROM book_changes WHERE seq <= new.seq - 100000;
+        END
+    ''')
+
+MIGRATIONS = [
+    (1, 'books and borrow_history tables', migrate_core_tables),
+    (2, 'full-text search index', migrate_search_index),
+    (3, 'indexes for hot queries', migrate_indexes),
+    (4, 'trigger-maintained statistics', migrate_stats_tables),
+    (5, 'catalog version counter', migrate_catalog_version),
+    (6, 'borrow history filters and archive', migrate_history_archive),
+    (7, 'trigram index for fuzzy search', migrate_trigram_index),
+    (8, 'book change log', migrate_change_log),
+]
+
+# Migrations that do nothing on SQLite builds without FTS5 or the trigram
+# tokenizer. user_version still moves past them, so migrate_db re-runs them
+# whenever their table is missing, and a later build that has the feature
+# creates it.
+DEFERRED_MIGRATIONS = {2: 'books_fts', 7: 'books_trigram'}
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def migrate_db(conn):
+    """Apply pending migrations; safe to run from several workers at once"""
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+
+        # Re-check under the write lock in case another process got here first
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version > schema_version(conn):
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied.append((version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    for version, description, migration in MIGRATIONS:
+        table = DEFERRED_MIGRATIONS.get(version)
+        if table is None or version > schema_version(conn) or table_exists(conn, table):
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not table_exists(conn, table):
+                migration(conn.cursor())
+                if table_exists(conn, table):
+                    applied.append((version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+# Query plan checks
+# Hot queries that must stay index-backed; `flask check-query-plans` fails
+# when any of them regresses to a full table scan or a temp-table sort.
+HOT_QUERIES = {
+    'book by isbn': ('SELECT * FROM books WHERE isbn = ?', ('9780262033848',)),
+    'catalog page': (
+        'SELECT * FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT ?',
+        ('', 0, 50)
+    ),
+    'books in category': (
+        'SELECT isbn, title FROM books WHERE category = ? ORDER BY title, id',
+        ('Programming',)
+    ),
+    'active loan lookup': ('''
+        SELECT id FROM borrow_history
+        WHERE isbn = ? AND borrower_name = ? AND status = 'borrowed'
+        ORDER BY borrow_date DESC LIMIT 1
+    ''', ('9780262033848', 'reader')),
+    'recent activity': ('''
+        SELECT bh.*, b.title, b.author
+        FROM borrow_history bh
+        JOIN books b ON bh.isbn = b.isbn
+        ORDER BY bh.borrow_date DESC
+        LIMIT 10
+    ''', ()),
+    'history page by borrower': ('''
+        SELECT bh.*, b.title, b.author
+        FROM borrow_history bh
+        JOIN books b ON bh.isbn = b.isbn
+        WHERE bh.borrower_name = ? AND (bh.borrow_date, bh.id) < (?, ?)
+        ORDER BY bh.borrow_date DESC, bh.id DESC
+        LIMIT 50
+    ''', ('reader', '9999-12-31', 0)),
+    'history page by isbn': ('''
+        SELECT bh.*, b.title, b.author
+        FROM borrow_history bh
+        JOIN books b ON bh.isbn = b.isbn
+        WHERE bh.isbn = ?
+        ORDER BY bh.borrow_date DESC, bh.id DESC
+        LIMIT 50
+    ''', ('9780262033848',)),
+}
+
+def plan_problems(detail):
+    if detail.startswith('SCAN ') and ' USING ' not in detail:
+        return 'full table scan'
+    if 'USE TEMP B-TREE' in detail:
+        return 'temp b-tree sort'
+    return None
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """EXPLAIN every hot query; returns (name, plan step, problem) for each regression"""
+    regressions = []
+    for name, (sql, params) in queries.items():
+        for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+            problem = plan_problems(row['detail'])
+            if problem:
+                regressions.append((name, row['detail'], problem))
+    return regressions
+
+# Database setup
+def init_db():
+    for branch, database in BRANCH_DATABASES.items():
+        if branch != DEFAULT_BRANCH:
+            conn = connect_db(database)
+            migrate_db(conn)
+            conn.close()
+
+    conn = connect_db(BRANCH_DATABASES[DEFAULT_BRANCH])
+    migrate_db(conn)
+    c = conn.cursor()
+
+        # Insert sample data including CSE books
+    sample_books = [
+        # Original fiction books
+        ('9780142424179', 'The Fault in Our Stars', 'John Green', 'Fiction', 2012, 
+         'A touching story about two teenagers with cancer who fall in love.', 3, 2),
+        ('9780545010221', 'Harry Potter and the Deathly Hallows', 'J.K. Rowling', 'Fiction', 2007,
+         'The final installment in the Harry Potter series.', 5, 1),
+        ('9780316769488', 'The Catcher in the Rye', 'J.D. Salinger', 'Fiction', 1951,
+         'A classic coming-of-age story about Holden Caulfield.', 2, 0),
+
+        # Already present CSE books
+        ('9780262033848', 'Introduction to Algorithms', 'Thomas H. Cormen, Charles E. Leiserson', 'Computer Science', 2009,
+         'Comprehensive introduction to algorithms and data structures', 5, 4),
+        ('9780134494166', 'Clean Code: A Handbook of Agile Software Craftsmanship', 'Robert C. Martin', 'Programming', 2008,
+         'Best practices for writing clean, maintainable code', 3, 2),
+        ('9780135957059', 'The Pragmatic Programmer', 'David Thomas, Andrew Hunt', 'Programming', 2019,
+         'Your journey to mastery in software development', 4, 3),
+        ('9781449355739', 'Designing Data-Intensive Applications', 'Martin Kleppmann', 'Database', 2017,
+         'The big ideas behind reliable, scalable, and maintainable systems', 3, 1),
+        ('9780596007126', 'Head First Design Patterns', 'Eric Freeman, Elisabeth Robson', 'Software Engineering', 2004,
+         'A brain-friendly guide to design patterns', 2, 2),
+        ('9780134052502', 'Operating System Concepts', 'Abraham Silberschatz, Peter Baer Galvin', 'Operating Systems', 2018,
+         'Comprehensive introduction to operating systems', 4, 3),
+        ('9780134685991', 'Effective Java', 'Joshua Bloch', 'Programming', 2017,
+         'Best practices for the Java programming language', 3, 3),
+        ('9781593279509', 'Eloquent JavaScript', 'Marijn Haverbeke', 'Web Development', 2018,
+         'A modern introduction to programming with JavaScript', 4, 2),
+        ('9780132350884', 'Clean Architecture', 'Robert C. Martin', 'Software Architecture', 2017,
+         'A craftsman\'s guide to software structure and design', 3, 1),
+        ('9780596516178', 'JavaScript: The Good Parts', 'Douglas Crockford', 'Web Development', 2008,
+         'Unearthing the excellence in JavaScript', 2, 0),
+        ('9780262046305', 'Artificial Intelligence: A Modern Approach', 'Stuart Russell, Peter Norvig', 'Artificial Intelligence', 2020,
+         'Comprehensive introduction to artificial intelligence', 5, 3),
+
+        # ✅ Additional 20 CSE Books
+        ('9780131103627', 'The C Programming Language', 'Brian W. Kernighan, Dennis M. Ritchie', 'Programming', 1988,
+         'Classic reference for C programming by the creators of the language', 4, 3),
+        ('9780201633610', 'Design Patterns: Elements of Reusable Object-Oriented Software', 'Erich Gamma, Richard Helm, Ralph Johnson, John Vlissides', 'Software Engineering', 1994,
+         'The Gang of Four book on design patterns', 3, 2),
+        ('9780262035613', 'Deep Learning', 'Ian Goodfellow, Yoshua Bengio, Aaron Courville', 'Artificial Intelligence', 2016,
+         'Foundational textbook on deep learning and neural networks', 5, 4),
+        ('9780262510875', 'Structure and Interpretation of Computer Programs', 'Harold Abelson, Gerald Jay Sussman', 'Programming Languages', 1996,
+         'A legendary introduction to computer science concepts', 3, 2),
+        ('9780131101630', 'Computer Networks', 'Andrew S. Tanenbaum, David J. Wetherall', 'Networking', 2011,
+         'Comprehensive textbook on computer networks', 5, 4),
+        ('9780132143011', 'Database System Concepts', 'Abraham Silberschatz, Henry Korth, S. Sudarshan', 'Database', 2010,
+         'Comprehensive introduction to database systems', 4, 3),
+        ('9780123748560', 'Computer Organization and Design', 'David A. Patterson, John L. Hennessy', 'Computer Architecture', 2014,
+         'Textbook on computer organization and design principles', 5, 4),
+        ('9781558606043', 'Modern Operating Systems', 'Andrew S. Tanenbaum', 'Operating Systems', 2001,
+         'Classic OS textbook by Tanenbaum', 4, 3),
+        ('9780596009205', 'Learning Python', 'Mark Lutz', 'Programming', 2013,
+         'Comprehensive guide to Python programming', 5, 4),
+        ('9781449331818', 'Fluent Python', 'Luciano Ramalho', 'Programming', 2015,
+         'Best practices for writing Pythonic code', 3, 2),
+        ('9781491903995', 'Python for Data Analysis', 'Wes McKinney', 'Data Science', 2017,
+         'Practical guide for analyzing data with Python and Pandas', 4, 3),
+        ('9781788622212', 'Mastering React', 'Adam Horton, Ryan Vice', 'Web Development', 2018,
+         'Advanced guide for mastering React.js', 3, 2),
+        ('9781492051367', 'Learning React', 'Alex Banks, Eve Porcello', 'Web Development', 2020,
+         'Beginner-friendly guide to learning React.js', 4, 3),
+        ('9781492052203', 'Kubernetes: Up and Running', 'Kelsey Hightower, Brendan Burns, Joe Beda', 'Cloud Computing', 2019,
+         'Guide to deploying and managing applications with Kubernetes', 3, 2),
+        ('9781491950357', 'Site Reliability Engineering', 'Niall Richard Murphy, Betsy Beyer', 'DevOps', 2016,
+         'Google’s guide to building reliable, scalable systems', 2, 1),
+        ('9781118026472', 'Cybersecurity and Cyberwar: What Everyone Needs to Know', 'P.W. Singer, Allan Friedman', 'Cybersecurity', 2014,
+         'Essential introduction to cybersecurity concepts', 3, 2),
+        ('9783319924263', 'Computer Vision: Algorithms and Applications', 'Richard Szeliski', 'Artificial Intelligence', 2022,
+         'Comprehensive book on modern computer vision techniques', 4, 3),
+        ('9781119706670', 'Hands-On Machine Learning with Scikit-Learn, Keras, and TensorFlow', 'Aurélien Géron', 'Machine Learning', 2019,
+         'Practical guide for machine learning and deep learning', 5, 4),
+        ('9780262039246', 'Algorithms to Live By', 'Brian Christian, Tom Griffiths', 'Computer Science', 2016,
+         'How computer science algorithms apply to everyday life', 3, 2),
+        ('9780133594140', 'Computer Security: Principles and Practice', 'William Stallings, Lawrie Brown', 'Cybersecurity', 2017,
+         'Comprehensive introduction to computer security concepts', 4, 3)
+    ]
+
+    
+    for book in sample_books:
+        c.execute('''
+            INSERT OR IGNORE INTO books 
+            (isbn, title, author, category, publication_year, description, copies, available)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', book)
+    
+    conn.commit()
+    conn.close()
+
+# Full-text search
+def search_terms(text):
+    """(tokens, is_prefix) per query term: quoted phrases match exactly, other words by prefix"""
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        if phrase:
+            tokens = re.findall(r'\w+', phrase)
+            if tokens:
+                terms.append((tokens, False))
+        else:
+            terms.extend(([token], True) for token in re.findall(r'\w+', word))
+    return terms
+
+def build_fts_query(text):
+    """Turn user input into an FTS5 MATCH expression.
+
+    Double-quoted segments become phrase queries; every other word becomes a
+    prefix term, so "clean arch" matches "Clean Architecture".
+    """
+    return ' '.join(
+        '"' + ' '.join(tokens) + '"' + ('*' if prefix else '') for tokens, prefix in search_terms(text)
+    )
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions), or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+def word_similarity(word, candidates, threshold):
+    """Best 1 - distance/length between word and any candidate word"""
+    best = 0.0
+    for candidate in candidates:
+        length = max(len(word), len(candidate))
+        limit = int((1 - max(threshold, best)) * length)
+        distance = edit_distance(word, candidate, limit)
+        if distance <= limit:
+            best = max(best, 1 - distance / length)
+    return best
+
+def fuzzy_search(conn, query, limit, threshold=FUZZY_THRESHOLD):
+    """Typo-tolerant title/author search.
+
+    Any book sharing a trigram with the query is a candidate; only the
+    FUZZY_CANDIDATES with the most overlap are scored by edit distance, so
+    the cost does not grow with the catalog.
+    """
+    words = [word for word in normalize_suggest_text(query).split() if len(word) >= 3]
+    if not words:
+        return []
+    trigrams = {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+
+    candidates = conn.execute('''
+        SELECT b.* FROM books_trigram
+        JOIN books b ON b.id = books_trigram.rowid
+        WHERE books_trigram MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (' OR '.join(f'"{trigram}"' for trigram in sorted(trigrams)), FUZZY_CANDIDATES)).fetchall()
+
+    results = []
+    for book in candidates:
+        book_words = normalize_suggest_text(f"{book['title']} {book['author']}").split()
+        score = sum(word_similarity(word, book_words, threshold) for word in words) / len(words)
+        if score >= threshold:
+            results.append({**book_to_dict(book), 'score': round(score, 4), 'fuzzy': True})
+    results.sort(key=lambda result: -result['score'])
+    return results[:limit]
+
+def search_branch(conn, query, limit, fuzzy='auto', threshold=FUZZY_THRESHOLD):
+    """Best matches for query in one shard, ordered best first.
+
+    fuzzy='auto' falls back to typo-tolerant matching only when the exact
+    search finds nothing; '1' always uses it and '0' never does.
+    """
+    if fuzzy == '1':
+        return fuzzy_search(conn, query, limit, threshold)
+    results = exact_search(conn, query, limit)
+    if not results and fuzzy == 'auto' and TRIGRAM_AVAILABLE:
+        results = fuzzy_search(conn, query, limit, threshold)
+    return results
+
+# books_fts columns, in SEARCH_WEIGHTS order
+SEARCH_COLUMNS = ('title', 'author', 'isbn', 'category', 'description')
+
+def term_match_score(result, terms):
+    """Weighted count of the columns that contain each query term.
+
+    Unlike bm25() it needs no collection statistics, so it puts results from
+    different shards on one scale. terms are search_terms() with normalized
+    tokens.
+    """
+    score = 0.0
+    for column, weight in zip(SEARCH_COLUMNS, SEARCH_WEIGHTS):
+        words = normalize_suggest_text(str(result.get(column) or '')).split()
+        for tokens, prefix in terms:
+            size = len(tokens)
+            for i in range(len(words) - size + 1):
+                window = words[i:i + size]
+                if window[:-1] == tokens[:-1] and (
+                    window[-1].startswith(tokens[-1]) if prefix else window[-1] == tokens[-1]
+                ):
+                    score += weight
+                    break
+    return score
+
+def search_all_branches(query, limit, fuzzy='auto', threshold=FUZZY_THRESHOLD):
+    """search_branch over every shard, merged into one ranking.
+
+    bm25() depends on each shard's own statistics, so exact hits are
+    re-ranked here by term_match_score, with each shard's bm25 scaled to
+    [0, 1] as the tie-breaker. fuzzy='auto' falls back to fuzzy matching only
+    when no shard has an exact hit; similarity scores compare as they are.
+    """
+    per_branch = {} if fuzzy == '1' else fan_out(exact_search, query, limit)
+    exact = any(per_branch.values())
+    if not exact:
+        if fuzzy == '0' or not TRIGRAM_AVAILABLE:
+            return []
+        per_branch = fan_out(fuzzy_search, query, limit, threshold)
+
+    terms = [([normalize_suggest_text(token) for token in tokens], prefix) for tokens, prefix in search_terms(query)]
+    results = []
+    for branch, branch_results in per_branch.items():
+        top = max((result.get('score', 0) for result in branch_results), default=0) or 1
+        for result in branch_results:
+            result['branch'] = branch
+            if exact and FTS5_AVAILABLE:
+                result['score'] = round(term_match_score(result, terms) + result['score'] / top, 4)
+        results.extend(branch_results)
+
+    if exact and not FTS5_AVAILABLE:
+        results.sort(key=lambda result: result['title'])
+    else:
+        results.sort(key=lambda result: -result['score'])
+    return results[:limit]
+
+def exact_search(conn, query, limit):
+    if FTS5_AVAILABLE:
+        match = build_fts_query(query)
+        if not match:
+            return []
+
+        # Ranked by BM25 with per-column weights; bm25() is lower-is-better
+        books = conn.execute(f'''
+            SELECT b.*,
+                   -bm25(books_fts, {', '.join(map(str, SEARCH_WEIGHTS))}) AS score,
+                   highlight(books_fts, 0, '<mark>', '</mark>') AS title_highlight,
+                   snippet(books_fts, -1, '<mark>', '</mark>', '…', 12) AS snippet
+            FROM books_fts
+            JOIN books b ON b.id = books_fts.rowid
+            WHERE books_fts MATCH ?
+            ORDER BY score DESC
+            LIMIT ?
+        ''', (match, limit)).fetchall()
+
+        results = []
+        for book in books:
+            result = book_to_dict(book)
+            result['score'] = round(book['score'], 4)
+            result['title_highlight'] = book['title_highlight']
+            result['snippet'] = book['snippet']
+            results.append(result)
+        return results
+
+    # Search in title, author, isbn, and category
+    search_pattern = f'%{query}%'
+    books = conn.execute('''
+        SELECT * FROM books 
+        WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ? OR category LIKE ?
+        ORDER BY title
+        LIMIT ?
+    ''', (search_pattern, search_pattern, search_pattern, search_pattern, limit)).fetchall()
+    return [book_to_dict(book) for book in books]
+
+# Database helper functions
+def get_db_connection():
+    return read_pool(current_branch()).acquire()
+
+@app.before_request
+def resolve_branch():
+    """Pin the request to ?branch= or the X-Library-Branch header, if given"""
+    branch = request.args.get('branch') or request.headers.get(BRANCH_HEADER)
+    if branch and branch not in db_pools:
+        return jsonify({'error': f'Unknown branch: {branch}'}), 404
+    g.branch = branch
+
+@app.after_request
+def vary_on_branch(response):
+    if SHARDED:
+        response.vary.add(BRANCH_HEADER)
+    return response
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    request_timing.active = True
+    request_timing.db = request_timing.qr = 0.0
+    request_timing.db_count = request_timing.qr_count = 0
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.pop('request_started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_latency.observe((request.method, route, str(response.status_code)), elapsed)
+    if not response.is_streamed:
+        response_size.observe((route,), response.calculate_content_length() or 0)
+
+    if SERVER_TIMING and getattr(request_timing, 'active', False):
+        timings = [f'db;dur={request_timing.db * 1000:.2f};desc="{request_timing.db_count} queries"']
+        if request_timing.qr_count:
+            timings.append(f'qr;dur={request_timing.qr * 1000:.2f}')
+        timings.append(f'app;dur={elapsed * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+    request_timing.active = False
+    return response
+
+@app.teardown_appcontext
+def release_db_connection(error):
+    # Handlers that bail out through an exception never reach conn.close()
+    for pool in db_pools.values():
+        pool.release(force=True)
+    for generation in g.pop('replicas', {}).values():
+        if generation is not None:
+            generation.pool.release(force=True)
+            generation.unpin()
+
+BOOK_FIELDS = (
+    'id', 'isbn', 'title', 'author', 'category', 'publication_year',
+    'description', 'copies', 'available', 'created_at'
+)
+
+class LibraryError(Exception):
+    """Business-rule failure raised inside a write transaction"""
+
+    def __init__(self, message, status=400, isbn=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.isbn = isbn
+
+    def to_response(self):
+        body = {'error': self.message}
+        if self.isbn is not None:
+            body['isbn'] = self.isbn
+        return jsonify(body), self.status
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def run_write_transaction(conn, fn, *args):
+    """Run fn(conn, *args) inside BEGIN IMMEDIATE and commit, retrying on SQLITE_BUSY.
+
+    Taking the write lock up front means the statements in fn never see a
+    snapshot that another writer invalidates half way through. LibraryError
+    and any other exception roll the transaction back and propagate.
+    """
+    for attempt in range(DB_WRITE_RETRIES + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            if not is_busy_error(e) or attempt == DB_WRITE_RETRIES:
+                raise
+        time.sleep(DB_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+def borrow_in_transaction(conn, isbn, borrower_name, borrower_email):
+    # The guard in the WHERE clause makes the availability check and the
+    # decrement one atomic step, so concurrent checkouts can never overbook
+    updated = conn.execute('''
+        UPDATE books SET available = available - 1 WHERE isbn = ? AND available > 0
+    ''', (isbn,)).rowcount
+    if not updated:
+        if conn.execute('SELECT 1 FROM books WHERE isbn = ?', (isbn,)).fetchone():
+            raise LibraryError('Book not available for borrowing', 400, isbn)
+        raise LibraryError('Book not found', 404, isbn)
+
+    return conn.execute('''
+        INSERT INTO borrow_history (isbn, borrower_name, borrower_email, status)
+        VALUES (?, ?, ?, 'borrowed')
+    ''', (isbn, borrower_name, borrower_email)).lastrowid
+
+def return_in_transaction(conn, isbn, borrower_name):
+    # Safe as two statements: BEGIN IMMEDIATE already holds the write lock
+    loan = conn.execute('''
+        SELECT id FROM borrow_history
+        WHERE isbn = ? AND borrower_name = ? AND status = 'borrowed'
+        ORDER BY borrow_date DESC LIMIT 1
+    ''', (isbn, borrower_name)).fetchone()
+
+    restocked = loan and conn.execute('''
+        UPDATE books SET available = available + 1 WHERE isbn = ?
+    ''', (isbn,)).rowcount
+
+    if not restocked:
+        if not conn.execute('SELECT 1 FROM books WHERE isbn = ?', (isbn,)).fetchone():
+            raise LibraryError('Book not found', 404, isbn)
+        raise LibraryError('No active borrow record found', 404, isbn)
+
+    conn.execute('''
+        UPDATE borrow_history
+        SET return_date = CURRENT_TIMESTAMP, status = 'returned'
+        WHERE id = ?
+    ''', (loan['id'],))
+    return loan['id']
+
+def add_in_transaction(conn, isbn, data):
+    if conn.execute('SELECT id FROM books WHERE isbn = ?', (isbn,)).fetchone():
+        raise LibraryError('Book with this ISBN already exists', 400, isbn)
+
+    copies = int(data.get('copies', 1))
+    conn.execute('''
+        INSERT INTO books (isbn, title, author, category, publication_year, 
+                         description, copies, available)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        isbn,
+        data['title'],
+        data['author'],
+        data.get('category'),
+        data.get('publication_year'),
+        data.get('description'),
+        copies,
+        copies
+    ))
+
+def apply_write_batch(conn, ops):
+    """Run each queued write in its own savepoint; a failing one rolls back alone"""
+    outcomes = []
+    for _, fn, args in ops:
+        conn.execute('SAVEPOINT group_write')
+        try:
+            outcomes.append((True, fn(conn, *args)))
+        except Exception as e:
+            if is_busy_error(e):
+                raise  # lets run_write_transaction retry the whole batch
+            conn.execute('ROLLBACK TO group_write')
+            outcomes.append((False, e))
+        conn.execute('RELEASE group_write')
+    return outcomes
+
+class WriteCoordinator:
+    """Group commit for one branch.
+
+    Request threads queue (fn, args) and wait on a future; a single writer
+    thread drains the queue in micro-batches of up to GROUP_COMMIT_MAX_BATCH,
+    waiting at most GROUP_COMMIT_MAX_WAIT for a batch to fill, and applies
+    each batch in one transaction, so a burst costs one fsync per batch
+    rather than per request. A full queue is refused with 503. The writer
+    claims each future before running its write, and a caller that gives up
+    after GROUP_COMMIT_TIMEOUT cancels it first, so a 503 always means the
+    write was never applied.
+    """
+
+    def __init__(self, branch):
+        self.branch = branch
+        # The writer's own connection, so it never queues behind the requests it serves
+        self._pool = ConnectionPool(BRANCH_DATABASES[branch], size=1)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(GROUP_COMMIT_QUEUE_SIZE)
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name=f'group-commit-{self.branch}', daemon=True).start()
+
+    def submit(self, fn, *args):
+        self._ensure_running()
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args))
+        except queue.Full:
+            raise LibraryError('Too many pending writes, retry shortly', 503)
+        return future
+
+    def _run(self):
+        with use_branch(self.branch):
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + GROUP_COMMIT_MAX_WAIT
+                while len(batch) < GROUP_COMMIT_MAX_BATCH:
+                    try:
+                        batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        break
+                try:
+                    self._apply(batch)
+                except Exception as e:
+                    # The writer must outlive any one batch, or every later submit() would hang
+                    app.logger.exception('Group commit failed for branch %s', self.branch)
+                    for future, _, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _apply(self, batch):
+        # Writes whose callers already gave up are cancelled; the rest can no longer be
+        live = [op for op in batch if op[0].set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        group_commit_batch_size.observe((), len(live))
+        try:
+            conn = self._pool.acquire()
+            try:
+                outcomes = run_write_transaction(conn, apply_write_batch, live)
+            finally:
+                conn.close()
+        except Exception as e:
+            outcomes = [(False, e)] * len(live)
+
+        for (future, _, _), (ok, value) in zip(live, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+write_coordinators = {branch: WriteCoordinator(branch) for branch in BRANCH_DATABASES}
+
+def run_write(fn, *args):
+    """Apply fn(conn, *args) as one write on the current branch.
+
+    With LIBRARY_GROUP_COMMIT=1 it is queued for the branch's writer thread
+    and shares a transaction with concurrent writes; otherwise it runs in its
+    own transaction on this thread. Either way LibraryError propagates.
+    """
+    if GROUP_COMMIT:
+        future = write_coordinators[current_branch()].submit(fn, *args)
+        try:
+            return future.result(timeout=GROUP_COMMIT_TIMEOUT)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise LibraryError('Write timed out in the queue', 503)
+        # The writer had already started it, so its outcome is final; wait for it
+        return future.result()
+    conn = get_db_connection()
+    try:
+        return run_write_transaction(conn, fn, *args)
+    finally:
+        conn.close()
+
+def recent_loans(conn, limit=RECENT_ACTIVITY_SIZE):
+    """Newest loans; a short walk down idx_borrow_history_borrow_date"""
+    rows = conn.execute('''
+        SELECT bh.*, b.title, b.author
+        FROM borrow_history bh
+        JOIN books b ON bh.isbn = b.isbn
+        ORDER BY bh.borrow_date DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+def branch_stats(conn):
+    # Totals are kept current by triggers, so this is a single-row read
+    stats = conn.execute('SELECT * FROM library_stats WHERE id = 1').fetchone()
+    
+    # Get categories
+    categories = conn.execute('''
+        SELECT category, count FROM category_stats ORDER BY count DESC
+    ''').fetchall()
+
+    # Read from the same connection as the totals, so a replica snapshot stays self-consistent
+    recent = recent_loans(conn)
+    
+    return {
+        'total_books': stats['total_books'],
+        'total_copies': stats['total_copies'],
+        'available_copies': stats['available_copies'],
+        'borrowed_books': stats['total_copies'] - stats['available_copies'],
+        'active_loans': stats['active_loans'],
+        'categories': [dict(cat) for cat in categories],
+        'recent_activity': recent
+    }
+
+STATS_TOTALS = ('total_books', 'total_copies', 'available_copies', 'borrowed_books', 'active_loans')
+
+def merge_branch_stats(per_branch):
+    """Sum shard stats into consortium totals, keeping a per-branch breakdown"""
+    merged = {key: sum(stats[key] for stats in per_branch.values()) for key in STATS_TOTALS}
+
+    categories = Counter()
+    for stats in per_branch.values():
+        for cat in stats['categories']:
+            categories[cat['category']] += cat['count']
+    merged['categories'] = [{'category': name, 'count': count} for name, count in categories.most_common()]
+
+    activity = [
+        {**item, 'branch': branch}
+        for branch, stats in per_branch.items() for item in stats['recent_activity']
+    ]
+    merged['recent_activity'] = heapq.nlargest(RECENT_ACTIVITY_SIZE, activity, key=lambda item: item['borrow_date'])
+    merged['branches'] = {
+        branch: {key: stats[key] for key in STATS_TOTALS} for branch, stats in per_branch.items()
+    }
+    return merged
+
+def checkout_in_transaction(conn, isbns, borrower_name, borrower_email):
+    """Borrow every ISBN in the basket, or none of them"""
+    return [borrow_in_transaction(conn, isbn, borrower_name, borrower_email) for isbn in isbns]
+
+def book_to_dict(book_row, fields=BOOK_FIELDS):
+    return {field: book_row[field] for field in fields}
+
+def parse_fields(value):
+    """Parse a fields= projection; returns None when a name is not a book column.
+
+    Fields come back in BOOK_FIELDS order whatever order the client listed
+    them in, so each subset builds one SQL string (and one statement label).
+    """
+    if not value:
+        return BOOK_FIELDS
+    requested = {f.strip() for f in value.split(',') if f.strip()}
+    if not requested or not requested <= set(BOOK_FIELDS):
+        return None
+    return tuple(f for f in BOOK_FIELDS if f in requested)
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(sort key, id) from a keyset cursor; ValueError when it was not one we issued"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not (isinstance(values, list) and len(values) == 2 and isinstance(values[0], str)
+            and type(values[1]) is int):
+        raise ValueError('Invalid cursor')
+    return values
+
+def stream_rows(sql, params, to_dict, fmt):
+    """Yield query results as a JSON array, NDJSON or CSV, one fetchmany() batch at a time.
+
+    The connection is checked out inside the generator because the request
+    context (and its connection) is gone by the time the server iterates it;
+    the branch and staleness bound are resolved now, while the request is
+    still available, and the generator pins its own replica generation.
+    """
+    max_staleness = g.get('max_staleness') if has_request_context() else None
+    return _stream_rows(current_branch(), max_staleness, sql, params, to_dict, fmt)
+
+def _stream_rows(branch, max_staleness, sql, params, to_dict, fmt):
+    generation = replica_sets[branch].pin(max_staleness) if max_staleness is not None else None
+    conn = (generation or db_pools[branch]).acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        if fmt == 'json':
+            yield '['
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            items = [to_dict(row) for row in rows]
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                if first:
+                    writer.writerow(items[0].keys())
+                writer.writerows(item.values() for item in items)
+                chunk = buffer.getvalue()
+            elif fmt == 'json':
+                chunk = ('' if first else ',') + ','.join(dumps_row(item) for item in items)
+            else:
+                chunk = ''.join(dumps_row(item) + '\n' for item in items)
+            first = False
+            yield chunk
+        if fmt == 'json':
+            yield ']'
+    finally:
+        conn.close()
+        if generation is not None:
+            generation.unpin()
+
+STREAM_MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Response encoding
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, several times faster on row-heavy payloads"""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the standard encoder still handles
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if JSON_BACKEND == 'auto' and orjson is not None:
+    app.json = OrjsonProvider(app)
+
+def dumps_row(item):
+    return app.json.dumps(item, default=str, sort_keys=False, separators=(',', ':'))
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+def to_columnar(value):
+    """Turn every list of row dicts in a payload into one array per field"""
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        fields = dict.fromkeys(key for item in value for key in item)
+        return {field: [item.get(field) for item in value] for field in fields}
+    if isinstance(value, dict):
+        return {key: to_columnar(item) for key, item in value.items()}
+    return value
+
+def negotiate_representation():
+    """Pick the payload shape from ?format=columnar and the media type from Accept"""
+    shape = 'columnar' if request.args.get('format') == 'columnar' else 'rows'
+    mimetype = 'application/json'
+    if msgpack is not None:
+        best = request.accept_mimetypes.best_match(['application/json', *MSGPACK_MIMETYPES])
+        if best in MSGPACK_MIMETYPES:
+            mimetype = best
+    return shape, mimetype
+
+def encode_payload(payload, shape, mimetype):
+    if shape == 'columnar':
+        payload = to_columnar(payload)
+    if mimetype in MSGPACK_MIMETYPES:
+        return msgpack.packb(payload, use_bin_type=True, default=str)
+    return app.json.dumps(payload, separators=(',', ':'))
+
+def payload_response(payload, representation=None):
+    """Serialize a JSON-style payload in the representation the client asked for"""
+    shape, mimetype = representation or negotiate_representation()
+    response = Response(encode_payload(payload, shape, mimetype), mimetype=mimetype)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
+
+def gzip_codec():
+    stream = zlib.compressobj(COMPRESS_LEVELS['gzip'], zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return stream.compress, lambda: stream.flush(zlib.Z_SYNC_FLUSH), stream.flush
+
+def brotli_codec():
+    stream = brotli.Compressor(quality=COMPRESS_LEVELS['br'])
+    return stream.process, stream.flush, stream.finish
+
+def zstd_codec():
+    stream = zstandard.ZstdCompressor(level=COMPRESS_LEVELS['zstd']).compressobj()
+    return stream.compress, lambda: stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), stream.flush
+
+# Each codec returns (compress, flush, finish) callables over one compression stream
+CODECS = {'gzip': gzip_codec}
+if brotli is not None:
+    CODECS['br'] = brotli_codec
+if zstandard is not None:
+    CODECS['zstd'] = zstd_codec
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain',
+    'image/svg+xml', *MSGPACK_MIMETYPES
+}
+
+def negotiate_encoding():
+    """Best Content-Encoding by client quality, ties broken by server preference"""
+    best, best_quality = None, 0
+    for encoding in COMPRESS_ENCODINGS:
+        if encoding in CODECS:
+            quality = request.accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+    return best
+
+def compress_stream(chunks, codec, source):
+    compress, flush, finish = codec()
+    try:
+        for chunk in chunks:
+            # Flush per chunk so streamed rows reach the client as they are produced
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(source, 'close'):
+            source.close()
+
+@app.after_request
+def compress_response(response):
+    """Compress text-like responses with the best encoding the client accepts.
+
+    Bodies under LIBRARY_COMPRESS_MIN_SIZE are sent as-is since the framing
+    overhead outweighs the saving; streamed bodies are compressed chunk by chunk.
+    """
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or request.method == 'HEAD'):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        source = response.response
+        response.response = compress_stream(response.iter_encoded(), CODECS[encoding], source)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        compress, _, finish = CODECS[encoding]()
+        response.set_data(compress(body) + finish())
+
+    response.headers['Content-Encoding'] = encoding
+    # The encoded bytes differ from the identity ones, so only a weak validator still holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Read cache
+class MemoryCache:
+    """In-process cache with a per-entry TTL and LRU eviction"""
+
+    name = 'memory'
+
+    def __init__(self, maxsize=CACHE_MAX_ITEMS, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def size(self):
+        return len(self._data)
+
+class RedisCache:
+    """Shared cache on any Redis-protocol server; values are stored as JSON, bytes as-is"""
+
+    name = 'redis'
+
+    def __init__(self, url=CACHE_REDIS_URL, ttl=CACHE_TTL):
+        import redis  # optional dependency, only needed for this backend
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        if raw is None:
+            return None
+        # A leading NUL never starts a JSON document, so it marks raw bytes values
+        return raw[1:] if raw[:1] == b'\0' else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        raw = b'\0' + value if isinstance(value, bytes) else json.dumps(value)
+        self._client.set(key, raw, ex=ttl or self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*keys)
+
+    def size(self):
+        return self._client.dbsize()
+
+class NullCache:
+    name = 'none'
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def size(self):
+        return 0
+
+CACHE_BACKENDS = {'memory': MemoryCache, 'redis': RedisCache, 'none': NullCache}
+
+class ReadCache:
+    """Namespaced read-through cache with hit/miss counters per namespace"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    def _key(self, namespace, key):
+        # Shards share a cache backend, and ISBNs and catalog versions repeat across them
+        return f'{CACHE_KEY_PREFIX}{current_branch()}:{namespace}:{key}'
+
+    def get(self, namespace, key):
+        try:
+            value = self.backend.get(self._key(namespace, key))
+        except Exception:
+            # A cache outage must degrade to database reads, not errors
+            value = None
+        with self._lock:
+            (self.hits if value is not None else self.misses)[namespace] += 1
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        try:
+            self.backend.set(self._key(namespace, key), value, ttl)
+        except Exception:
+            pass
+
+    def invalidate(self, namespace, *keys):
+        try:
+            self.backend.delete(*(self._key(namespace, key) for key in keys))
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            namespaces = {
+                namespace: {
+                    'hits': self.hits[namespace],
+                    'misses': self.misses[namespace],
+                    'hit_ratio': round(self.hits[namespace] / total, 4) if total else None
+                }
+                for namespace in sorted(set(self.hits) | set(self.misses))
+                for total in [self.hits[namespace] + self.misses[namespace]]
+            }
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = None
+        return {'backend': self.backend.name, 'size': size, 'namespaces': namespaces}
+
+read_cache = ReadCache(CACHE_BACKENDS[CACHE_BACKEND]())
+
+def get_catalog_version(conn):
+    return conn.execute('SELECT catalog_version FROM library_stats WHERE id = 1').fetchone()[0]
+
+def get_cached_book(isbn):
+    """Book dict by ISBN through the read cache; None when there is no such book"""
+    book = read_cache.get('book', isbn)
+    if book is None:
+        conn = get_db_connection()
+        row = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        book = book_to_dict(row)
+        read_cache.set('book', isbn, book)
+    return book
+
+# Borrow history queries
+HISTORY_GROUPS = {
+    'day': ('date(bh.borrow_date)', 'day'),
+    'month': ("strftime('%Y-%m', bh.borrow_date)", 'month'),
+    'category': ('b.category', 'category'),
+}
+
+def parse_timestamp(value):
+    """Normalize an ISO date or datetime to borrow_date's storage format"""
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def history_filters(args):
+    """WHERE clauses and parameters for the borrow_history filter parameters.
+
+    from is inclusive and to is exclusive; both take ISO dates or datetimes.
+    Raises ValueError for malformed values.
+    """
+    clauses, params = [], []
+    for arg, column in (('isbn', 'bh.isbn'), ('borrower', 'bh.borrower_name'), ('status', 'bh.status')):
+        value = args.get(arg)
+        if value:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+
+    if args.get('from'):
+        clauses.append('bh.borrow_date >= ?')
+        params.append(parse_timestamp(args['from']))
+    if args.get('to'):
+        clauses.append('bh.borrow_date < ?')
+        params.append(parse_timestamp(args['to']))
+    return clauses, params
+
+def archive_returned_loans(conn, days, output=None):
+    """Move returned loans older than days out of borrow_history.
+
+    Rows go to borrow_history_archive, or are appended as NDJSON to the open
+    file output. Work happens in short batches so checkouts never wait long
+    for the write lock. Returns the number of archived loans.
+    """
+    cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{int(days)} days',)).fetchone()[0]
+    archived = 0
+    while True:
+        def archive_batch(conn):
+            # return_date >= borrow_date, so the borrow_date bound keeps the
+            # scan inside the (status, borrow_date) index range
+            rows = conn.execute('''
+                SELECT * FROM borrow_history
+                WHERE status = 'returned' AND borrow_date < ? AND return_date < ?
+                ORDER BY borrow_date
+                LIMIT ?
+            ''', (cutoff, cutoff, ARCHIVE_BATCH_SIZE)).fetchall()
+            if not rows:
+                return 0
+
+            ids = [row['id'] for row in rows]
+            placeholders = ', '.join('?' * len(ids))
+            if output is None:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO borrow_history_archive
+                        (id, isbn, borrower_name, borrower_email, borrow_date, return_date, status)
+                    SELECT id, isbn, borrower_name, borrower_email, borrow_date, return_date, status
+                    FROM borrow_history WHERE id IN ({placeholders})
+                ''', ids)
+            else:
+                output.writelines(json.dumps(dict(row)) + '\n' for row in rows)
+            conn.execute(f'DELETE FROM borrow_history WHERE id IN ({placeholders})', ids)
+            return len(rows)
+
+        count = run_write_transaction(conn, archive_batch)
+        if output is not None:
+            output.flush()
+        archived += count
+        if count < ARCHIVE_BATCH_SIZE:
+            return archived
+
+# Change feed
+CHANGES_SQL = 'SELECT seq, op, isbn, book, changed_at FROM book_changes'
+
+def change_to_dict(row):
+    return {
+        'seq': row['seq'],
+        'op': row['op'],
+        'isbn': row['isbn'],
+        'book': json.loads(row['book']) if row['book'] else None,
+        'changed_at': row['changed_at']
+    }
+
+def latest_change_seq(conn):
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM book_changes').fetchone()[0]
+
+def read_changes(conn, since, limit):
+    """Changes after since in order, or None when pruning has dropped some of them"""
+    rows = conn.execute(CHANGES_SQL + ' WHERE seq > ? ORDER BY seq LIMIT ?', (since, limit)).fetchall()
+    # AUTOINCREMENT never leaves holes, so a jump past since + 1 means pruned entries
+    if rows and rows[0]['seq'] > since + 1:
+        return None
+    return [change_to_dict(row) for row in rows]
+
+def parse_change_since(args, headers):
+    """Resume point from ?since= or an EventSource's Last-Event-ID; None means from now"""
+    value = args.get('since') or headers.get('Last-Event-ID')
+    if value is None or value == '':
+        return None
+    since = int(value)
+    if since < 0:
+        raise ValueError('since must not be negative')
+    return since
+
+def sse_event(change):
+    return f"id: {change['seq']}\nevent: change\ndata: {dumps_row(change)}\n\n"
+
+SSE_RESYNC = 'event: resync\ndata: {}\n\n'
+SSE_KEEPALIVE = ': keepalive\n\n'
+
+class ChangeFeed:
+    """Pushes new book_changes rows of one branch to stream subscribers.
+
+    A poller thread reads the log every LIBRARY_CHANGES_POLL_INTERVAL seconds,
+    so changes written by other worker processes are seen too, and is woken
+    early by this process's own writes. The newest changes stay in memory, so
+    subscribers that keep up never touch the database.
+    """
+
+    def __init__(self, branch):
+        self.branch = branch
+        self.last_seq = 0
+        self._events = deque(maxlen=CHANGES_BUFFER)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._listeners = set()
+        self._pid = None
+
+    def _ensure_running(self):
+        with self._cond:
+            # Threads do not survive a fork, so a new worker starts its own poller
+            if self._pid == os.getpid():
+                return
+            conn = db_pools[self.branch].acquire()
+            try:
+                self.last_seq = latest_change_seq(conn)
+            finally:
+                conn.close()
+            self._events.clear()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name=f'change-feed-{self.branch}', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(CHANGES_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self._poll()
+            except Exception:
+                app.logger.exception('Change feed poll failed for branch %s', self.branch)
+
+    def _poll(self):
+        conn = db_pools[self.branch].acquire()
+        try:
+            rows = conn.execute(
+                CHANGES_SQL + ' WHERE seq > ? ORDER BY seq LIMIT ?', (self.last_seq, CHANGES_BUFFER)
+            ).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+
+        with self._cond:
+            self._events.extend(change_to_dict(row) for row in rows)
+            self.last_seq = rows[-1]['seq']
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+        if len(rows) == CHANGES_BUFFER:
+            self._wake.set()  # there is more to read
+
+    def notify(self):
+        if self._pid == os.getpid():
+            self._wake.set()
+
+    def current_seq(self):
+        self._ensure_running()
+        return self.last_seq
+
+    def changes_after(self, seq):
+        """Changes after seq from memory, or from the log once the buffer no
+        longer reaches back that far; None when they have been pruned."""
+        self._ensure_running()
+        with self._cond:
+            if seq >= self.last_seq:
+                return []
+            if self._events and self._events[0]['seq'] <= seq + 1:
+                return [change for change in self._events if change['seq'] > seq]
+        conn = db_pools[self.branch].acquire()
+        try:
+            return read_changes(conn, seq, CHANGES_MAX_LIMIT)
+        finally:
+            conn.close()
+
+    def wait(self, seq, timeout):
+        """Block until there are changes after seq or timeout passes"""
+        self._ensure_running()
+        with self._cond:
+            self._cond.wait_for(lambda: self.last_seq > seq, timeout)
+        return self.changes_after(seq)
+
+    def subscribe(self, listener):
+        """Call listener() from the poller thread whenever new changes arrive"""
+        self._ensure_running()
+        with self._cond:
+            self._listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        with self._cond:
+            self._listeners.discard(listener)
+
+change_feeds = {branch: ChangeFeed(branch) for branch in BRANCH_DATABASES}
+
+def stream_changes(feed, since):
+    """Server-sent events for every change after since, with keepalive comments"""
+    yield 'retry: 3000\n\n'
+    while True:
+        changes = feed.wait(since, SSE_HEARTBEAT)
+        if changes is None:
+            yield SSE_RESYNC
+            return
+        if not changes:
+            yield SSE_KEEPALIVE
+            continue
+        yield ''.join(sse_event(change) for change in changes)
+        since = changes[-1]['seq']
+
+@app.after_request
+def notify_change_feed(response):
+    # Wake this process's poller so subscribers see our own writes immediately
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        change_feeds[current_branch()].notify()
+    return response
+
+# Read replicas
+# The heavy read routes can be served from a snapshot of the branch database
+# taken with the online backup API, so long scans never compete with checkouts
+# for the primary. Each refresh builds a new generation beside the current one
+# and swaps it in; the old one is dropped once its last reader lets go.
+REPLICA_MODES = ('off', 'memory', 'file')
+if REPLICA_MODE not in REPLICA_MODES:
+    raise ValueError(f'LIBRARY_REPLICA_MODE must be one of: {", ".join(REPLICA_MODES)}')
+REPLICA_ENDPOINTS = {'get_all_books', 'search_books', 'get_borrow_history', 'get_library_stats'}
+
+def connect_replica(uri):
+    """Open a read-only connection to a snapshot"""
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = 1')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class ReplicaGeneration:
+    """One snapshot of a branch database and the pool that reads it.
+
+    Requests pin the generation they read from; a retired generation closes
+    its connections and deletes its file when the last pin is dropped.
+    """
+
+    def __init__(self, branch, number):
+        self.branch = branch
+        self.number = number
+        if REPLICA_MODE == 'memory':
+            self.path = None
+            self.uri = f'file:library-{branch}-{os.getpid()}-{number}?mode=memory&cache=shared'
+        else:
+            self.path = os.path.join(REPLICA_DIR, f'{branch}.replica-{os.getpid()}-{number}.db')
+            # Nothing writes the file once it is built, so readers skip locking entirely
+            self.uri = f'file:{quote(os.path.abspath(self.path))}?mode=ro&immutable=1'
+        self.pool = ConnectionPool(self.uri, connect=connect_replica)
+        self.taken = None
+        self.seq = 0
+        self._anchor = None
+        self._pins = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Copy the primary database into this generation"""
+        source = connect_db(BRANCH_DATABASES[self.branch])
+        target = None
+        try:
+            if self.path is None:
+                target = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            else:
+                target = sqlite3.connect(self.path)
+            taken = time.time()
+            # One step copies every page under a single read transaction, so the
+            # snapshot is consistent; in WAL mode writers carry on meanwhile
+            source.backup(target)
+            self.seq = latest_change_seq(target)
+            if self.path is not None:
+                # Immutable readers cannot use the -wal and -shm files of a WAL database
+                target.execute('PRAGMA journal_mode = DELETE')
+            self.taken = taken
+        except Exception:
+            self._dispose(target)
+            raise
+        finally:
+            source.close()
+
+        if self.path is None:
+            # A shared-cache memory database lives only while a connection is open
+            self._anchor = target
+        else:
+            target.close()
+
+    def age(self):
+        return time.time() - self.taken
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def pin(self):
+        with self._lock:
+            self._pins += 1
+
+    def unpin(self):
+        with self._lock:
+            self._pins -= 1
+            disposable = self._retired and self._pins == 0
+        if disposable:
+            self._dispose(self._anchor)
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            disposable = self._pins == 0
+        if disposable:
+            self._dispose(self._anchor)
+
+    def _dispose(self, anchor):
+        self.pool.close_all()
+        if anchor is not None:
+            anchor.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+class ReplicaSet:
+    """Snapshot generations of one branch, refreshed in the background.
+
+    A refresher thread takes a new snapshot every LIBRARY_REPLICA_REFRESH
+    seconds, or sooner once LIBRARY_REPLICA_REFRESH_WRITES writes have gone
+    through this process.
+    """
+
+    def __init__(self, branch):
+        self.branch = branch
+        self.writes = 0
+        self.refreshes = 0
+        self._current = None
+        self._number = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads do not survive a fork, and the parent's snapshots are the parent's to delete
+            self._current = None
+            self.writes = 0
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name=f'replica-{self.branch}', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                app.logger.exception('Refreshing the read replica failed for branch %s', self.branch)
+            self._wake.wait(REPLICA_REFRESH)
+            self._wake.clear()
+
+    def refresh(self):
+        """Take a new snapshot and swap it in for the current one"""
+        with self._lock:
+            self._number += 1
+            generation = ReplicaGeneration(self.branch, self._number)
+            self.writes = 0
+        generation.build()
+        with self._lock:
+            previous, self._current = self._current, generation
+            self.refreshes += 1
+        if previous is not None:
+            previous.retire()
+
+    def pin(self, max_staleness):
+        """Current generation pinned for the caller, or None when there is none
+        yet or it is older than max_staleness seconds"""
+        self._ensure_running()
+        with self._lock:
+            generation = self._current
+            if generation is None or generation.age() > max_staleness:
+                return None
+            generation.pin()
+            return generation
+
+    def record_write(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self.writes += 1
+            if self.writes >= REPLICA_REFRESH_WRITES:
+                self._wake.set()
+
+    def status(self, conn):
+        """Lag of the current snapshot behind the primary that conn reads"""
+        generation = self._current
+        if generation is None:
+            return {'generation': None, 'refreshes': self.refreshes}
+        return {
+            'generation': generation.number,
+            'snapshot_at': datetime.fromtimestamp(generation.taken).isoformat(timespec='seconds'),
+            'lag_seconds': round(generation.age(), 3),
+            'lag_changes': max(latest_change_seq(conn) - generation.seq, 0),
+            'writes_since_snapshot': self.writes,
+            'refreshes': self.refreshes
+        }
+
+    def close(self):
+        with self._lock:
+            generation, self._current = self._current, None
+        if generation is not None and self._pid == os.getpid():
+            generation.retire()
+
+replica_sets = {branch: ReplicaSet(branch) for branch in BRANCH_DATABASES}
+
+def close_replicas():
+    for replicas in replica_sets.values():
+        replicas.close()
+
+if REPLICA_MODE == 'file':
+    atexit.register(close_replicas)
+
+def read_pool(branch):
+    """Pool that serves this request's reads of branch: a pinned replica
+    generation on replica routes, the primary otherwise"""
+    if not has_request_context() or g.get('max_staleness') is None:
+        return db_pools[branch]
+    if branch not in g.replicas:
+        g.replicas[branch] = replica_sets[branch].pin(g.max_staleness)
+    return g.replicas[branch] or db_pools[branch]
+
+def replica_status(conn):
+    return replica_sets[current_branch()].status(conn)
+
+@app.before_request
+def route_reads_to_replica():
+    """Send the heavy read routes to a snapshot within the staleness bound.
+
+    ?max_staleness= or the X-Library-Max-Staleness header can tighten
+    LIBRARY_REPLICA_MAX_STALENESS for one request; 0 reads the primary.
+    """
+    if REPLICA_MODE == 'off' or request.method != 'GET' or request.endpoint not in REPLICA_ENDPOINTS:
+        return
+    max_staleness = REPLICA_MAX_STALENESS
+    requested = request.args.get('max_staleness') or request.headers.get(REPLICA_STALENESS_HEADER)
+    if requested is not None:
+        try:
+            requested = float(requested)
+        except ValueError:
+            requested = -1
+        if requested < 0:
+            return jsonify({'error': 'max_staleness must be a non-negative number of seconds'}), 400
+        max_staleness = min(max_staleness, requested)
+    g.max_staleness = max_staleness
+    g.replicas = {}
+
+@app.after_request
+def count_replica_writes(response):
+    if REPLICA_MODE != 'off' and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        replica_sets[current_branch()].record_write()
+    return response
+
+# Typeahead suggestions
+def normalize_suggest_text(text):
+    """Casefold and strip accents and punctuation, so "Géron," is indexed as "geron"."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.casefold()).split())
+
+def suggest_terms(isbn, title, author):
+    """(key, field) pairs indexed for a book: ISBN, plus every word suffix of
+    the title and of each author, so "algo" finds "Introduction to Algorithms"."""
+    terms = {(isbn, 'isbn')}
+    names = [(title, 'title')] + [(name, 'author') for name in (author or '').split(',')]
+    for text, field in names:
+        words = normalize_suggest_text(text).split()[:SUGGEST_MAX_WORDS]
+        terms.update((' '.join(words[i:])[:SUGGEST_KEY_LENGTH], field) for i in range(len(words)))
+    return terms
+
+class SuggestIndex:
+    """Sorted array of (prefix key, isbn, field) entries searched with bisect.
+
+    Built from books on first use. The single-book write routes update it
+    straight away, and every lookup first applies the book_changes entries it
+    has not seen yet, so writes made through other workers or bulk imports
+    show up as well. Borrow counts used for ranking
+    are read once from borrow_history and its archive, then advanced by the
+    loans with a higher id on each lookup.
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._books = {}
+        self._change_seq = 0
+        self._popularity = Counter()
+        self._loan_id = None
+        self._lock = threading.RLock()
+
+    def _build(self, conn):
+        # Read the change position first; replaying changes the build already saw is harmless
+        self._change_seq = latest_change_seq(conn)
+        books = {row['isbn']: (row['title'], row['author'])
+                 for row in conn.execute('SELECT isbn, title, author FROM books')}
+        entries = sorted(
+            (key, isbn, field)
+            for isbn, (title, author) in books.items()
+            for key, field in suggest_terms(isbn, title, author)
+        )
+        self._books, self._entries = books, entries
+
+    def _catch_up(self, conn):
+        while True:
+            changes = read_changes(conn, self._change_seq, CHANGES_MAX_LIMIT)
+            if changes is None:
+                # The log was pruned past our position
+                self._build(conn)
+                return
+            if not changes:
+                return
+            for change in changes:
+                book = change['book']
+                if book is None:
+                    self._remove(change['isbn'])
+                elif self._books.get(change['isbn']) != (book['title'], book['author']):
+                    self.add(change['isbn'], book['title'], book['author'])
+            self._change_seq = changes[-1]['seq']
+
+    def _update_popularity(self, conn):
+        if self._loan_id is None:
+            self._loan_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM borrow_history').fetchone()[0]
+            self._popularity = Counter(dict(conn.execute('''
+                SELECT isbn, COUNT(*) FROM (
+                    SELECT isbn FROM borrow_history WHERE id <= ?
+                    UNION ALL
+                    SELECT isbn FROM borrow_history_archive
+                ) GROUP BY isbn
+            ''', (self._loan_id,)).fetchall()))
+            return
+        # Archiving only moves loans that were already counted, so new ids are all there is to add
+        loans = conn.execute(
+            'SELECT id, isbn FROM borrow_history WHERE id > ? ORDER BY id', (self._loan_id,)
+        ).fetchall()
+        if loans:
+            self._popularity.update(row['isbn'] for row in loans)
+            self._loan_id = loans[-1]['id']
+
+    def suggest(self, conn, query, limit=SUGGEST_DEFAULT_LIMIT):
+        if re.fullmatch(r'[\d\s-]+', query):
+            prefix = re.sub(r'\D', '', query)  # ISBNs are typed with and without hyphens
+        else:
+            prefix = normalize_suggest_text(query)
+        if not prefix:
+            return []
+
+        with self._lock:
+            if self._entries is None:
+                self._build(conn)
+            else:
+                self._catch_up(conn)
+            self._update_popularity(conn)
+
+            matches = {}
+            entries = self._entries
+            start = bisect_left(entries, (prefix,))
+            for i in range(start, min(start + SUGGEST_SCAN_LIMIT, len(entries))):
+                key, isbn, field = entries[i]
+                if not key.startswith(prefix):
+                    break
+                matches.setdefault(isbn, field)
+
+            ranked = heapq.nlargest(limit, matches, key=lambda isbn: self._popularity[isbn])
+            return [
+                {
+                    'isbn': isbn,
+                    'title': self._books[isbn][0],
+                    'author': self._books[isbn][1],
+                    'matched': matches[isbn],
+                    'popularity': self._popularity[isbn]
+                }
+                for isbn in ranked
+            ]
+
+    def add(self, isbn, title, author):
+        with self._lock:
+            if self._entries is None:
+                return
+            self._remove(isbn)
+            self._books[isbn] = (title, author)
+            for key, field in suggest_terms(isbn, title, author):
+                insort(self._entries, (key, isbn, field))
+
+    def remove(self, isbn):
+        with self._lock:
+            if self._entries is not None:
+                self._remove(isbn)
+
+    def _remove(self, isbn):
+        book = self._books.pop(isbn, None)
+        if book is None:
+            return
+        for key, field in suggest_terms(isbn, *book):
+            i = bisect_left(self._entries, (key, isbn, field))
+            if i < len(self._entries) and self._entries[i] == (key, isbn, field):
+                del self._entries[i]
+
+suggest_indexes = {branch: SuggestIndex() for branch in BRANCH_DATABASES}
+
+# Recommendations
+# Readers are identified by email when given, by name otherwise
+READER_EXPRESSION = "lower(COALESCE(NULLIF(borrower_email, ''), borrower_name))"
+
+def reader_key(borrower_name, borrower_email):
+    return (borrower_email or borrower_name).lower()
+
+def cooccurrence_sparse(pairs):
+    """Item-item co-borrow counts as X.T @ X over a binary reader x book matrix"""
+    readers = {reader: i for i, reader in enumerate(dict.fromkeys(reader for reader, _ in pairs))}
+    isbns = list(dict.fromkeys(isbn for _, isbn in pairs))
+    columns = {isbn: j for j, isbn in enumerate(isbns)}
+
+    matrix = scipy.sparse.csr_matrix(
+        (
+            numpy.ones(len(pairs), dtype=numpy.int32),
+            (
+                numpy.fromiter((readers[reader] for reader, _ in pairs), dtype=numpy.int64, count=len(pairs)),
+                numpy.fromiter((columns[isbn] for _, isbn in pairs), dtype=numpy.int64, count=len(pairs))
+            )
+        ),
+        shape=(len(readers), len(isbns))
+    )
+    counts = numpy.asarray(matrix.sum(axis=0)).ravel()
+    cooccurrence = (matrix.T @ matrix).tocsr()
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+
+    rows = {}
+    for j, isbn in enumerate(isbns):
+        start, end = cooccurrence.indptr[j], cooccurrence.indptr[j + 1]
+        if end > start:
+            rows[isbn] = Counter(dict(zip(
+                (isbns[k] for k in cooccurrence.indices[start:end]),
+                cooccurrence.data[start:end].tolist()
+            )))
+    return rows, Counter(dict(zip(isbns, counts.tolist())))
+
+def cooccurrence_python(pairs):
+    """Pure-Python equivalent of cooccurrence_sparse for installs without scipy"""
+    items_by_reader = {}
+    for reader, isbn in pairs:
+        items_by_reader.setdefault(reader, set()).add(isbn)
+
+    rows = {}
+    counts = Counter()
+    for items in items_by_reader.values():
+        counts.update(items)
+        for isbn in items:
+            row = rows.setdefault(isbn, Counter())
+            row.update(items)
+            row[isbn] -= 1
+    for row in rows.values():
+        row += Counter()  # drops the zeroed diagonal
+    return {isbn: row for isbn, row in rows.items() if row}, counts
+
+class Recommender:
+    """"Also borrowed" neighbours from an item-item co-occurrence matrix.
+
+    The matrix is built from borrow_history and its archive (with scipy when
+    installed), then kept current by the borrow paths of this process; a full
+    rebuild runs in the background every LIBRARY_RECOMMEND_REFRESH seconds to
+    pick up loans made by other workers. Neighbours are ranked by cosine
+    similarity and memoised per book until its row changes.
+    """
+
+    def __init__(self, branch):
+        self.branch = branch
+        self._rows = None
+        self._counts = Counter()
+        self._readers = {}
+        self._top = {}
+        self._built = 0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        conn = db_pools[self.branch].acquire()
+        try:
+            pairs = conn.execute(f'''
+                SELECT DISTINCT {READER_EXPRESSION} AS reader, isbn FROM borrow_history
+                UNION
+                SELECT {READER_EXPRESSION}, isbn FROM borrow_history_archive
+            ''').fetchall()
+        finally:
+            conn.close()
+
+        pairs = [(reader, isbn) for reader, isbn in pairs]
+        rows, counts = (cooccurrence_sparse if scipy is not None else cooccurrence_python)(pairs)
+        readers = {}
+        for reader, isbn in pairs:
+            readers.setdefault(reader, set()).add(isbn)
+
+        with self._lock:
+            self._rows, self._counts, self._readers = rows, counts, readers
+            self._top = {}
+            self._built = time.monotonic()
+            self._rebuilding = False
+
+    def _rebuild_in_background(self):
+        try:
+            self._load()
+        except Exception:
+            app.logger.exception('Rebuilding recommendations failed for branch %s', self.branch)
+            with self._lock:
+                self._rebuilding = False
+
+    def _ensure_fresh(self):
+        if self._rows is None:
+            # Concurrent first requests wait for one build instead of each running their own
+            with self._load_lock:
+                if self._rows is None:
+                    self._load()
+            return
+        with self._lock:
+            if self._rebuilding or time.monotonic() - self._built < RECOMMEND_REFRESH:
+                return
+            self._rebuilding = True
+        # Keep serving the current matrix while the new one is built
+        threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def neighbours(self, isbn, limit):
+        """[(isbn, score)] of the books most often borrowed by readers of isbn"""
+        self._ensure_fresh()
+        with self._lock:
+            top = self._top.get(isbn)
+            if top is None:
+                row = self._rows.get(isbn, {})
+                count = self._counts[isbn]
+                scored = ((other, together / (count * self._counts[other]) ** 0.5) for other, together in row.items())
+                top = heapq.nlargest(RECOMMEND_MAX_LIMIT, scored, key=lambda item: (item[1], row[item[0]]))
+                self._top[isbn] = top
+            return top[:limit]
+
+    def borrow_count(self, isbn):
+        return self._counts[isbn]
+
+    def record_loans(self, borrower_name, borrower_email, isbns):
+        with self._lock:
+            if self._rows is None:
+                return
+            items = self._readers.setdefault(reader_key(borrower_name, borrower_email), set())
+            for isbn in isbns:
+                if isbn in items:
+                    continue
+                self._counts[isbn] += 1
+                row = self._rows.setdefault(isbn, Counter())
+                for other in items:
+                    row[other] += 1
+                    self._rows.setdefault(other, Counter())[isbn] += 1
+                    self._top.pop(other, None)
+                self._top.pop(isbn, None)
+                items.add(isbn)
+
+recommenders = {branch: Recommender(branch) for branch in BRANCH_DATABASES}
+
+def similar_books(conn, book, exclude, limit):
+    """Cold-start fallback: same author first, then same category, most borrowed first"""
+    rows = conn.execute('''
+        SELECT isbn, author = ? AS same_author FROM books
+        WHERE (author = ? OR category = ?) AND isbn != ?
+        ORDER BY same_author DESC, title
+        LIMIT ?
+    ''', (book['author'], book['author'], book['category'], book['isbn'], 5 * limit)).fetchall()
+    recommender = recommenders[current_branch()]
+    candidates = [row for row in rows if row['isbn'] not in exclude]
+    candidates.sort(key=lambda row: (-row['same_author'], -recommender.borrow_count(row['isbn'])))
+    return [(row['isbn'], 'same author' if row['same_author'] else 'same category') for row in candidates[:limit]]
+
+# Batch operations
+BOOK_UPDATE_FIELDS = ('title', 'author', 'category', 'publication_year', 'description', 'copies', 'available')
+
+def fetch_books(conn, isbns, columns='*'):
+    """Rows for isbns keyed by ISBN, with one IN query per SQL_IN_CHUNK_SIZE ISBNs"""
+    found = {}
+    for chunk in chunked(list(isbns)):
+        found.update((row['isbn'], row) for row in conn.execute(
+            f'SELECT {columns} FROM books WHERE isbn IN ({", ".join("?" * len(chunk))})', chunk
+        ))
+    return found
+
+def batch_update_in_transaction(conn, updates):
+    """Apply update_book-style partial updates; returns one status per update"""
+    books = {isbn: dict(row) for isbn, row in fetch_books(conn, dict.fromkeys(u['isbn'] for u in updates)).items()}
+    results, rows = [], []
+    for update in updates:
+        book = books.get(update['isbn'])
+        if book is None:
+            results.append({'isbn': update['isbn'], 'status': 404, 'error': 'Book not found'})
+            continue
+        # Later updates to the same ISBN build on earlier ones in the batch
+        book.update((field, update[field]) for field in BOOK_UPDATE_FIELDS if field in update)
+        rows.append(tuple(book[field] for field in BOOK_UPDATE_FIELDS) + (update['isbn'],))
+        results.append({'isbn': update['isbn'], 'status': 200})
+
+    conn.executemany(f'''
+        UPDATE books SET {', '.join(f'{field} = ?' for field in BOOK_UPDATE_FIELDS)}
+        WHERE isbn = ?
+    ''', rows)
+    return results, books
+
+def batch_delete_in_transaction(conn, isbns):
+    existing = list(fetch_books(conn, isbns, 'isbn'))
+    for chunk in chunked(existing):
+        conn.execute(f'DELETE FROM books WHERE isbn IN ({", ".join("?" * len(chunk))})', chunk)
+    return set(existing)
+
+def batch_response(results):
+    """Per-item results with 207 Multi-Status when any item failed"""
+    failed = sum(result['status'] >= 400 for result in results)
+    return jsonify({
+        'results': results,
+        'succeeded': len(results) - failed,
+        'failed': failed
+    }), 207 if failed else 200
+
+def batch_items(data, key):
+    """The list under key in a batch request body, or an error message"""
+    items = data.get(key)
+    if not isinstance(items, list) or not items:
+        return None, f'{key} must be a non-empty list'
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, f'At most {BATCH_MAX_ITEMS} items per batch'
+    return items, None
+
+# Bulk import
+IMPORT_UPSERT_SQL = '''
+    INSERT INTO books (isbn, title, author, category, publication_year,
+                       description, copies, available)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (isbn) DO UPDATE SET
+        title = excluded.title,
+        author = excluded.author,
+        category = excluded.category,
+        publication_year = excluded.publication_year,
+        description = excluded.description,
+        copies = excluded.copies,
+        -- keep copies that are out on loan subtracted from the new total
+        available = MAX(excluded.copies - (books.copies - books.available), 0)
+'''
+
+def normalize_isbn(value):
+    isbn = str(value).replace('-', '').replace(' ', '')
+    return isbn if isbn.isdigit() and len(isbn) == 13 else None
+
+def validate_book(data):
+    """Apply add_book's rules to a record; returns (isbn, error)"""
+    for field in ('isbn', 'title', 'author'):
+        if field not in data or not data[field]:
+            return None, f'{field} is required'
+
+    isbn = normalize_isbn(data['isbn'])
+    if isbn is None:
+        return None, 'ISBN must be 13 digits'
+    return isbn, None
+
+def book_import_row(data):
+    """Validate one import record and build its upsert parameters; returns (row, error)"""
+    if not isinstance(data, dict):
+        return None, 'Record must be an object'
+
+    isbn, error = validate_book(data)
+    if error:
+        return None, error
+
+    try:
+        copies = data.get('copies')
+        copies = int(copies) if copies not in (None, '') else 1
+        year = data.get('publication_year')
+        year = int(year) if year not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, 'copies and publication_year must be integers'
+    if copies < 0:
+        return None, 'copies must not be negative'
+
+    return (
+        isbn,
+        data['title'],
+        data['author'],
+        data.get('category') or None,
+        year,
+        data.get('description') or None,
+        copies,
+        copies
+    ), None
+
+def iter_import_records(text_stream, fmt):
+    """Parse CSV or NDJSON incrementally; yields (line_number, record or None, error)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_number, line in enumerate(text_stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+
+def import_batch_in_transaction(conn, batch):
+    """Upsert one batch; returns the [(line, isbn, error)] rows that were rejected"""
+    conn.execute('SAVEPOINT import_batch')
+    try:
+        conn.executemany(IMPORT_UPSERT_SQL, [row for _, row in batch])
+        conn.execute('RELEASE import_batch')
+        return []
+    except sqlite3.IntegrityError:
+        # Retry row by row so only the offending records are rejected
+        conn.execute('ROLLBACK TO import_batch')
+        conn.execute('RELEASE import_batch')
+
+    rejected = []
+    for line, row in batch:
+        try:
+            conn.execute(IMPORT_UPSERT_SQL, row)
+        except sqlite3.IntegrityError as e:
+            rejected.append((line, row[0], str(e)))
+    return rejected
+
+def import_books(conn, records, batch_size=IMPORT_BATCH_SIZE):
+    """Upsert parsed records in batches, one write transaction per batch.
+
+    Returns a report with the number of imported rows and per-row errors.
+    """
+    report = {'imported': 0, 'error_count': 0, 'errors': []}
+
+    def record_error(line, error, isbn=None):
+        report['error_count'] += 1
+        if len(report['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'isbn': isbn, 'error': error})
+
+    def flush(batch):
+        rejected = run_write_transaction(conn, import_batch_in_transaction, batch)
+        report['imported'] += len(batch) - len(rejected)
+        for line, isbn, error in rejected:
+            record_error(line, error, isbn)
+        read_cache.invalidate('book', *(row[0] for _, row in batch))
+
+    batch = []
+    for line, record, error in records:
+        row = None
+        if not error:
+            row, error = book_import_row(record)
+        if error:
+            record_error(line, error, record.get('isbn') if isinstance(record, dict) else None)
+            continue
+
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+    return report
+
+EXPORT_TABLES = {
+    'books': ('SELECT * FROM books ORDER BY id', book_to_dict),
+    'borrow-history': ('SELECT * FROM borrow_history ORDER BY id', dict),
+}
+
+# QR Code generation
+QR_VERSION = 1
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def render_qr(data, fmt='png'):
+    """Render data as QR code image bytes (PNG or SVG)"""
+    qr = qrcode.QRCode(
+        version=QR_VERSION,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    if fmt == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        img.save(buffer)
+    else:
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def qr_cache_key(data, fmt='png'):
+    """Content address of a rendered QR code; doubles as its ETag"""
+    material = f'{QR_VERSION}|{QR_BOX_SIZE}|{QR_BORDER}|{fmt}|{data}'
+    return hashlib.sha256(material.encode()).hexdigest()
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used mapping"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+class QRCodeStore:
+    """Two-tier QR image cache: in-process LRU in front of content-addressed files"""
+
+    def __init__(self, maxsize=QR_CACHE_SIZE, directory=QR_CACHE_DIR):
+        self.memory = LRUCache(maxsize)
+        self.directory = directory
+        # Optional process pool for cache misses (set by the ASGI entry point)
+        self.executor = None
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}')
+
+    def _read(self, key, fmt):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key, fmt), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key, fmt, image):
+        if not self.directory:
+            return
+        path = self._path(key, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def get(self, data, fmt='png'):
+        key = qr_cache_key(data, fmt)
+        image = self.memory.get(key)
+        if image is None:
+            image = self._read(key, fmt)
+            if image is None:
+                started = time.perf_counter()
+                if self.executor is not None:
+                    image = self.executor.submit(render_qr, data, fmt).result()
+                else:
+                    image = render_qr(data, fmt)
+                elapsed = time.perf_counter() - started
+                qr_render_latency.observe((fmt,), elapsed)
+                record_timing('qr', elapsed)
+                self._write(key, fmt, image)
+            self.memory.put(key, image)
+        return key, image
+
+qr_store = QRCodeStore()
+
+def generate_qr_code(isbn):
+    _, png = qr_store.get(isbn, 'png')
+
+    # Convert to base64 string
+    img_str = base64.b64encode(png).decode()
+
+    return f"data:image/png;base64,{img_str}"
+
+def qr_response(data, fmt, payload):
+    """Serve a cached QR code as raw image bytes or as JSON with a data URI.
+
+    Responses carry an ETag derived from the content address, so revalidating
+    clients get a 304 without the image being looked up at all.
+    """
+    etag = qr_cache_key(data, 'png' if fmt == 'json' else fmt)
+    if fmt == 'json':
+        # The JSON body also carries payload fields (e.g. the title) that can change
+        etag = hashlib.sha256((etag + json.dumps(payload, sort_keys=True)).encode()).hexdigest()
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif fmt == 'json':
+        response = jsonify({**payload, 'qr_code': generate_qr_code(data)})
+    else:
+        _, image = qr_store.get(data, fmt)
+        response = Response(image, mimetype=QR_MIMETYPES[fmt])
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={QR_CACHE_MAX_AGE}'
+    return response
+
+# QR label sheets
+LABEL_DPI = 150
+LABEL_PAGE_PX = (1240, 1754)  # A4 at 150 dpi
+LABEL_COLUMNS = 3
+LABEL_ROWS = 5
+LABEL_MARGIN_PX = 60
+LABEL_FONT_SIZE = 18
+
+_label_executor = None
+_label_executor_lock = threading.Lock()
+
+def get_label_executor():
+    global _label_executor
+    with _label_executor_lock:
+        if _label_executor is None:
+            # spawn, not fork: the web server that owns us is multi-threaded
+            _label_executor = ProcessPoolExecutor(
+                max_workers=LABEL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _label_executor
+
+def chunked(items, size=SQL_IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def render_label(item):
+    """Process-pool worker: render one label's QR code through the shared QR store"""
+    isbn, title = item
+    try:
+        _, png = qr_store.get(isbn, 'png')
+        return isbn, title, png, None
+    except Exception as e:
+        return isbn, title, None, str(e)
+
+def render_labels(items):
+    """Render labels in the process pool, yielding results in input order.
+
+    At most a few batches per worker are in flight, so memory stays bounded no
+    matter how many labels are requested.
+    """
+    executor = get_label_executor()
+    window = LABEL_WORKERS * 4
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(render_label, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def find_label_items(conn, isbns=None, category=None):
+    """Resolve ISBNs (or a category) to (isbn, title) pairs plus not-found failures"""
+    if category:
+        rows = conn.execute(
+            'SELECT isbn, title FROM books WHERE category = ? ORDER BY title, id', (category,)
+        ).fetchall()
+        return [(row['isbn'], row['title']) for row in rows], []
+
+    titles = {}
+    unique = list(dict.fromkeys(isbns))
+    for chunk in chunked(unique):
+        placeholders = ', '.join('?' * len(chunk))
+        for row in conn.execute(f'SELECT isbn, title FROM books WHERE isbn IN ({placeholders})', chunk):
+            titles[row['isbn']] = row['title']
+
+    items = [(isbn, titles[isbn]) for isbn in isbns if isbn in titles]
+    failures = [{'isbn': isbn, 'error': 'Book not found'} for isbn in unique if isbn not in titles]
+    return items, failures
+
+def _label_font():
+    try:
+        return ImageFont.load_default(size=LABEL_FONT_SIZE)
+    except TypeError:  # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+def _fit_text(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+def compose_label_pages(labels, failures, report=True):
+    """Lay rendered labels out on A4 sheets, yielding one page image at a time.
+
+    Render errors are appended to failures; with report=True a final page
+    lists every failure.
+    """
+    font = _label_font()
+    width, height = LABEL_PAGE_PX
+    cell_w = (width - 2 * LABEL_MARGIN_PX) // LABEL_COLUMNS
+    cell_h = (height - 2 * LABEL_MARGIN_PX) // LABEL_ROWS
+    caption_h = 2 * (LABEL_FONT_SIZE + 6)
+    qr_size = min(cell_w, cell_h - caption_h) - 20
+    per_page = LABEL_COLUMNS * LABEL_ROWS
+
+    page = draw = None
+    slot = 0
+    for isbn, title, png, error in labels:
+        if error:
+            failures.append({'isbn': isbn, 'error': error})
+            continue
+
+        if page is None:
+            page = Image.new('L', LABEL_PAGE_PX, 255)
+            draw = ImageDraw.Draw(page)
+
+        x = LABEL_MARGIN_PX + (slot % LABEL_COLUMNS) * cell_w
+        y = LABEL_MARGIN_PX + (slot // LABEL_COLUMNS) * cell_h
+        qr_img = Image.open(io.BytesIO(png)).convert('L').resize((qr_size, qr_size), Image.NEAREST)
+        page.paste(qr_img, (x + (cell_w - qr_size) // 2, y))
+        caption_y = y + qr_size + 4
+        draw.text((x + 10, caption_y), _fit_text(draw, title, font, cell_w - 20), fill=0, font=font)
+        draw.text((x + 10, caption_y + LABEL_FONT_SIZE + 6), isbn, fill=0, font=font)
+
+        slot += 1
+        if slot == per_page:
+            yield page
+            page = draw = None
+            slot = 0
+
+    if page is not None:
+        yield page
+
+    if report and failures:
+        page = Image.new('L', LABEL_PAGE_PX, 255)
+        draw = ImageDraw.Draw(page)
+        line_h = LABEL_FONT_SIZE + 8
+        max_lines = (height - 2 * LABEL_MARGIN_PX) // line_h - 2
+        draw.text((LABEL_MARGIN_PX, LABEL_MARGIN_PX), f'{len(failures)} label(s) failed', fill=0, font=font)
+        for i, failure in enumerate(failures[:max_lines]):
+            line = _fit_text(draw, f"{failure['isbn']}: {failure['error']}", font, width - 2 * LABEL_MARGIN_PX)
+            draw.text((LABEL_MARGIN_PX, LABEL_MARGIN_PX + (i + 2) * line_h), line, fill=0, font=font)
+        if len(failures) > max_lines:
+            draw.text((LABEL_MARGIN_PX, height - LABEL_MARGIN_PX - line_h),
+                      f'... and {len(failures) - max_lines} more', fill=0, font=font)
+        yield page
+
+def stream_pdf(pages, dpi=LABEL_DPI):
+    """Write grayscale page images as a PDF, emitting each page as soon as it exists.
+
+    Object 1 is the catalog and object 2 the page tree; both are written last
+    because only then is the page list known.
+    """
+    offsets = {}
+    position = 0
+    page_ids = []
+
+    def write_object(obj_id, body, stream=None):
+        nonlocal position
+        offsets[obj_id] = position
+        chunk = f'{obj_id} 0 obj\n'.encode() + body
+        if stream is not None:
+            chunk += b'\nstream\n' + stream + b'\nendstream'
+        chunk += b'\nendobj\n'
+        position += len(chunk)
+        return chunk
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header
+
+    next_id = 3
+    for page in pages:
+        image_id, content_id, page_id = next_id, next_id + 1, next_id + 2
+        next_id += 3
+        width, height = page.size
+        width_pt, height_pt = width * 72 / dpi, height * 72 / dpi
+
+        pixels = zlib.compress(page.tobytes())
+        yield write_object(image_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode '
+            f'/Length {len(pixels)} >>'
+        ).encode(), pixels)
+
+        content = f'q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q'.encode()
+        yield write_object(content_id, f'<< /Length {len(content)} >>'.encode(), content)
+
+        yield write_object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode())
+        page_ids.append(page_id)
+
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    yield write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode())
+    yield write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    xref_position = position
+    xref = [f'xref\n0 {next_id}\n', '0000000000 65535 f \n']
+    xref += [f'{offsets[obj_id]:010d} 00000 n \n' for obj_id in range(1, next_id)]
+    xref.append(f'trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n')
+    yield ''.join(xref).encode()
+
+# Circulation reports
+REPORT_CACHE_SIZE = 256
+REPORT_DEFAULT_LIMIT = 100
+# Epoch seconds straight from SQLite; -1 stands in for a missing timestamp
+LOAN_COLUMNS = '''
+    SELECT id, isbn,
+           COALESCE(CAST(strftime('%s', borrow_date) AS INTEGER), -1),
+           COALESCE(CAST(strftime('%s', return_date) AS INTEGER), -1),
+           status = 'borrowed'
+'''
+
+class CirculationSnapshot:
+    """Columnar copy of one branch's loans and holdings behind /api/reports.
+
+    Loans are NumPy arrays of book index, borrow and return time (epoch
+    seconds) and an open flag; books are arrays in the same index space.
+    The first report loads everything; later ones apply only new loans,
+    loans returned since, and book_changes entries. Report results are
+    cached until the catalog version or the newest loan id moves.
+    """
+
+    def __init__(self, branch):
+        self.branch = branch
+        self.version = 0
+        self._signature = None
+        self._change_seq = 0
+        self._max_loan_id = 0
+        self._cache = LRUCache(REPORT_CACHE_SIZE)
+        self._lock = threading.Lock()
+
+        self.isbns = []
+        self.titles = []
+        self.categories = []
+        self._index = {}
+        self._category_index = {}
+        self.book_category = self.copies = self.available = self.present = None
+        self.loan_ids = self.loan_books = self.borrowed = self.returned = self.open = None
+
+    def _reset(self):
+        self._index.clear()
+        self._category_index.clear()
+        del self.isbns[:], self.titles[:], self.categories[:]
+        self.book_category = numpy.empty(0, numpy.int32)
+        self.copies = numpy.empty(0, numpy.int64)
+        self.available = numpy.empty(0, numpy.int64)
+        self.present = numpy.empty(0, bool)
+        self.loan_ids = numpy.empty(0, numpy.int64)
+        self.loan_books = numpy.empty(0, numpy.int32)
+        self.borrowed = numpy.empty(0, numpy.int64)
+        self.returned = numpy.empty(0, numpy.int64)
+        self.open = numpy.empty(0, bool)
+
+    def _ensure_books(self, isbns):
+        new = [isbn for isbn in dict.fromkeys(isbns) if isbn not in self._index]
+        if not new:
+            return
+        for isbn in new:
+            self._index[isbn] = len(self.isbns)
+            self.isbns.append(isbn)
+            self.titles.append(None)
+        grow = len(new)
+        self.book_category = numpy.concatenate([self.book_category, numpy.full(grow, -1, numpy.int32)])
+        self.copies = numpy.concatenate([self.copies, numpy.zeros(grow, numpy.int64)])
+        self.available = numpy.concatenate([self.available, numpy.zeros(grow, numpy.int64)])
+        self.present = numpy.concatenate([self.present, numpy.zeros(grow, bool)])
+
+    def _category_code(self, category):
+        if category is None:
+            return -1
+        code = self._category_index.get(category)
+        if code is None:
+            code = self._category_index[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def _apply_books(self, books):
+        """Apply (isbn, book) pairs; book is None for a deleted book"""
+        books = list(books)
+        self._ensure_books(isbn for isbn, _ in books)
+        for isbn, book in books:
+            i = self._index[isbn]
+            if book is None:
+                # Past loans of a deleted book report as uncategorized, as after a full load
+                self.titles[i] = None
+                self.book_category[i] = -1
+                self.copies[i] = self.available[i] = 0
+                self.present[i] = False
+                continue
+            self.titles[i] = book['title']
+            self.book_category[i] = self._category_code(book['category'])
+            self.copies[i] = book['copies'] or 0
+            self.available[i] = book['available'] or 0
+            self.present[i] = True
+
+    def _load_books(self, conn):
+        # Read the change position first; replaying changes the read already saw is harmless
+        self._change_seq = latest_change_seq(conn)
+        rows = conn.execute('SELECT isbn, title, category, copies, available FROM books').fetchall()
+        self.present[:] = False
+        self._apply_books((row['isbn'], row) for row in rows)
+
+    def _apply_book_changes(self, conn):
+        while True:
+            changes = read_changes(conn, self._change_seq, CHANGES_MAX_LIMIT)
+            if changes is None:
+                # The log was pruned past our position
+                self._load_books(conn)
+                return
+            if not changes:
+                return
+            self._apply_books((change['isbn'], change['book']) for change in changes)
+            self._change_seq = changes[-1]['seq']
+
+    def _append_loans(self, rows):
+        if not rows:
+            return
+        ids, isbns, borrowed, returned, is_open = zip(*rows)
+        self._ensure_books(isbns)
+        self.loan_ids = numpy.concatenate([self.loan_ids, numpy.array(ids, numpy.int64)])
+        self.loan_books = numpy.concatenate([
+            self.loan_books, numpy.array([self._index[isbn] for isbn in isbns], numpy.int32)
+        ])
+        self.borrowed = numpy.concatenate([self.borrowed, numpy.array(borrowed, numpy.int64)])
+        self.returned = numpy.concatenate([self.returned, numpy.array(returned, numpy.int64)])
+        self.open = numpy.concatenate([self.open, numpy.array(is_open, bool)])
+        self._max_loan_id = max(self._max_loan_id, ids[-1])
+
+    def _apply_returns(self, conn):
+        # Open loans are few and indexed, so diffing them finds every return since the last refresh
+        still_open = numpy.array(
+            [row[0] for row in conn.execute("SELECT id FROM borrow_history WHERE status = 'borrowed'")],
+            numpy.int64
+        )
+        closed = numpy.setdiff1d(self.loan_ids[self.open], still_open, assume_unique=True)
+        if not len(closed):
+            return
+
+        returned = {}
+        for chunk in chunked(closed.tolist()):
+            placeholders = ', '.join('?' * len(chunk))
+            for table in ('borrow_history', 'borrow_history_archive'):
+                returned.update(conn.execute(f'''
+                    SELECT id, COALESCE(CAST(strftime('%s', return_date) AS INTEGER), -1)
+                    FROM {table} WHERE id IN ({placeholders})
+                ''', chunk).fetchall())
+
+        # loan_ids is ascending, so positions come from a binary search
+        positions = numpy.searchsorted(self.loan_ids, closed)
+        self.returned[positions] = [returned.get(loan_id, -1) for loan_id in closed.tolist()]
+        self.open[positions] = False
+
+    def refresh(self, conn):
+        # Every borrow and return writes books, so the catalog version moves with the loans
+        signature = tuple(conn.execute('''
+            SELECT catalog_version, (SELECT COALESCE(MAX(id), 0) FROM borrow_history)
+            FROM library_stats WHERE id = 1
+        ''').fetchone())
+        if signature == self._signature:
+            return
+
+        if self._signature is None:
+            self._reset()
+            self._load_books(conn)
+            self._append_loans(conn.execute(f'''
+                {LOAN_COLUMNS} FROM borrow_history
+                UNION ALL
+                {LOAN_COLUMNS} FROM borrow_history_archive
+                ORDER BY 1
+            ''').fetchall())
+        else:
+            self._apply_book_changes(conn)
+            self._append_loans(conn.execute(
+                f'{LOAN_COLUMNS} FROM borrow_history WHERE id > ? ORDER BY id', (self._max_loan_id,)
+            ).fetchall())
+            self._apply_returns(conn)
+        self._signature = signature
+        self.version += 1
+
+    def report(self, conn, name, params):
+        with self._lock:
+            self.refresh(conn)
+            key = (self.version, name, tuple(sorted(params.items())))
+            result = self._cache.get(key)
+            if result is None:
+                result = REPORTS[name](self, params)
+                self._cache.put(key, result)
+            return result
+
+    def category_name(self, code):
+        return self.categories[code] if code >= 0 else None
+
+circulation_snapshots = {branch: CirculationSnapshot(branch) for branch in BRANCH_DATABASES}
+
+def epoch_seconds(value):
+    """Epoch seconds of an ISO date or datetime, read as UTC like SQLite's timestamps"""
+    return int(numpy.datetime64(datetime.fromisoformat(value), 's').astype(numpy.int64))
+
+def report_params(args):
+    """Normalized report parameters; raises ValueError for malformed values"""
+    params = {}
+    for arg in ('from', 'to'):
+        if args.get(arg):
+            try:
+                params[arg] = epoch_seconds(args[arg])
+            except ValueError:
+                raise ValueError('from and to must be ISO dates')
+    limit = args.get('limit', REPORT_DEFAULT_LIMIT, type=int)
+    if not 0 < limit <= BOOKS_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {BOOKS_MAX_LIMIT}')
+    params['limit'] = limit
+    return params
+
+def report_loans_per_month(snapshot, params):
+    """Loans per category per calendar month; from inclusive, to exclusive"""
+    mask = snapshot.borrowed >= 0
+    if 'from' in params:
+        mask &= snapshot.borrowed >= params['from']
+    if 'to' in params:
+        mask &= snapshot.borrowed < params['to']
+    if not mask.any():
+        return []
+
+    months = snapshot.borrowed[mask].astype('datetime64[s]').astype('datetime64[M]').astype(numpy.int64)
+    codes = snapshot.book_category[snapshot.loan_books[mask]] + 1
+    first = months.min()
+    width = len(snapshot.categories) + 1
+    counts = numpy.bincount((months - first) * width + codes)
+    rows = [
+        {
+            'month': str(numpy.datetime64(int(first + key // width), 'M')),
+            'category': snapshot.category_name(key % width - 1),
+            'loans': int(counts[key])
+        }
+        for key in numpy.flatnonzero(counts).tolist()
+    ]
+    return sorted(rows, key=lambda row: (row['month'], row['category'] or ''))
+
+def report_loan_duration(snapshot, params):
+    """Average days between borrow and return of returned loans, overall and per category"""
+    done = ~snapshot.open & (snapshot.returned >= 0) & (snapshot.borrowed >= 0)
+    days = (snapshot.returned[done] - snapshot.borrowed[done]) / 86400
+    codes = snapshot.book_category[snapshot.loan_books[done]] + 1
+    width = len(snapshot.categories) + 1
+    counts = numpy.bincount(codes, minlength=width)
+    totals = numpy.bincount(codes, weights=days, minlength=width)
+    return {
+        'returned_loans': int(len(days)),
+        'open_loans': int(snapshot.open.sum()),
+        'average_days': round(float(days.mean()), 2) if len(days) else None,
+        'median_days': round(float(numpy.median(days)), 2) if len(days) else None,
+        'categories': [
+            {
+                'category': snapshot.category_name(code - 1),
+                'returned_loans': int(counts[code]),
+                'average_days': round(float(totals[code] / counts[code]), 2)
+            }
+            for code in numpy.flatnonzero(counts).tolist()
+        ]
+    }
+
+def report_utilization(snapshot, params):
+    """Share of copies out on loan, (copies - available) / copies, per category"""
+    present = snapshot.present
+    codes = snapshot.book_category[present] + 1
+    width = len(snapshot.categories) + 1
+    copies = numpy.bincount(codes, weights=snapshot.copies[present], minlength=width)
+    on_loan = numpy.bincount(codes, weights=(snapshot.copies - snapshot.available)[present], minlength=width)
+    books = numpy.bincount(codes, minlength=width)
+
+    def ratio(part, whole):
+        return round(float(part / whole), 4) if whole else None
+
+    return {
+        'copies': int(copies.sum()),
+        'on_loan': int(on_loan.sum()),
+        'utilization': ratio(on_loan.sum(), copies.sum()),
+        'categories': [
+            {
+                'category': snapshot.category_name(code - 1),
+                'books': int(books[code]),
+                'copies': int(copies[code]),
+                'on_loan': int(on_loan[code]),
+                'utilization': ratio(on_loan[code], copies[code])
+            }
+            for code in numpy.flatnonzero(books).tolist()
+        ]
+    }
+
+def report_never_borrowed(snapshot, params):
+    """Books in the catalog with no loan on record, archive included, by title"""
+    loans = numpy.bincount(snapshot.loan_books, minlength=len(snapshot.isbns))
+    indexes = numpy.flatnonzero(snapshot.present & (loans == 0)).tolist()
+    books = sorted(
+        ({'isbn': snapshot.isbns[i], 'title': snapshot.titles[i],
+          'category': snapshot.category_name(snapshot.book_category[i])} for i in indexes),
+        key=lambda book: (book['title'] or '', book['isbn'])
+    )
+    return {'count': len(books), 'books': books[:params['limit']]}
+
+REPORTS = {
+    'loans-per-month': report_loans_per_month,
+    'loan-duration': report_loan_duration,
+    'utilization': report_utilization,
+    'never-borrowed': report_never_borrowed,
+}
+
+# API Routes
+
+@app.route('/')
+def home():
+    return jsonify({
+        "message": "Library Management System API",
+        "endpoints": {
+            "GET /api/books": "Get all books",
+            "GET /api/books/<isbn>": "Get specific book by ISBN",
+            "POST /api/books": "Add new book",
+            "PUT /api/books/<isbn>": "Update book",
+            "POST /api/books:batchGet": "Look up many books by ISBN",
+            "POST /api/books:batchUpdate": "Update many books in one transaction",
+            "POST /api/books:batchDelete": "Delete many books in one transaction",
+            "DELETE /api/books/<isbn>": "Delete book",
+            "GET /api/books/<isbn>/availability": "Copies available at each branch",
+            "GET /api/books/<isbn>/recommendations": "Books also borrowed by this book's readers",
+            "GET /api/books/<isbn>/qr": "Get QR code for book",
+            "POST /api/books/<isbn>/borrow": "Borrow book",
+            "POST /api/books/<isbn>/return": "Return book",
+            "POST /api/checkout": "Borrow several books at once",
+            "GET /api/search": "Search books",
+            "GET /api/changes": "Book changes after a sequence number",
+            "GET /api/changes/stream": "Server-sent events for book changes",
+            "GET /api/suggest": "Typeahead suggestions by title, author or ISBN prefix",
+            "GET /api/reports/<report>": "Circulation reports: loans-per-month, loan-duration, utilization, never-borrowed"
+        }
+    })
+
+@app.route('/api/books', methods=['GET'])
+def get_all_books():
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        if fields is None:
+            return jsonify({'error': f'fields must be a subset of: {", ".join(BOOK_FIELDS)}'}), 400
+
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 0 < limit <= BOOKS_MAX_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {BOOKS_MAX_LIMIT}'}), 400
+
+        after = request.args.get('after')
+        stream = request.args.get('stream')
+        if stream and stream not in STREAM_MIMETYPES:
+            return jsonify({'error': 'stream must be json, ndjson or csv'}), 400
+
+        # title and id are always read because they form the keyset cursor
+        columns = ', '.join(f for f in BOOK_FIELDS if f in fields or f in ('title', 'id'))
+        sql = f'SELECT {columns} FROM books'
+        params = []
+        if after:
+            try:
+                after_title, after_id = decode_cursor(after)
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            sql += ' WHERE (title, id) > (?, ?)'
+            params += [after_title, after_id]
+        sql += ' ORDER BY title, id'
+
+        if stream:
+            if limit is not None:
+                sql += ' LIMIT ?'
+                params.append(limit)
+            rows = stream_rows(sql, params, lambda row: book_to_dict(row, fields), stream)
+            return Response(rows, mimetype=STREAM_MIMETYPES[stream])
+
+        conn = get_db_connection()
+        version = get_catalog_version(conn)
+
+        # Any write to books bumps the version, so an unchanged catalog
+        # revalidates with a 304 and never re-reads the rows
+        representation = negotiate_representation()
+        etag = f'catalog-{current_branch()}-{version}'
+        if representation != ('rows', 'application/json'):
+            etag += '-' + '-'.join(representation).replace('/', '.')
+        if request.if_none_match.contains_weak(etag):
+            conn.close()
+            response = Response(status=304)
+        else:
+            cache_key = f'{version}:{fields}:{limit}:{after}:{representation}'
+            body = read_cache.get('catalog', cache_key)
+            if body is None:
+                if limit is None and not after:
+                    books = conn.execute(sql, params).fetchall()
+                    payload = [book_to_dict(book, fields) for book in books]
+                else:
+                    # Keyset page: read one extra row to learn whether another page exists
+                    limit = limit or BOOKS_MAX_LIMIT
+                    books = conn.execute(sql + ' LIMIT ?', params + [limit + 1]).fetchall()
+
+                    next_cursor = None
+                    if len(books) > limit:
+                        books = books[:limit]
+                        next_cursor = encode_cursor(books[-1]['title'], books[-1]['id'])
+
+                    payload = {
+                        'books': [book_to_dict(book, fields) for book in books],
+                        'next_cursor': next_cursor
+                    }
+                body = encode_payload(payload, *representation)
+                read_cache.set('catalog', cache_key, body)
+            conn.close()
+            response = Response(body, mimetype=representation[1])
+            if msgpack is not None:
+                response.vary.add('Accept')
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>', methods=['GET'])
+def get_book(isbn):
+    try:
+        book = get_cached_book(isbn)
+        
+        if book:
+            return jsonify(book)
+        else:
+            return jsonify({'error': 'Book not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books:batchGet', methods=['POST'])
+def batch_get_books():
+    """Resolve many ISBNs in one round trip; results follow the request order"""
+    try:
+        data = request.get_json() or {}
+        isbns, error = batch_items(data, 'isbns')
+        if error or not all(isinstance(isbn, str) for isbn in isbns):
+            return jsonify({'error': error or 'isbns must be strings'}), 400
+
+        fields = data.get('fields')
+        if isinstance(fields, list) and all(isinstance(field, str) for field in fields):
+            fields = ','.join(fields)
+        fields = parse_fields(fields) if fields is None or isinstance(fields, str) else None
+        if fields is None:
+            return jsonify({'error': f'fields must be a subset of: {", ".join(BOOK_FIELDS)}'}), 400
+
+        conn = get_db_connection()
+        books = fetch_books(conn, dict.fromkeys(isbns), ', '.join(f for f in BOOK_FIELDS if f in fields or f == 'isbn'))
+        conn.close()
+
+        return batch_response([
+            {'isbn': isbn, 'status': 200, 'book': book_to_dict(books[isbn], fields)} if isbn in books
+            else {'isbn': isbn, 'status': 404, 'error': 'Book not found'}
+            for isbn in isbns
+        ])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books:batchUpdate', methods=['POST'])
+def batch_update_books():
+    """Partial updates for many books, applied in a single transaction"""
+    try:
+        data = request.get_json() or {}
+        updates, error = batch_items(data, 'updates')
+        if error:
+            return jsonify({'error': error}), 400
+
+        valid = [u for u in updates if isinstance(u, dict) and isinstance(u.get('isbn'), str)]
+        results = []
+        if valid:
+            conn = get_db_connection()
+            try:
+                results, books = run_write_transaction(conn, batch_update_in_transaction, valid)
+            finally:
+                conn.close()
+
+            updated = {result['isbn'] for result in results if result['status'] == 200}
+            if updated:
+                read_cache.invalidate('book', *updated)
+            for isbn in updated:
+                suggest_indexes[current_branch()].add(isbn, books[isbn]['title'], books[isbn]['author'])
+
+        # Stitch rejected items back in at their positions
+        results = iter(results)
+        return batch_response([
+            next(results) if isinstance(u, dict) and isinstance(u.get('isbn'), str)
+            else {'isbn': u.get('isbn') if isinstance(u, dict) else None, 'status': 400, 'error': 'Each update needs an isbn'}
+            for u in updates
+        ])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books:batchDelete', methods=['POST'])
+def batch_delete_books():
+    """Delete many books in a single transaction"""
+    try:
+        data = request.get_json() or {}
+        isbns, error = batch_items(data, 'isbns')
+        if error or not all(isinstance(isbn, str) for isbn in isbns):
+            return jsonify({'error': error or 'isbns must be strings'}), 400
+        isbns = list(dict.fromkeys(isbns))
+
+        conn = get_db_connection()
+        try:
+            deleted = run_write_transaction(conn, batch_delete_in_transaction, isbns)
+        finally:
+            conn.close()
+
+        if deleted:
+            read_cache.invalidate('book', *deleted)
+        for isbn in deleted:
+            suggest_indexes[current_branch()].remove(isbn)
+
+        return batch_response([
+            {'isbn': isbn, 'status': 200} if isbn in deleted
+            else {'isbn': isbn, 'status': 404, 'error': 'Book not found'}
+            for isbn in isbns
+        ])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>/availability', methods=['GET'])
+def get_book_availability(isbn):
+    """Copies of a book on the shelf at each branch"""
+    try:
+        def holdings(conn):
+            row = conn.execute('SELECT copies, available FROM books WHERE isbn = ?', (isbn,)).fetchone()
+            return dict(row) if row else None
+
+        per_branch = fan_out(holdings, branches=[g.branch] if g.branch else None)
+        branches = {branch: row for branch, row in per_branch.items() if row}
+        if not branches:
+            return jsonify({'error': 'Book not found'}), 404
+
+        return jsonify({
+            'isbn': isbn,
+            'copies': sum(row['copies'] for row in branches.values()),
+            'available': sum(row['available'] for row in branches.values()),
+            'branches': branches
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>/recommendations', methods=['GET'])
+def get_book_recommendations(isbn):
+    """Books that readers of this one also borrowed"""
+    try:
+        limit = request.args.get('limit', RECOMMEND_DEFAULT_LIMIT, type=int)
+        if not 0 < limit <= RECOMMEND_MAX_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {RECOMMEND_MAX_LIMIT}'}), 400
+
+        book = get_cached_book(isbn)
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+
+        picks = [(other, round(score, 4), 'co-borrowed')
+                 for other, score in recommenders[current_branch()].neighbours(isbn, limit)]
+
+        conn = get_db_connection()
+        if len(picks) < limit:
+            exclude = {isbn, *(other for other, _, _ in picks)}
+            picks += [(other, None, reason) for other, reason in similar_books(conn, book, exclude, limit - len(picks))]
+
+        # Neighbours may include books deleted since the matrix was built
+        details = fetch_books(conn, (other for other, _, _ in picks))
+        conn.close()
+
+        return jsonify({
+            'isbn': isbn,
+            'recommendations': [
+                {**book_to_dict(details[other]), 'score': score, 'reason': reason}
+                for other, score, reason in picks if other in details
+            ]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books', methods=['POST'])
+def add_book():
+    try:
+        data = request.get_json()
+        
+        # Validate required fields and ISBN format (13 digits)
+        isbn, error = validate_book(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        try:
+            run_write(add_in_transaction, isbn, data)
+        except LibraryError as e:
+            return jsonify({'error': e.message}), e.status
+        read_cache.invalidate('book', isbn)
+        suggest_indexes[current_branch()].add(isbn, data['title'], data['author'])
+        
+        return jsonify({'message': 'Book added successfully', 'isbn': isbn}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+@app.route('/api/books/import', methods=['POST'])
+def bulk_import_books():
+    """Stream a CSV or NDJSON catalog feed into books with batched upserts"""
+    try:
+        fmt = request.args.get('format') or IMPORT_CONTENT_TYPES.get(request.mimetype)
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+        batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+        if batch_size <= 0:
+            return jsonify({'error': 'batch_size must be positive'}), 400
+
+        # Parse straight off the socket; the body is never held in memory
+        text_stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+
+        conn = get_db_connection()
+        report = import_books(conn, iter_import_records(text_stream, fmt), batch_size)
+        conn.close()
+
+        return jsonify(report), 200 if not report['error_count'] else 207
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """Stream books or borrow_history as NDJSON or CSV"""
+    try:
+        if table not in EXPORT_TABLES:
+            return jsonify({'error': f'table must be one of: {", ".join(EXPORT_TABLES)}'}), 404
+
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+        sql, to_dict = EXPORT_TABLES[table]
+        return Response(stream_rows(sql, (), to_dict, fmt), mimetype=STREAM_MIMETYPES[fmt], headers={
+            'Content-Disposition': f'attachment; filename={table}.{fmt}'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>', methods=['PUT'])
+def update_book(isbn):
+    try:
+        data = request.get_json()
+        
+        conn = get_db_connection()
+        
+        # Check if book exists
+        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+        if not book:
+            conn.close()
+            return jsonify({'error': 'Book not found'}), 404
+        
+        # Update book
+        conn.execute('''
+            UPDATE books 
+            SET title = ?, author = ?, category = ?, publication_year = ?, 
+                description = ?, copies = ?, available = ?
+            WHERE isbn = ?
+        ''', (
+            data.get('title', book['title']),
+            data.get('author', book['author']),
+            data.get('category', book['category']),
+            data.get('publication_year', book['publication_year']),
+            data.get('description', book['description']),
+            data.get('copies', book['copies']),
+            data.get('available', book['available']),
+            isbn
+        ))
+        
+        conn.commit()
+        conn.close()
+        read_cache.invalidate('book', isbn)
+        suggest_indexes[current_branch()].add(
+            isbn, data.get('title', book['title']), data.get('author', book['author'])
+        )
+        
+        return jsonify({'message': 'Book updated successfully'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>', methods=['DELETE'])
+def delete_book(isbn):
+    try:
+        conn = get_db_connection()
+        
+        # Check if book exists
+        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+        if not book:
+            conn.close()
+            return jsonify({'error': 'Book not found'}), 404
+        
+        # Delete book
+        conn.execute('DELETE FROM books WHERE isbn = ?', (isbn,))
+        conn.commit()
+        conn.close()
+        read_cache.invalidate('book', isbn)
+        suggest_indexes[current_branch()].remove(isbn)
+        
+        return jsonify({'message': 'Book deleted successfully'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>/qr', methods=['GET'])
+def get_book_qr(isbn):
+    try:
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'png', 'svg'):
+            return jsonify({'error': 'format must be json, png or svg'}), 400
+
+        book = get_cached_book(isbn)
+        
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+        
+        return qr_response(isbn, fmt, {
+            'isbn': isbn,
+            'title': book['title']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>/borrow', methods=['POST'])
+def borrow_book(isbn):
+    try:
+        data = request.get_json()
+        borrower_name = data.get('borrower_name')
+        borrower_email = data.get('borrower_email', '')
+        
+        if not borrower_name:
+            return jsonify({'error': 'Borrower name is required'}), 400
+        
+        # No connection is held while the write runs: under group commit this
+        # thread only waits for the writer thread, which needs no pool slot
+        try:
+            run_write(borrow_in_transaction, isbn, borrower_name, borrower_email)
+        except LibraryError as e:
+            return jsonify({'error': e.message}), e.status
+        read_cache.invalidate('book', isbn)
+        recommenders[current_branch()].record_loans(borrower_name, borrower_email, [isbn])
+        
+        return jsonify({'message': 'Book borrowed successfully'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/books/<isbn>/return', methods=['POST'])
+def return_book(isbn):
+    try:
+        data = request.get_json()
+        borrower_name = data.get('borrower_name')
+        
+        if not borrower_name:
+            return jsonify({'error': 'Borrower name is required'}), 400
+        
+        try:
+            run_write(return_in_transaction, isbn, borrower_name)
+        except LibraryError as e:
+            return jsonify({'error': e.message}), e.status
+        read_cache.invalidate('book', isbn)
+        
+        return jsonify({'message': 'Book returned successfully'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/checkout', methods=['POST'])
+def checkout_books():
+    """Borrow a basket of ISBNs atomically: all of them or none"""
+    try:
+        data = request.get_json() or {}
+        borrower_name = data.get('borrower_name')
+        borrower_email = data.get('borrower_email', '')
+        isbns = data.get('isbns')
+
+        if not borrower_name:
+            return jsonify({'error': 'Borrower name is required'}), 400
+        if not isbns or not isinstance(isbns, list) or not all(isinstance(i, str) for i in isbns):
+            return jsonify({'error': 'isbns must be a non-empty list of strings'}), 400
+        if len(isbns) > CHECKOUT_MAX_ITEMS:
+            return jsonify({'error': f'At most {CHECKOUT_MAX_ITEMS} books per checkout'}), 400
+
+        try:
+            borrow_ids = run_write(checkout_in_transaction, isbns, borrower_name, borrower_email)
+        except LibraryError as e:
+            return e.to_response()
+        read_cache.invalidate('book', *isbns)
+        recommenders[current_branch()].record_loans(borrower_name, borrower_email, isbns)
+
+        return jsonify({'message': 'Books borrowed successfully', 'borrow_ids': borrow_ids})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search_books():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+
+        limit = min(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), SEARCH_MAX_LIMIT)
+        if limit <= 0:
+            return jsonify({'error': 'limit must be positive'}), 400
+
+        fuzzy = request.args.get('fuzzy', 'auto')
+        if fuzzy not in ('auto', '0', '1'):
+            return jsonify({'error': 'fuzzy must be auto, 0 or 1'}), 400
+        if fuzzy == '1' and not TRIGRAM_AVAILABLE:
+            return jsonify({'error': 'Fuzzy search needs SQLite 3.34+ with FTS5'}), 501
+
+        threshold = request.args.get('threshold', FUZZY_THRESHOLD, type=float)
+        if not 0 < threshold <= 1:
+            return jsonify({'error': 'threshold must be in (0, 1]'}), 400
+
+        if g.branch or not SHARDED:
+            conn = get_db_connection()
+            results = search_branch(conn, query, limit, fuzzy, threshold)
+            conn.close()
+            return payload_response(results)
+
+        return payload_response(search_all_branches(query, limit, fuzzy, threshold))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes', methods=['GET'])
+def get_book_changes():
+    """Book changes after ?since=, oldest first.
+
+    Without since only the current sequence number is returned: fetch it
+    before downloading the catalog, then poll or stream from there.
+    """
+    try:
+        try:
+            since = parse_change_since(request.args, {})
+        except ValueError:
+            return jsonify({'error': 'since must be a non-negative integer'}), 400
+
+        limit = request.args.get('limit', CHANGES_DEFAULT_LIMIT, type=int)
+        if not 0 < limit <= CHANGES_MAX_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {CHANGES_MAX_LIMIT}'}), 400
+
+        conn = get_db_connection()
+        latest = latest_change_seq(conn)
+        if since is None:
+            conn.close()
+            return jsonify({'changes': [], 'last_seq': latest, 'latest_seq': latest})
+
+        changes = read_changes(conn, since, limit)
+        conn.close()
+        if changes is None:
+            return jsonify({'error': 'Changes after since have been pruned; reload the catalog'}), 410
+
+        last_seq = changes[-1]['seq'] if changes else max(since, latest)
+        return payload_response({'changes': changes, 'last_seq': last_seq, 'latest_seq': latest})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_book_changes():
+    """Server-sent events for book changes, resuming from since or Last-Event-ID"""
+    try:
+        try:
+            since = parse_change_since(request.args, request.headers)
+        except ValueError:
+            return jsonify({'error': 'since must be a non-negative integer'}), 400
+
+        feed = change_feeds[current_branch()]
+        if since is None:
+            since = feed.current_seq()
+        return Response(stream_changes(feed, since), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest_books():
+    """Typeahead matches for a title, author or ISBN prefix, most borrowed first"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+
+        limit = request.args.get('limit', SUGGEST_DEFAULT_LIMIT, type=int)
+        if not 0 < limit <= SUGGEST_MAX_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {SUGGEST_MAX_LIMIT}'}), 400
+
+        def suggest(conn):
+            return suggest_indexes[current_branch()].suggest(conn, query, limit)
+
+        if g.branch or not SHARDED:
+            return jsonify(fan_out(suggest, branches=[current_branch()])[current_branch()])
+
+        per_branch = fan_out(suggest)
+        suggestions = [{**item, 'branch': branch} for branch, items in per_branch.items() for item in items]
+        return jsonify(heapq.nlargest(limit, suggestions, key=lambda item: item['popularity']))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/borrow-history', methods=['GET'])
+def get_borrow_history():
+    try:
+        try:
+            clauses, params = history_filters(request.args)
+        except ValueError:
+            return jsonify({'error': 'from and to must be ISO dates'}), 400
+
+        group_by = request.args.get('group_by')
+        if group_by:
+            if group_by not in HISTORY_GROUPS:
+                return jsonify({'error': f'group_by must be one of: {", ".join(HISTORY_GROUPS)}'}), 400
+
+            # Aggregate in SQL; only the groups travel back to Python
+            expression, label = HISTORY_GROUPS[group_by]
+            where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+            conn = get_db_connection()
+            groups = conn.execute(f'''
+                SELECT {expression} AS {label},
+                       COUNT(*) AS loans,
+                       SUM(bh.status = 'borrowed') AS active
+                FROM borrow_history bh
+                JOIN books b ON bh.isbn = b.isbn
+                {where}
+                GROUP BY 1
+                ORDER BY 1
+            ''', params).fetchall()
+            conn.close()
+
+            return payload_response([dict(group) for group in groups])
+
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 0 < limit <= HISTORY_MAX_LIMIT:
+            return jsonify({'error': f'limit must be between 1 and {HISTORY_MAX_LIMIT}'}), 400
+
+        after = request.args.get('after')
+        if after:
+            try:
+                after_date, after_id = decode_cursor(after)
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            clauses.append('(bh.borrow_date, bh.id) < (?, ?)')
+            params += [after_date, after_id]
+
+        sql = '''
+            SELECT bh.*, b.title, b.author 
+            FROM borrow_history bh
+            JOIN books b ON bh.isbn = b.isbn
+        '''
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY bh.borrow_date DESC, bh.id DESC'
+
+        if request.args.get('format') == 'ndjson':
+            if limit is not None:
+                sql += ' LIMIT ?'
+                params.append(limit)
+            return Response(stream_rows(sql, params, dict, 'ndjson'), mimetype=STREAM_MIMETYPES['ndjson'])
+
+        conn = get_db_connection()
+
+        if limit is None and not after:
+            history = conn.execute(sql, params).fetchall()
+            conn.close()
+
+            return payload_response([dict(record) for record in history])
+
+        # Keyset page on (borrow_date, id), newest first
+        limit = limit or HISTORY_MAX_LIMIT
+        history = conn.execute(sql + ' LIMIT ?', params + [limit + 1]).fetchall()
+        conn.close()
+
+        next_cursor = None
+        if len(history) > limit:
+            history = history[:limit]
+            next_cursor = encode_cursor(history[-1]['borrow_date'], history[-1]['id'])
+
+        return payload_response({
+            'history': [dict(record) for record in history],
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/borrow-history/archive', methods=['POST'])
+def archive_borrow_history():
+    """Move returned loans older than N days into borrow_history_archive"""
+    try:
+        data = request.get_json() or {}
+        days = data.get('days')
+        if not isinstance(days, int) or days < 0:
+            return jsonify({'error': 'days must be a non-negative integer'}), 400
+
+        conn = get_db_connection()
+        archived = archive_returned_loans(conn, days)
+        conn.close()
+
+        return jsonify({'archived': archived})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/frontend')
+def serve_frontend():
+    """Serve the HTML frontend"""
+    try:
+        # Try to find the HTML file in current directory
+        if os.path.exists('index.html'):
+            return send_from_directory('.', 'index.html')
+        else:
+            # If index.html doesn't exist, return a simple message with instructions
+            return f'''
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <title>Library Management System</title>
+                <style>
+                    body {{ font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px; }}
+                    .error {{ background: #f8d7da; border: 1px solid #f5c6cb; padding: 15px; border-radius: 5px; }}
+                    .info {{ background: #d1ecf1; border: 1px solid #bee5eb; padding: 15px; border-radius: 5px; }}
+                    pre {{ background: #f8f9fa; padding: 10px; border-radius: 5px; overflow-x: auto; }}
+                </style>
+            </head>
+            <body>
+                <h1>📚 Library Management System</h1>
+                
+                <div class="error">
+                    <h3>❌ HTML Frontend Not Found</h3>
+                    <p>The <code>index.html</code> file is not in the same directory as your Flask app.</p>
+                </div>
+                
+                <div class="info">
+                    <h3>🔧 How to Fix This:</h3>
+                    
+                    <h4>Option 1: Save the HTML file (Recommended)</h4>
+                    <ol>
+                        <li>Copy the HTML code from Claude's artifact</li>
+                        <li>Save it as <code>index.html</code> in the same folder as your <code>app.py</code></li>
+                        <li>Refresh this page</li>
+                    </ol>
+                    
+                    <h4>Option 2: Use a separate server</h4>
+                    <ol>
+                        <li>Open a new terminal in your HTML file location</li>
+                        <li>Run: <pre>python3 -m http.server 8080</pre></li>
+                        <li>Access: <a href="http://localhost:8080/index.html">http://localhost:8080/index.html</a></li>
+                    </ol>
+                    
+                    <h4>Option 3: Use the API directly</h4>
+                    <p>Test the API endpoints:</p>
+                    <ul>
+                        <li><a href="/api/books">View all books</a></li>
+                        <li><a href="/api/stats">View library statistics</a></li>
+                        <li><a href="/generate-frontend-qr">Generate QR code</a></li>
+                    </ul>
+                </div>
+                
+                <div class="info">
+                    <h3>📱 API Endpoints Available:</h3>
+                    <ul>
+                        <li><strong>GET /api/books</strong> - Get all books</li>
+                        <li><strong>GET /api/books/&lt;isbn&gt;</strong> - Get specific book</li>
+                        <li><strong>POST /api/books</strong> - Add new book</li>
+                        <li><strong>GET /api/search?q=&lt;query&gt;</strong> - Search books</li>
+                        <li><strong>GET /generate-frontend-qr</strong> - Generate QR for frontend</li>
+                    </ul>
+                </div>
+            </body>
+            </html>
+            '''
+    except Exception as e:
+        return jsonify({'error': f'Error serving frontend: {str(e)}'}), 500
+
+@app.route('/generate-frontend-qr')
+def generate_frontend_qr_endpoint():
+    """Generate QR code for the frontend URL"""
+    try:
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'png', 'svg'):
+            return jsonify({'error': 'format must be json, png or svg'}), 400
+
+        frontend_url = request.url_root + 'frontend'  # e.g., http://localhost:5000/frontend
+
+        return qr_response(frontend_url, fmt, {
+            'url': frontend_url,
+            'message': 'QR code for frontend access'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/labels', methods=['POST'])
+def generate_labels():
+    """Render QR label sheets for a list of ISBNs or a whole category"""
+    try:
+        data = request.get_json() or {}
+        isbns = data.get('isbns')
+        category = data.get('category')
+        fmt = data.get('format', 'pdf')
+
+        if not isbns and not category:
+            return jsonify({'error': 'isbns or category is required'}), 400
+        if isbns and (not isinstance(isbns, list) or not all(isinstance(i, str) for i in isbns)):
+            return jsonify({'error': 'isbns must be a list of strings'}), 400
+        if isbns and len(isbns) > LABEL_MAX_ITEMS:
+            return jsonify({'error': f'At most {LABEL_MAX_ITEMS} labels per request'}), 400
+        if fmt not in ('pdf', 'png'):
+            return jsonify({'error': 'format must be pdf or png'}), 400
+
+        conn = get_db_connection()
+        items, failures = find_label_items(conn, isbns, category)
+        conn.close()
+
+        if fmt == 'png':
+            # A PNG holds a single sheet, so pick one page of labels
+            page = int(data.get('page', 1))
+            per_page = LABEL_COLUMNS * LABEL_ROWS
+            items = items[(page - 1) * per_page:page * per_page] if page > 0 else []
+            if not items:
+                return jsonify({'error': 'Page out of range', 'failures': failures}), 404
+
+            sheet = next(compose_label_pages(render_labels(items), failures, report=False), None)
+            buffer = io.BytesIO()
+            if sheet is not None:
+                sheet.save(buffer, format='PNG')
+            response = Response(buffer.getvalue(), mimetype='image/png')
+            response.headers['X-Label-Failures'] = json.dumps(failures)
+            return response
+
+        pages = compose_label_pages(render_labels(items), failures)
+        return Response(stream_pdf(pages), mimetype='application/pdf', headers={
+            'Content-Disposition': 'attachment; filename=labels.pdf'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats', methods=['GET'])
+def get_library_stats():
+    try:
+        if g.branch or not SHARDED:
+            conn = get_db_connection()
+            stats = branch_stats(conn)
+            conn.close()
+            return payload_response(stats)
+
+        return payload_response(merge_branch_stats(fan_out(branch_stats)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/<report>', methods=['GET'])
+def get_report(report):
+    try:
+        if report not in REPORTS:
+            return jsonify({'error': f'report must be one of: {", ".join(REPORTS)}'}), 404
+        if numpy is None:
+            return jsonify({'error': 'Circulation reports need numpy'}), 501
+        try:
+            params = report_params(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def run(conn):
+            return circulation_snapshots[current_branch()].report(conn, report, params)
+
+        if g.branch or not SHARDED:
+            return payload_response(fan_out(run, branches=[current_branch()])[current_branch()])
+        # Per-branch reports; averages and ratios do not add up across shards
+        return payload_response(fan_out(run))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/replicas', methods=['GET'])
+def get_replica_status():
+    try:
+        if REPLICA_MODE == 'off':
+            return jsonify({'mode': REPLICA_MODE, 'branches': {}})
+        statuses = fan_out(replica_status, branches=[g.branch] if g.branch else None)
+        return jsonify({
+            'mode': REPLICA_MODE,
+            'max_staleness': REPLICA_MAX_STALENESS,
+            'branches': statuses
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this process's metrics"""
+    lines = []
+    for metric in (request_latency, response_size, query_latency, query_rows, qr_render_latency,
+                   group_commit_batch_size):
+        lines += metric.render()
+
+    cache = read_cache.stats()
+    for kind in ('hits', 'misses'):
+        lines += [f'# HELP library_cache_{kind}_total Read cache {kind} by namespace.',
+                  f'# TYPE library_cache_{kind}_total counter']
+        lines += [f'library_cache_{kind}_total{_format_labels(("namespace",), (namespace,))} {counts[kind]}'
+                  for namespace, counts in cache['namespaces'].items()]
+
+    lines += ['# HELP library_db_pool_idle_connections Idle pooled SQLite connections by branch.',
+              '# TYPE library_db_pool_idle_connections gauge']
+    lines += [f'library_db_pool_idle_connections{_format_labels(("branch",), (branch,))} {pool._idle.qsize()}'
+              for branch, pool in db_pools.items()]
+
+    if REPLICA_MODE != 'off':
+        generations = {branch: replicas._current for branch, replicas in replica_sets.items()}
+        lines += ['# HELP library_replica_lag_seconds Age of the current read replica snapshot by branch.',
+                  '# TYPE library_replica_lag_seconds gauge']
+        lines += [f'library_replica_lag_seconds{_format_labels(("branch",), (branch,))} {generation.age():.3f}'
+                  for branch, generation in generations.items() if generation is not None]
+        lines += ['# HELP library_replica_pending_writes Writes made since the current snapshot by branch.',
+                  '# TYPE library_replica_pending_writes gauge']
+        lines += [f'library_replica_pending_writes{_format_labels(("branch",), (branch,))} {replicas.writes}'
+                  for branch, replicas in replica_sets.items()]
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    try:
+        return jsonify(read_cache.stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Error handlers
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({'error': 'Endpoint not found'}), 404
+
+@app.errorhandler(500)
+def internal_error(error):
+    return jsonify({'error': 'Internal server error'}), 500
+
+# CLI commands
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations to every branch."""
+    for branch, database in BRANCH_DATABASES.items():
+        conn = connect_db(database)
+        applied = migrate_db(conn)
+        click.echo(f'{branch}: schema at version {schema_version(conn)}')
+        conn.close()
+        for version, description in applied:
+            click.echo(f'  applied {version}: {description}')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a hot query no longer uses an index on any branch."""
+    regressions = []
+    for branch, database in BRANCH_DATABASES.items():
+        conn = connect_db(database)
+        migrate_db(conn)
+        regressions += [(branch, *regression) for regression in check_query_plans(conn)]
+        conn.close()
+
+    for branch, name, detail, problem in regressions:
+        click.echo(f'{branch}: {name}: {problem} ({detail})', err=True)
+    if regressions:
+        raise SystemExit(1)
+    click.echo(f'{len(HOT_QUERIES)} hot queries use indexes')
+
+@app.cli.command('labels')
+@click.option('--isbn', 'isbns', multiple=True, help='ISBN to print; repeat for more.')
+@click.option('--category', help='Print labels for every book in this category.')
+@click.option('--output', '-o', default='labels.pdf', show_default=True)
+@click.option('--branch', type=click.Choice(list(BRANCH_DATABASES)), default=DEFAULT_BRANCH, show_default=True)
+def labels_command(isbns, category, output, branch):
+    """Write a printable PDF sheet of QR labels."""
+    if not isbns and not category:
+        raise click.UsageError('Pass --isbn or --category')
+
+    with use_branch(branch):
+        conn = get_db_connection()
+        items, failures = find_label_items(conn, list(isbns), category)
+        conn.close()
+    not_found = len(failures)
+
+    with open(output, 'wb') as f:
+        for chunk in stream_pdf(compose_label_pages(render_labels(items), failures)):
+            f.write(chunk)
+
+    click.echo(f'Wrote {len(items) - (len(failures) - not_found)} label(s) to {output}')
+    for failure in failures:
+        click.echo(f"{failure['isbn']}: {failure['error']}", err=True)
+
+@app.cli.command('archive-history')
+@click.option('--days', type=click.IntRange(min=0), required=True,
+              help='Archive loans returned more than this many days ago.')
+@click.option('--output', '-o', type=click.File('a', encoding='utf-8'),
+              help='Append to this NDJSON file instead of borrow_history_archive.')
+@click.option('--branch', type=click.Choice(list(BRANCH_DATABASES)), default=DEFAULT_BRANCH, show_default=True)
+def archive_history_command(days, output, branch):
+    """Move old returned loans out of borrow_history."""
+    with use_branch(branch):
+        conn = get_db_connection()
+        archived = archive_returned_loans(conn, days, output)
+        conn.close()
+    click.echo(f'Archived {archived} loan(s)')
+
+@app.cli.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to the file extension.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--branch', type=click.Choice(list(BRANCH_DATABASES)), default=DEFAULT_BRANCH, show_default=True)
+def import_books_command(path, fmt, batch_size, branch):
+    """Upsert books from a CSV or NDJSON file."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+    with use_branch(branch):
+        conn = get_db_connection()
+        with open(path, encoding='utf-8', newline='') as f:
+            report = import_books(conn, iter_import_records(f, fmt), batch_size)
+        conn.close()
+
+    click.echo(f"Imported {report['imported']} book(s), {report['error_count']} error(s)")
+    for error in report['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+
+@app.cli.command('export')
+@click.argument('table', type=click.Choice(list(EXPORT_TABLES)))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='ndjson', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--branch', type=click.Choice(list(BRANCH_DATABASES)), default=DEFAULT_BRANCH, show_default=True)
+def export_command(table, fmt, output, branch):
+    """Stream a table to a CSV or NDJSON file (stdout by default)."""
+    sql, to_dict = EXPORT_TABLES[table]
+    with use_branch(branch):
+        chunks = stream_rows(sql, (), to_dict, fmt)
+    for chunk in chunks:
+        output.write(chunk)
+
+if __name__ == '__main__':
+    # Initialize database
+    init_db()
+    
+    # Run the app
+    if SERVER_MODE == 'asgi':
+        # Serves the same routes through asgi.py's event loop and bounded executors
+        import uvicorn
+        uvicorn.run('asgi:application', host=HOST, port=PORT, workers=WORKERS)
+    else:
+        app.run(debug=DEBUG, host=HOST, port=PORT, threaded=True)
\ No newline at end of file
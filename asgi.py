@@ -0,0 +1,275 @@
+"""ASGI entry point for the library API.
+
+Serves every Flask route from an asyncio event loop, so thousands of idle or
+slow clients (barcode scanners, kiosks) cost a coroutine each instead of a
+thread each. Route handlers still run the synchronous Flask code, but only
+on a bounded thread pool sized to the SQLite connection pool, and QR renders
+that miss the cache are pushed to a process pool. The change-feed SSE stream
+is served directly on the event loop, so long-lived subscribers never hold
+one of those threads.
+
+Run with any ASGI server, e.g.:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 6969
+
+or set LIBRARY_SERVER=asgi and start app.py as usual.
+"""
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import app as library
+
+ASGI_THREADS = int(os.environ.get('LIBRARY_ASGI_THREADS', str(library.DB_POOL_SIZE)))
+ASGI_RENDER_PROCESSES = int(os.environ.get('LIBRARY_ASGI_RENDER_PROCESSES', str(os.cpu_count() or 2)))
+# Request bodies above this size are spooled to a temporary file
+ASGI_SPOOL_SIZE = 1024 * 1024
+# Response chunks buffered between a handler thread and the event loop
+ASGI_RESPONSE_QUEUE = 16
+CHANGE_STREAM_PATH = '/api/changes/stream'
+
+db_executor = None
+render_executor = None
+
+
+def start():
+    global db_executor, render_executor
+    if db_executor is not None:
+        return
+    db_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='library-db')
+    render_executor = ProcessPoolExecutor(
+        max_workers=ASGI_RENDER_PROCESSES,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+    library.qr_store.executor = render_executor
+
+
+def stop():
+    global db_executor, render_executor
+    library.qr_store.executor = None
+    if db_executor is not None:
+        db_executor.shutdown(wait=True)
+        render_executor.shutdown(wait=True)
+        db_executor = render_executor = None
+    for pool in library.db_pools.values():
+        pool.close_all()
+    library.close_replicas()
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ (PEP 3333)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(environ, loop, chunks, cancelled):
+    """Executor job: run the Flask app and feed its response into chunks.
+
+    The whole response body is iterated on this one thread, because streaming
+    handlers hold a thread-local pooled connection until they finish.
+    """
+    def put(item):
+        asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put(('start', int(status.split(' ', 1)[0]), headers))
+
+    iterable = None
+    try:
+        iterable = library.app(environ, start_response)
+        for chunk in iterable:
+            if cancelled.is_set():
+                break
+            if chunk:
+                put(chunk)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+        environ['wsgi.input'].close()
+        put(None)
+
+
+async def read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=ASGI_SPOOL_SIZE)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+    return body
+
+
+async def handle_http(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    body = await read_body(receive)
+    chunks = asyncio.Queue(maxsize=ASGI_RESPONSE_QUEUE)
+    cancelled = threading.Event()
+    job = loop.run_in_executor(db_executor, run_wsgi, build_environ(scope, body), loop, chunks, cancelled)
+
+    try:
+        while True:
+            item = await chunks.get()
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                _, status, headers = item
+                await send({
+                    'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+                })
+            else:
+                await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    except Exception:
+        # Client went away; stop the handler and drain so its thread can finish
+        cancelled.set()
+        while await chunks.get() is not None:
+            pass
+        raise
+    finally:
+        await job
+
+
+async def send_json(send, status, payload):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def handle_change_stream(scope, receive, send):
+    """Serve /api/changes/stream as a coroutine fed by the branch's ChangeFeed"""
+    loop = asyncio.get_running_loop()
+    request = library.app.request_class(build_environ(scope, io.BytesIO()))
+    branch = request.args.get('branch') or request.headers.get(library.BRANCH_HEADER) or library.DEFAULT_BRANCH
+    if branch not in library.change_feeds:
+        await send_json(send, 404, {'error': f'Unknown branch: {branch}'})
+        return
+    try:
+        since = library.parse_change_since(request.args, request.headers)
+    except ValueError:
+        await send_json(send, 400, {'error': 'since must be a non-negative integer'})
+        return
+
+    feed = library.change_feeds[branch]
+    wake = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(wake.set)
+
+    await loop.run_in_executor(db_executor, feed.subscribe, listener)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        if since is None:
+            since = await loop.run_in_executor(db_executor, feed.current_seq)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        while not disconnected.done():
+            wake.clear()
+            # Usually answered from memory; only a lagging client reads the log
+            changes = await loop.run_in_executor(db_executor, feed.changes_after, since)
+            if changes is None:
+                await send({'type': 'http.response.body', 'body': library.SSE_RESYNC.encode(), 'more_body': True})
+                break
+            if changes:
+                body = ''.join(library.sse_event(change) for change in changes).encode()
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                since = changes[-1]['seq']
+                continue
+
+            woken = asyncio.ensure_future(wake.wait())
+            done, _ = await asyncio.wait({woken, disconnected}, timeout=library.SSE_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            woken.cancel()
+            if not done:
+                await send({'type': 'http.response.body', 'body': library.SSE_KEEPALIVE.encode(), 'more_body': True})
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        feed.unsubscribe(listener)
+        disconnected.cancel()
+
+
+async def handle_lifespan(receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                start()
+                await loop.run_in_executor(db_executor, library.init_db)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await loop.run_in_executor(None, stop)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+    elif scope['type'] == 'http':
+        # Servers without lifespan support still get executors on first use
+        start()
+        if scope['path'] == CHANGE_STREAM_PATH and scope['method'] == 'GET':
+            await handle_change_stream(scope, receive, send)
+        else:
+            await handle_http(scope, receive, send)
+    else:
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
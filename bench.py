@@ -0,0 +1,423 @@
+"""Load-test and micro-benchmark harness for the library API.
+
+Seeds synthetic catalogs (10k/100k/1M books with proportional borrow
+history), drives every route through the Flask test client and through a
+local HTTP server with concurrent clients, and reports p50/p95/p99 latency,
+throughput and peak RSS per scenario. Results can be stored as a baseline;
+later runs compare against it and exit non-zero on a regression.
+
+    python bench.py --sizes 10k                          # quick run
+    python bench.py --sizes 10k,100k --save-baseline bench_baseline.json
+    python bench.py --sizes 10k --baseline bench_baseline.json --tolerance 0.25
+
+Each catalog size runs in its own subprocess so the database path, caches
+and peak RSS of one size never leak into another.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+LOANS_PER_BOOK = 2
+SEED = 1234
+WORDS = (
+    'algorithms data systems design python java networks security learning deep '
+    'distributed database compilers graphics operating modern practical clean '
+    'advanced introduction patterns cloud web machine theory computing software '
+    'engineering architecture reliable scalable concurrent functional programming'
+).split()
+AUTHORS = (
+    'Knuth Tanenbaum Kleppmann Cormen Martin Bloch Lutz Ramalho Norvig Russell '
+    'Stallings Silberschatz Patterson Hennessy Kernighan Ritchie Gamma Fowler Beck'
+).split()
+CATEGORIES = (
+    'Programming', 'Database', 'Networking', 'Operating Systems', 'Web Development',
+    'Artificial Intelligence', 'Software Engineering', 'Cybersecurity', 'Data Science'
+)
+
+
+# Catalog seeding
+def synthetic_isbn(n):
+    return f'978{n:010d}'
+
+
+def seed_catalog(path, books, loans_per_book=LOANS_PER_BOOK, seed=SEED):
+    """Create a migrated database at path with a deterministic synthetic catalog"""
+    import app as library
+
+    rng = random.Random(seed)
+    conn = library.connect_db(path)
+    library.migrate_db(conn)
+
+    def book_rows():
+        for n in range(books):
+            copies = rng.randint(1, 5)
+            title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+            author = ', '.join(rng.sample(AUTHORS, rng.randint(1, 2)))
+            yield (
+                synthetic_isbn(n), title, author, rng.choice(CATEGORIES),
+                rng.randint(1970, 2024), f'{title} by {author}', copies, copies
+            )
+
+    def loan_rows():
+        for n in range(books * loans_per_book):
+            day = rng.randint(0, 364)
+            borrow_date = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1704067200 + day * 86400))
+            returned = rng.random() < 0.9
+            yield (
+                synthetic_isbn(rng.randrange(books)), f'reader{rng.randrange(books // 10 + 1)}',
+                None, borrow_date, borrow_date if returned else None,
+                'returned' if returned else 'borrowed'
+            )
+
+    conn.executemany('''
+        INSERT INTO books (isbn, title, author, category, publication_year,
+                           description, copies, available)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', book_rows())
+    conn.executemany('''
+        INSERT INTO borrow_history (isbn, borrower_name, borrower_email,
+                                    borrow_date, return_date, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', loan_rows())
+    # Loans still out take their copies off the shelf
+    conn.execute('''
+        UPDATE books SET available = MAX(copies - (
+            SELECT COUNT(*) FROM borrow_history bh WHERE bh.isbn = books.isbn AND bh.status = 'borrowed'
+        ), 0)
+    ''')
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+
+def seeded_database(data_dir, size):
+    """Path of a pristine seeded catalog, building it on first use"""
+    path = os.path.join(data_dir, f'bench-{size}.db')
+    if not os.path.exists(path):
+        print(f'Seeding {size} catalog ({SIZES[size]:,} books)...', file=sys.stderr)
+        tmp_path = path + '.tmp'
+        seed_catalog(tmp_path, SIZES[size])
+        os.replace(tmp_path, path)
+    return path
+
+
+# Scenarios
+def scenarios(books, rng, open_loans=(), latest_seq=0):
+    """(name, method, path factory, body factory) for every route under test.
+
+    A body factory is always called right after its path factory, so the two
+    can share state (a return's ISBN and borrower must belong to one loan).
+    open_loans are (isbn, borrower) pairs the return scenario may close.
+    """
+    counter = iter(range(10 ** 9))
+    loans = list(open_loans)
+    rng.shuffle(loans)
+    current = {}
+
+    def any_isbn():
+        return synthetic_isbn(rng.randrange(books))
+
+    def new_book():
+        n = next(counter)
+        return {'isbn': f'979{n:010d}', 'title': f'Bench Book {n}', 'author': 'Bench', 'copies': 2}
+
+    def borrow_path():
+        current['isbn'] = any_isbn()
+        return f"/api/books/{current['isbn']}/borrow"
+
+    def borrow_body():
+        name = f'bench{next(counter)}'
+        loans.append((current['isbn'], name))
+        return {'borrower_name': name}
+
+    def return_path():
+        # A refused borrow, or running out of loans, still runs the lookup and answers 404
+        current['loan'] = loans.pop() if loans else (any_isbn(), 'nobody')
+        return f"/api/books/{current['loan'][0]}/return"
+
+    def checkout_body():
+        return {'borrower_name': f'bench{next(counter)}', 'isbns': [any_isbn() for _ in range(3)]}
+
+    def batch_get_body():
+        return {'isbns': [any_isbn() for _ in range(50)], 'fields': ['isbn', 'title', 'available']}
+
+    def batch_update_body():
+        return {'updates': [{'isbn': any_isbn(), 'description': f'batch {next(counter)}'} for _ in range(20)]}
+
+    def changes_path():
+        # A poller a few hundred changes behind the head of the log
+        return f'/api/changes?since={max(latest_seq - rng.randrange(500), 0)}&limit=100'
+
+    return [
+        ('books_page', 'GET', lambda: '/api/books?limit=50', None),
+        ('books_page_projected', 'GET', lambda: '/api/books?limit=200&fields=isbn,title,available', None),
+        ('book_by_isbn', 'GET', lambda: f'/api/books/{any_isbn()}', None),
+        ('books_batch_get', 'POST', lambda: '/api/books:batchGet', batch_get_body),
+        ('search', 'GET', lambda: f'/api/search?q={rng.choice(WORDS)}+{rng.choice(WORDS)[:3]}', None),
+        ('suggest', 'GET', lambda: f'/api/suggest?q={rng.choice(WORDS)[:rng.randint(1, 4)]}', None),
+        ('recommendations', 'GET', lambda: f'/api/books/{any_isbn()}/recommendations', None),
+        ('book_qr_png', 'GET', lambda: f'/api/books/{any_isbn()}/qr?format=png', None),
+        ('frontend_qr', 'GET', lambda: '/generate-frontend-qr', None),
+        ('stats', 'GET', lambda: '/api/stats', None),
+        ('history_page', 'GET', lambda: '/api/borrow-history?limit=50', None),
+        ('history_by_borrower', 'GET',
+         lambda: f'/api/borrow-history?limit=50&borrower=reader{rng.randrange(books // 10 + 1)}', None),
+        ('changes', 'GET', changes_path, None),
+        ('add_book', 'POST', lambda: '/api/books', new_book),
+        ('update_book', 'PUT', lambda: f'/api/books/{any_isbn()}',
+         lambda: {'description': f'updated {next(counter)}'}),
+        ('books_batch_update', 'POST', lambda: '/api/books:batchUpdate', batch_update_body),
+        ('borrow', 'POST', borrow_path, borrow_body),
+        ('return', 'POST', return_path, lambda: {'borrower_name': current['loan'][1]}),
+        ('checkout', 'POST', lambda: '/api/checkout', checkout_body),
+    ] + [
+        (f'report_{report}', 'GET', lambda report=report: f'/api/reports/{report}', None)
+        for report in ('loans-per-month', 'loan-duration', 'utilization', 'never-borrowed')
+    ]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its high-water mark; elsewhere the peak only grows
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(latencies, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_client(client, scenario, requests):
+    """Sequential requests through the Flask test client: pure handler cost"""
+    _, method, path, body = scenario
+    latencies, errors = [], 0
+    reset_peak_rss()
+    started = time.perf_counter()
+    for _ in range(requests):
+        target = path()
+        payload = body() if body else None
+        t = time.perf_counter()
+        response = client.open(target, method=method, json=payload)
+        response.get_data()
+        latencies.append(time.perf_counter() - t)
+        errors += response.status_code >= 500
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_http(port, scenario, requests, concurrency):
+    """Concurrent clients against a real threaded HTTP server"""
+    _, method, path, body = scenario
+    local = threading.local()
+    lock = threading.Lock()
+
+    def one(_):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        # The factories share an rng and, for some scenarios, state between path and body
+        with lock:
+            target = path()
+            payload = json.dumps(body()).encode() if body else None
+        headers = {'Content-Type': 'application/json'} if payload else {}
+        t = time.perf_counter()
+        try:
+            conn.request(method, target, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            local.conn = None
+            status = 599
+        return time.perf_counter() - t, status
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], sum(r[1] >= 500 for r in results), elapsed)
+
+
+def run_worker(args):
+    """Child process: benchmark one catalog size and print results as JSON"""
+    import app as library
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    library.init_db()
+    books = SIZES[args.size]
+    rng = random.Random(SEED)
+    conn = library.connect_db(library.DATABASE)
+    open_loans = conn.execute(
+        "SELECT isbn, borrower_name FROM borrow_history WHERE status = 'borrowed' ORDER BY id"
+    ).fetchall()
+    latest_seq = library.latest_change_seq(conn)
+    conn.close()
+    results = {}
+
+    server = None
+    if args.mode in ('http', 'both'):
+        class QuietHandler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive for the load generator
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        server = make_server('127.0.0.1', 0, library.app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = library.app.test_client()
+    only = set(args.scenarios.split(',')) if args.scenarios else None
+    for scenario in scenarios(books, rng, [tuple(loan) for loan in open_loans], latest_seq):
+        name = scenario[0]
+        if only and name not in only:
+            continue
+        results[name] = {}
+        if args.mode in ('client', 'both'):
+            results[name]['client'] = run_client(client, scenario, args.requests)
+        if server is not None:
+            results[name]['http'] = run_http(server.server_port, scenario, args.requests, args.concurrency)
+
+    if server is not None:
+        server.shutdown()
+    json.dump(results, sys.stdout)
+
+
+# Reporting and baselines
+def print_report(results):
+    header = f"{'size':<6} {'scenario':<26} {'mode':<7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'rss MB':>8} {'err':>4}"
+    print(header)
+    print('-' * len(header))
+    for size, by_scenario in results.items():
+        for name, by_mode in by_scenario.items():
+            for mode, m in by_mode.items():
+                print(f"{size:<6} {name:<26} {mode:<7} {m['p50_ms']:>9.2f} {m['p95_ms']:>9.2f} "
+                      f"{m['p99_ms']:>9.2f} {m['throughput_rps']:>9.1f} {m['peak_rss_mb']:>8.1f} {m['errors']:>4}")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a stored baseline: slower p95, lower throughput or new errors"""
+    regressions = []
+    for size, by_scenario in results.items():
+        for name, by_mode in by_scenario.items():
+            for mode, m in by_mode.items():
+                base = baseline.get(size, {}).get(name, {}).get(mode)
+                if not base:
+                    continue
+                label = f'{size}/{name}/{mode}'
+                if m['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                    regressions.append(f"{label}: p95 {base['p95_ms']:.2f} -> {m['p95_ms']:.2f} ms")
+                if m['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+                    regressions.append(
+                        f"{label}: throughput {base['throughput_rps']:.1f} -> {m['throughput_rps']:.1f} req/s")
+                if m['errors'] > base['errors']:
+                    regressions.append(f"{label}: errors {base['errors']} -> {m['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k', help='comma-separated catalog sizes: 10k, 100k, 1m')
+    parser.add_argument('--mode', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--requests', type=int, default=300, help='requests per scenario and mode')
+    parser.add_argument('--concurrency', type=int, default=16, help='HTTP load generator clients')
+    parser.add_argument('--scenarios', help='comma-separated subset of scenarios to run')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'library-bench'),
+                        help='where seeded catalogs are kept between runs')
+    parser.add_argument('--output', help='write the results JSON here')
+    parser.add_argument('--baseline', help='compare against this results JSON')
+    parser.add_argument('--save-baseline', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for size in args.sizes.lower().split(','):
+        if size not in SIZES:
+            parser.error(f'unknown size {size!r}; choose from {", ".join(SIZES)}')
+
+        # Every run starts from an identical copy of the pristine seed
+        with tempfile.TemporaryDirectory() as work_dir:
+            db_path = os.path.join(work_dir, 'library.db')
+            shutil.copyfile(seeded_database(args.data_dir, size), db_path)
+            env = dict(os.environ, LIBRARY_DB=db_path, LIBRARY_QR_CACHE_DIR=os.path.join(work_dir, 'qr'))
+            command = [
+                sys.executable, os.path.abspath(__file__), '--worker', '--size', size,
+                '--mode', args.mode, '--requests', str(args.requests),
+                '--concurrency', str(args.concurrency),
+            ]
+            if args.scenarios:
+                command += ['--scenarios', args.scenarios]
+            output = subprocess.run(command, env=env, cwd=work_dir, check=True,
+                                    stdout=subprocess.PIPE).stdout
+            results[size] = json.loads(output)
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%} of {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
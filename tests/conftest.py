@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level configuration is read at import, so point it at scratch space first
+_scratch = tempfile.mkdtemp(prefix='library-tests-')
+os.environ.setdefault('LIBRARY_DB', os.path.join(_scratch, 'library.db'))
+os.environ.setdefault('LIBRARY_QR_CACHE_DIR', os.path.join(_scratch, 'qr_cache'))
+
+import pytest
+
+import app as library
+
+# Background threads left over from a test fall back to this database
+library.init_db()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Path of a freshly seeded default-branch database, with all per-branch state reset"""
+    path = str(tmp_path / 'library.db')
+    branch = library.DEFAULT_BRANCH
+    pool = library.ConnectionPool(path)
+    monkeypatch.setitem(library.BRANCH_DATABASES, branch, path)
+    monkeypatch.setitem(library.db_pools, branch, pool)
+    monkeypatch.setitem(library.write_coordinators, branch, library.WriteCoordinator(branch))
+    monkeypatch.setitem(library.change_feeds, branch, library.ChangeFeed(branch))
+    monkeypatch.setitem(library.replica_sets, branch, library.ReplicaSet(branch))
+    monkeypatch.setitem(library.suggest_indexes, branch, library.SuggestIndex())
+    monkeypatch.setitem(library.recommenders, branch, library.Recommender(branch))
+    monkeypatch.setitem(library.circulation_snapshots, branch, library.CirculationSnapshot(branch))
+    monkeypatch.setattr(library, 'read_cache', library.ReadCache(library.MemoryCache()))
+    monkeypatch.setattr(library, 'qr_store', library.QRCodeStore(directory=str(tmp_path / 'qr_cache')))
+    library.init_db()
+    yield path
+    pool.close_all()
+
+
+@pytest.fixture
+def client(database):
+    return library.app.test_client()
+
+
+@pytest.fixture
+def conn(database):
+    conn = library.connect_db(database)
+    yield conn
+    conn.close()
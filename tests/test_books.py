@@ -0,0 +1,114 @@
+import base64
+import csv
+import io
+import json
+
+import pytest
+
+import app as library
+
+
+def statement_labels():
+    return {labels[0] for labels in library.query_latency._series}
+
+
+def test_projection_order_does_not_change_the_statement(client):
+    first = client.get('/api/books', query_string={'fields': 'title,isbn', 'limit': 5})
+    labels = statement_labels()
+    second = client.get('/api/books', query_string={'fields': 'isbn, title, isbn', 'limit': 5})
+
+    assert first.get_json() == second.get_json()
+    assert list(first.get_json()['books'][0]) == ['isbn', 'title']
+    assert statement_labels() == labels
+
+
+def test_batch_get_projection_order_does_not_change_the_statement(client):
+    body = {'isbns': ['9780262033848'], 'fields': ['author', 'isbn']}
+    first = client.post('/api/books:batchGet', json=body)
+    labels = statement_labels()
+    second = client.post('/api/books:batchGet', json=dict(body, fields=['isbn', 'author']))
+
+    assert first.get_json() == second.get_json()
+    assert statement_labels() == labels
+
+
+def test_unknown_fields_are_rejected(client):
+    assert client.get('/api/books', query_string={'fields': 'title,password'}).status_code == 400
+    assert client.post('/api/books:batchGet', json={'isbns': ['9780262033848'], 'fields': ['nope']}).status_code == 400
+
+
+def test_batch_get_rejects_fields_that_are_not_strings(client):
+    for fields in ([1, 'isbn'], [None], [['isbn']], 7, {'isbn': True}):
+        response = client.post('/api/books:batchGet', json={'isbns': ['9780262033848'], 'fields': fields})
+        assert response.status_code == 400, fields
+        assert 'fields must be a subset' in response.get_json()['error']
+
+
+def cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def walk(client, path, limit, key):
+    """Every page of a keyset-paginated listing, following next_cursor"""
+    rows, after = [], None
+    while True:
+        query = {'limit': limit, **({'after': after} if after else {})}
+        page = client.get(path, query_string=query).get_json()
+        rows += page[key]
+        assert len(page[key]) <= limit
+        after = page['next_cursor']
+        if after is None:
+            return rows
+
+
+def test_keyset_walk_returns_every_book_once(client, conn):
+    # Duplicate titles make the id tie-breaker do real work at page boundaries
+    conn.executemany('INSERT INTO books (isbn, title, author) VALUES (?, ?, ?)',
+                     [(f'978000000{n:04d}', 'Same Title', 'Author') for n in range(7)])
+    conn.commit()
+    expected = [row[0] for row in conn.execute('SELECT isbn FROM books ORDER BY title, id')]
+
+    for limit in (1, 3, 5, len(expected), len(expected) + 1):
+        assert [book['isbn'] for book in walk(client, '/api/books', limit, 'books')] == expected
+
+
+def test_keyset_walk_over_borrow_history(client, conn):
+    # Equal borrow dates make the id tie-breaker do real work at page boundaries
+    conn.executemany("INSERT INTO borrow_history (isbn, borrower_name, borrow_date) VALUES (?, ?, ?)",
+                     [('9780262033848', f'reader {n}', f'2024-01-0{n % 3 + 1} 00:00:00') for n in range(9)])
+    conn.commit()
+    expected = [row[0] for row in conn.execute('SELECT id FROM borrow_history ORDER BY borrow_date DESC, id DESC')]
+
+    assert [loan['id'] for loan in walk(client, '/api/borrow-history', 2, 'history')] == expected
+
+
+@pytest.mark.parametrize('after', [
+    'not a cursor!', cursor('ab'), cursor([1]), cursor(['Dune']), cursor([['Dune'], 1]),
+    cursor(['Dune', '1']), cursor(['Dune', 1.5]), cursor(['Dune', True]), cursor({'title': 'Dune', 'id': 1}),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode()
+])
+@pytest.mark.parametrize('path', ['/api/books', '/api/borrow-history'])
+def test_tampered_cursor_is_rejected(client, path, after):
+    response = client.get(path, query_string={'limit': 5, 'after': after})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+@pytest.mark.parametrize('limit', [None, 10])
+def test_ndjson_stream_has_one_line_per_row(client, conn, limit):
+    total = conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+    query = {'stream': 'ndjson', 'fields': 'isbn', **({'limit': limit} if limit else {})}
+    response = client.get('/api/books', query_string=query)
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == (limit or total)
+    assert len({json.loads(line)['isbn'] for line in lines}) == len(lines)
+
+
+def test_streams_cross_fetch_batches(client, conn, monkeypatch):
+    monkeypatch.setattr(library, 'STREAM_FETCH_SIZE', 4)
+    total = conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+    books = json.loads(client.get('/api/books', query_string={'stream': 'json'}).get_data(as_text=True))
+    assert len(books) == total
+    rows = client.get('/api/books', query_string={'stream': 'csv', 'fields': 'isbn,title'}).get_data(as_text=True)
+    assert len(list(csv.reader(io.StringIO(rows)))) == total + 1
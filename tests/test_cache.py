@@ -0,0 +1,83 @@
+import pytest
+
+import app as library
+
+ISBN = '9780262033848'
+
+
+@pytest.fixture
+def redis_backend(monkeypatch):
+    """A RedisCache talking to an in-process fakeredis server"""
+    fakeredis = pytest.importorskip('fakeredis')
+    redis = pytest.importorskip('redis')
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis(server=server))
+    return library.RedisCache(url='redis://cache.invalid:6379/0', ttl=60)
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def cache(request, database, monkeypatch):
+    backend = library.MemoryCache() if request.param == 'memory' else request.getfixturevalue('redis_backend')
+    cache = library.ReadCache(backend)
+    monkeypatch.setattr(library, 'read_cache', cache)
+    return cache
+
+
+def test_redis_backend_round_trips_json_and_bytes(redis_backend):
+    redis_backend.set('book', {'isbn': ISBN, 'copies': 2})
+    redis_backend.set('qr', b'\x89PNG\0data')
+    assert redis_backend.get('book') == {'isbn': ISBN, 'copies': 2}
+    assert redis_backend.get('qr') == b'\x89PNG\0data'
+    assert redis_backend.get('missing') is None
+    assert redis_backend.size() == 2
+
+    redis_backend.delete('book', 'qr', 'missing')
+    assert redis_backend.get('book') is None
+    assert redis_backend.size() == 0
+
+
+def test_redis_backend_sets_a_ttl(redis_backend):
+    redis_backend.set('default', 1)
+    redis_backend.set('short', 1, ttl=5)
+    assert 0 < redis_backend._client.ttl('default') <= 60
+    assert 0 < redis_backend._client.ttl('short') <= 5
+
+
+def test_hits_and_misses_are_counted(client, cache):
+    for _ in range(3):
+        assert client.get(f'/api/books/{ISBN}').status_code == 200
+    assert client.get('/api/books/9780000000000').status_code == 404
+
+    stats = client.get('/api/cache/stats').get_json()
+    assert stats['backend'] == cache.backend.name
+    assert stats['namespaces']['book'] == {'hits': 2, 'misses': 2, 'hit_ratio': 0.5}
+
+
+def test_borrow_and_return_invalidate_the_cached_book(client, cache):
+    available = client.get(f'/api/books/{ISBN}').get_json()['available']
+    assert client.post(f'/api/books/{ISBN}/borrow', json={'borrower_name': 'ann'}).status_code == 200
+    assert client.get(f'/api/books/{ISBN}').get_json()['available'] == available - 1
+    assert client.post(f'/api/books/{ISBN}/return', json={'borrower_name': 'ann'}).status_code == 200
+    assert client.get(f'/api/books/{ISBN}').get_json()['available'] == available
+
+
+def test_update_invalidates_the_cached_book(client, cache):
+    assert client.get(f'/api/books/{ISBN}').get_json()['category'] == 'Computer Science'
+    assert client.put(f'/api/books/{ISBN}', json={'category': 'Algorithms'}).status_code == 200
+    assert client.get(f'/api/books/{ISBN}').get_json()['category'] == 'Algorithms'
+    assert cache.hits['book'] == 0
+
+
+def test_cache_outage_falls_back_to_the_database(client, database, monkeypatch):
+    class Down(library.NullCache):
+        name = 'down'
+
+        def get(self, *args, **kwargs):
+            raise ConnectionError('cache is down')
+
+        set = delete = size = get
+
+    monkeypatch.setattr(library, 'read_cache', library.ReadCache(Down()))
+    assert client.get(f'/api/books/{ISBN}').status_code == 200
+    assert client.post(f'/api/books/{ISBN}/borrow', json={'borrower_name': 'ann'}).status_code == 200
+    assert client.get('/api/cache/stats').get_json()['size'] is None
@@ -0,0 +1,85 @@
+import gzip
+
+import pytest
+
+import app as library
+
+
+def get(client, path, encoding=None, **kwargs):
+    headers = kwargs.pop('headers', {})
+    if encoding:
+        headers['Accept-Encoding'] = encoding
+    return client.get(path, headers=headers, **kwargs)
+
+
+def decoders():
+    decoders = {'gzip': gzip.decompress}
+    if library.brotli is not None:
+        decoders['br'] = library.brotli.decompress
+    if library.zstandard is not None:
+        decoders['zstd'] = lambda data: library.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return decoders
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br', 'zstd'])
+def test_large_bodies_are_compressed(client, encoding):
+    if encoding not in decoders():
+        pytest.skip(f'{encoding} codec is not installed')
+    identity = get(client, '/api/books')
+    response = get(client, '/api/books', encoding)
+
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(identity.data)
+    assert decoders()[encoding](response.data) == identity.data
+
+
+def test_client_quality_wins_over_server_preference(client):
+    assert get(client, '/api/books', 'gzip;q=1, zstd;q=0.5, br;q=0.5').headers['Content-Encoding'] == 'gzip'
+    if 'br' in decoders():
+        assert get(client, '/api/books', 'gzip;q=0.5, br').headers['Content-Encoding'] == 'br'
+
+
+def test_identity_and_small_bodies_still_vary(client):
+    response = get(client, '/api/books', 'identity')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    response = get(client, '/api/books/9780262033848', 'gzip')
+    assert len(response.data) < library.COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_compressed_etag_is_weak_and_revalidates(client):
+    strong = get(client, '/api/books').headers['ETag']
+    assert not strong.startswith('W/')
+
+    weak = get(client, '/api/books', 'gzip').headers['ETag']
+    assert weak == f'W/{strong}'
+    for etag in (weak, strong):
+        response = get(client, '/api/books', 'gzip', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert 'Content-Encoding' not in response.headers
+
+
+def test_streams_are_compressed_chunk_by_chunk(client, monkeypatch):
+    monkeypatch.setattr(library, 'STREAM_FETCH_SIZE', 5)
+    identity = get(client, '/api/books', query_string={'stream': 'ndjson'})
+    response = get(client, '/api/books', 'gzip', query_string={'stream': 'ndjson'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data) == identity.data
+
+
+def test_event_streams_and_images_are_left_alone(client):
+    response = get(client, '/api/changes/stream', 'gzip, br, zstd', buffered=False)
+    try:
+        assert response.mimetype == 'text/event-stream'
+        assert 'Content-Encoding' not in response.headers
+    finally:
+        response.close()
+
+    response = get(client, '/api/books/9780262033848/qr', 'gzip', query_string={'format': 'png'})
+    assert response.data.startswith(b'\x89PNG')
+    assert 'Content-Encoding' not in response.headers
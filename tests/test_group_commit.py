@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+import app as library
+
+
+@pytest.fixture
+def coordinator(database, monkeypatch):
+    monkeypatch.setattr(library, 'GROUP_COMMIT', True)
+    conn = library.connect_db(database)
+    conn.execute("INSERT INTO books (isbn, title, author, copies, available) VALUES ('9780000000001', 'Dune', 'Frank Herbert', 5, 5)")
+    conn.execute("INSERT INTO books (isbn, title, author, copies, available) VALUES ('9780000000002', 'Emma', 'Jane Austen', 1, 0)")
+    conn.commit()
+    conn.close()
+    return library.write_coordinators[library.DEFAULT_BRANCH]
+
+
+def block_writer(coordinator):
+    """Occupy the writer thread until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+
+    def wait(conn):
+        started.set()
+        release.wait(5)
+
+    future = coordinator.submit(wait)
+    assert started.wait(5)
+    return release, future
+
+
+def loans(database):
+    conn = library.connect_db(database)
+    try:
+        return conn.execute('SELECT isbn, borrower_name FROM borrow_history ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+def test_queued_writes_share_one_transaction(coordinator, monkeypatch):
+    batches = []
+    apply_write_batch = library.apply_write_batch
+
+    def recording(conn, ops):
+        batches.append(len(ops))
+        return apply_write_batch(conn, ops)
+
+    monkeypatch.setattr(library, 'apply_write_batch', recording)
+    release, blocker = block_writer(coordinator)
+    futures = [
+        coordinator.submit(library.borrow_in_transaction, '9780000000001', f'reader {i}', '')
+        for i in range(5)
+    ]
+    release.set()
+
+    assert len({future.result(5) for future in futures}) == 5
+    assert batches[-1] == 5
+
+
+def test_failing_write_rolls_back_alone(coordinator, database):
+    release, _ = block_writer(coordinator)
+    first = coordinator.submit(library.borrow_in_transaction, '9780000000001', 'ann', '')
+    failing = coordinator.submit(library.borrow_in_transaction, '9780000000002', 'bob', '')
+    last = coordinator.submit(library.borrow_in_transaction, '9780000000001', 'cy', '')
+    release.set()
+
+    assert first.result(5) and last.result(5)
+    with pytest.raises(library.LibraryError) as error:
+        failing.result(5)
+    assert error.value.status == 400
+    assert [tuple(row) for row in loans(database)] == [('9780000000001', 'ann'), ('9780000000001', 'cy')]
+
+
+def test_full_queue_is_refused(database, monkeypatch):
+    monkeypatch.setattr(library, 'GROUP_COMMIT_QUEUE_SIZE', 2)
+    coordinator = library.WriteCoordinator(library.DEFAULT_BRANCH)
+    release, _ = block_writer(coordinator)
+    try:
+        coordinator.submit(lambda conn: None)
+        coordinator.submit(lambda conn: None)
+        with pytest.raises(library.LibraryError) as error:
+            coordinator.submit(lambda conn: None)
+        assert error.value.status == 503
+    finally:
+        release.set()
+
+
+def test_timed_out_write_is_never_applied(coordinator, database, monkeypatch):
+    monkeypatch.setattr(library, 'GROUP_COMMIT_TIMEOUT', 0.1)
+    release, _ = block_writer(coordinator)
+    with pytest.raises(library.LibraryError) as error:
+        library.run_write(library.borrow_in_transaction, '9780000000001', 'late', '')
+    assert error.value.status == 503
+
+    release.set()
+    library.run_write(lambda conn: None)  # drains the queue behind the cancelled write
+    assert loans(database) == []
+
+
+def test_started_write_is_waited_for(coordinator, database, monkeypatch):
+    monkeypatch.setattr(library, 'GROUP_COMMIT_TIMEOUT', 0.1)
+
+    def slow_borrow(conn):
+        threading.Event().wait(0.3)
+        return library.borrow_in_transaction(conn, '9780000000001', 'slow', '')
+
+    assert library.run_write(slow_borrow)
+    assert [tuple(row) for row in loans(database)] == [('9780000000001', 'slow')]
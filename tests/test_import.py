@@ -0,0 +1,111 @@
+import json
+
+import app as library
+
+
+def post_import(client, body, content_type, **params):
+    return client.post('/api/books/import', data=body, content_type=content_type, query_string=params)
+
+
+def books(conn, *isbns):
+    rows = conn.execute(
+        f'SELECT isbn, title, copies, available FROM books WHERE isbn IN ({", ".join("?" * len(isbns))}) ORDER BY isbn',
+        isbns
+    ).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_ndjson_import(client, conn):
+    body = '\n'.join(json.dumps(record) for record in [
+        {'isbn': '978-0-000-00000-1', 'title': 'Dune', 'author': 'Frank Herbert', 'copies': 3},
+        {'isbn': '9780000000002', 'title': 'Emma', 'author': 'Jane Austen'},
+    ]) + '\n\n'
+    response = post_import(client, body, 'application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json() == {'imported': 2, 'error_count': 0, 'errors': []}
+    assert books(conn, '9780000000001', '9780000000002') == [
+        ('9780000000001', 'Dune', 3, 3), ('9780000000002', 'Emma', 1, 1)
+    ]
+
+
+def test_csv_import(client, conn):
+    body = 'isbn,title,author,copies,publication_year\n9780000000001,Dune,Frank Herbert,2,1965\n9780000000002,Emma,Jane Austen,0,\n'
+    response = post_import(client, body, 'text/csv')
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == 2
+    assert books(conn, '9780000000001', '9780000000002') == [
+        ('9780000000001', 'Dune', 2, 2), ('9780000000002', 'Emma', 0, 0)
+    ]
+
+
+def test_invalid_records_are_reported_per_line(client, conn):
+    body = '\n'.join([
+        '{"isbn": "9780000000001", "title": "Dune", "author": "Frank Herbert"}',
+        '{"isbn": "123", "title": "Short", "author": "Nobody"}',
+        'not json',
+        '{"isbn": "9780000000002", "title": "Emma", "author": "Jane Austen", "copies": -1}',
+        '{"isbn": "9780000000003", "title": "Ulysses", "author": "James Joyce", "copies": "many"}',
+        '[]',
+    ])
+    response = post_import(client, body, 'application/x-ndjson')
+    assert response.status_code == 207
+    report = response.get_json()
+    assert report['imported'] == 1
+    assert [error['line'] for error in report['errors']] == [2, 3, 4, 5, 6]
+    assert report['errors'][0] == {'line': 2, 'isbn': '123', 'error': 'ISBN must be 13 digits'}
+    assert books(conn, '9780000000001', '9780000000002', '9780000000003') == [('9780000000001', 'Dune', 1, 1)]
+
+
+def test_rejected_row_does_not_sink_its_batch(client, conn):
+    conn.execute('''
+        CREATE TRIGGER reject_banned BEFORE INSERT ON books WHEN new.title = 'Banned'
+        BEGIN SELECT RAISE(ABORT, 'banned title'); END
+    ''')
+    conn.commit()
+    body = '\n'.join(json.dumps({'isbn': f'978000000000{i}', 'title': title, 'author': 'A. Author'})
+                     for i, title in enumerate(['Dune', 'Banned', 'Emma'], 1))
+    response = post_import(client, body, 'application/x-ndjson', batch_size=10)
+    assert response.status_code == 207
+    report = response.get_json()
+    assert report['imported'] == 2
+    assert report['errors'] == [{'line': 2, 'isbn': '9780000000002', 'error': 'banned title'}]
+    assert [row[0] for row in books(conn, '9780000000001', '9780000000002', '9780000000003')] == [
+        '9780000000001', '9780000000003'
+    ]
+
+
+def test_upsert_keeps_loaned_copies_out(client, conn):
+    conn.execute("INSERT INTO books (isbn, title, author, copies, available) VALUES ('9780000000001', 'Dune', 'F. Herbert', 3, 3)")
+    conn.commit()
+    assert client.get('/api/books/9780000000001').get_json()['author'] == 'F. Herbert'
+    assert client.post('/api/books/9780000000001/borrow', json={'borrower_name': 'ann'}).status_code == 200
+
+    body = '{"isbn": "9780000000001", "title": "Dune", "author": "Frank Herbert", "copies": 5}\n'
+    assert post_import(client, body, 'application/x-ndjson').status_code == 200
+    assert books(conn, '9780000000001') == [('9780000000001', 'Dune', 5, 4)]
+    # The cached copy of the book was dropped by the import
+    assert client.get('/api/books/9780000000001').get_json()['author'] == 'Frank Herbert'
+
+    body = '{"isbn": "9780000000001", "title": "Dune", "author": "Frank Herbert", "copies": 0}\n'
+    assert post_import(client, body, 'application/x-ndjson').status_code == 200
+    assert books(conn, '9780000000001') == [('9780000000001', 'Dune', 0, 0)]
+
+
+def test_busy_batches_are_retried(conn, monkeypatch):
+    monkeypatch.setattr(library, 'DB_RETRY_BACKOFF', 0)
+    attempts = []
+    import_batch = library.import_batch_in_transaction
+
+    def busy_once(conn, batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:
+            conn.executemany(library.IMPORT_UPSERT_SQL, [row for _, row in batch])
+            raise library.sqlite3.OperationalError('database is locked')
+        return import_batch(conn, batch)
+
+    monkeypatch.setattr(library, 'import_batch_in_transaction', busy_once)
+    records = [(1, {'isbn': '9780000000001', 'title': 'Dune', 'author': 'Frank Herbert'}, None)]
+    report = library.import_books(conn, records)
+    assert report == {'imported': 1, 'error_count': 0, 'errors': []}
+    assert attempts == [1, 1]
+    assert books(conn, '9780000000001') == [('9780000000001', 'Dune', 1, 1)]
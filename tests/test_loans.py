@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+
+import pytest
+
+import app as library
+
+
+@pytest.fixture
+def shelf(conn):
+    """Three books with a few copies each"""
+    conn.executemany(
+        'INSERT INTO books (isbn, title, author, copies, available) VALUES (?, ?, ?, ?, ?)',
+        [('9780000000001', 'Dune', 'Frank Herbert', 3, 3),
+         ('9780000000002', 'Emma', 'Jane Austen', 2, 2),
+         ('9780000000003', 'Ulysses', 'James Joyce', 1, 0)]
+    )
+    conn.commit()
+    return conn
+
+
+def test_concurrent_borrows_never_overbook(client, shelf):
+    statuses = []
+    barrier = threading.Barrier(12)
+
+    def borrow(i):
+        own_client = library.app.test_client()
+        barrier.wait()
+        response = own_client.post('/api/books/9780000000001/borrow', json={'borrower_name': f'reader {i}'})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=borrow, args=(i,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] * 3 + [400] * 9
+    available, = shelf.execute("SELECT available FROM books WHERE isbn = '9780000000001'").fetchone()
+    loans, = shelf.execute("SELECT COUNT(*) FROM borrow_history WHERE isbn = '9780000000001'").fetchone()
+    assert (available, loans) == (0, 3)
+
+
+def test_checkout_is_all_or_nothing(client, shelf):
+    response = client.post('/api/checkout', json={
+        'borrower_name': 'ann',
+        'isbns': ['9780000000001', '9780000000002', '9780000000003']
+    })
+    assert response.status_code == 400
+    assert response.get_json()['isbn'] == '9780000000003'
+
+    available = dict(shelf.execute('SELECT isbn, available FROM books WHERE isbn LIKE ?', ('97800000000%',)))
+    assert available == {'9780000000001': 3, '9780000000002': 2, '9780000000003': 0}
+    assert shelf.execute('SELECT COUNT(*) FROM borrow_history').fetchone()[0] == 0
+
+
+def test_checkout_borrows_whole_basket(client, shelf):
+    response = client.post('/api/checkout', json={'borrower_name': 'ann', 'isbns': ['9780000000001', '9780000000002']})
+    assert response.status_code == 200
+    assert len(response.get_json()['borrow_ids']) == 2
+    available = dict(shelf.execute('SELECT isbn, available FROM books WHERE isbn LIKE ?', ('97800000000%',)))
+    assert available == {'9780000000001': 2, '9780000000002': 1, '9780000000003': 0}
+
+
+def test_busy_writes_are_retried(conn, monkeypatch):
+    monkeypatch.setattr(library, 'DB_RETRY_BACKOFF', 0)
+    attempts = []
+
+    def flaky(conn):
+        attempts.append(conn.in_transaction)
+        if len(attempts) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return 'done'
+
+    assert library.run_write_transaction(conn, flaky) == 'done'
+    assert attempts == [True, True, True]
+    assert not conn.in_transaction
+
+
+def test_busy_retries_give_up(conn, monkeypatch):
+    monkeypatch.setattr(library, 'DB_RETRY_BACKOFF', 0)
+    monkeypatch.setattr(library, 'DB_WRITE_RETRIES', 2)
+    attempts = []
+
+    def locked(conn):
+        attempts.append(1)
+        raise sqlite3.OperationalError('database is locked')
+
+    with pytest.raises(sqlite3.OperationalError):
+        library.run_write_transaction(conn, locked)
+    assert len(attempts) == 3
+
+
+def test_library_errors_are_not_retried(conn):
+    attempts = []
+
+    def refuse(conn):
+        attempts.append(1)
+        raise library.LibraryError('Book not available for borrowing')
+
+    with pytest.raises(library.LibraryError):
+        library.run_write_transaction(conn, refuse)
+    assert attempts == [1]
@@ -0,0 +1,36 @@
+import pytest
+
+import app as library
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / 'library.db')
+
+
+def test_migrate_is_idempotent(database):
+    conn = library.connect_db(database)
+    assert len(library.migrate_db(conn)) == len(library.MIGRATIONS)
+    assert library.migrate_db(conn) == []
+    conn.close()
+
+
+@pytest.mark.skipif(not library.TRIGRAM_AVAILABLE, reason='needs SQLite 3.34+ with FTS5')
+def test_skipped_search_indexes_are_created_later(database, monkeypatch):
+    # First migrated by a build without FTS5, then opened by one that has it
+    monkeypatch.setattr(library, 'FTS5_AVAILABLE', False)
+    monkeypatch.setattr(library, 'TRIGRAM_AVAILABLE', False)
+    conn = library.connect_db(database)
+    library.migrate_db(conn)
+    conn.execute("INSERT INTO books (isbn, title, author) VALUES ('9780000000001', 'Dune', 'Frank Herbert')")
+    conn.commit()
+    assert not library.table_exists(conn, 'books_fts')
+    assert not library.table_exists(conn, 'books_trigram')
+
+    monkeypatch.setattr(library, 'FTS5_AVAILABLE', True)
+    monkeypatch.setattr(library, 'TRIGRAM_AVAILABLE', True)
+    applied = library.migrate_db(conn)
+    assert [version for version, _ in applied] == [2, 7]
+    assert library.exact_search(conn, 'dune', 10)[0]['isbn'] == '9780000000001'
+    assert library.fuzzy_search(conn, 'herbret', 10)[0]['isbn'] == '9780000000001'
+    conn.close()
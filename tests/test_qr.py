@@ -0,0 +1,78 @@
+import pytest
+
+import app as library
+
+ISBN = '9780262033848'
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Arguments of every real QR render"""
+    calls = []
+    render_qr = library.render_qr
+
+    def counting(data, fmt='png'):
+        calls.append((data, fmt))
+        return render_qr(data, fmt)
+
+    monkeypatch.setattr(library, 'render_qr', counting)
+    return calls
+
+
+def test_png_is_served_with_an_etag(client, renders):
+    response = client.get(f'/api/books/{ISBN}/qr', query_string={'format': 'png'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG')
+    assert response.headers['ETag'] == f'"{library.qr_cache_key(ISBN, "png")}"'
+    assert 'max-age' in response.headers['Cache-Control']
+    assert renders == [(ISBN, 'png')]
+
+
+@pytest.mark.parametrize('fmt', ['png', 'svg', 'json'])
+def test_revalidation_gets_304_without_touching_the_store(client, monkeypatch, fmt):
+    etag = client.get(f'/api/books/{ISBN}/qr', query_string={'format': fmt}).headers['ETag']
+
+    def unreachable(*args):
+        raise AssertionError('a 304 must not look the image up')
+
+    monkeypatch.setattr(library.qr_store, 'get', unreachable)
+    for header in (etag, f'W/{etag}', f'"other", {etag}'):
+        response = client.get(f'/api/books/{ISBN}/qr', query_string={'format': fmt}, headers={'If-None-Match': header})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+
+def test_stale_etag_gets_the_image(client):
+    response = client.get(f'/api/books/{ISBN}/qr', query_string={'format': 'png'}, headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert response.data.startswith(b'\x89PNG')
+
+
+def test_json_etag_follows_the_title(client):
+    before = client.get(f'/api/books/{ISBN}/qr').headers['ETag']
+    assert client.put(f'/api/books/{ISBN}', json={'title': 'Algorithms, 4th edition'}).status_code == 200
+    response = client.get(f'/api/books/{ISBN}/qr', headers={'If-None-Match': before})
+    assert response.status_code == 200
+    assert response.get_json()['title'] == 'Algorithms, 4th edition'
+    assert response.headers['ETag'] != before
+
+
+def test_evicted_codes_are_read_back_from_disk(tmp_path, renders):
+    store = library.QRCodeStore(maxsize=1, directory=str(tmp_path / 'qr'))
+    key, first = store.get('one')
+    store.get('two')
+    assert store.memory.get(key) is None
+
+    assert store.get('one') == (key, first)
+    assert renders == [('one', 'png'), ('two', 'png')]
+    assert (tmp_path / 'qr' / key[:2] / f'{key}.png').read_bytes() == first
+
+
+def test_without_a_directory_evicted_codes_are_rendered_again(renders):
+    store = library.QRCodeStore(maxsize=1, directory=None)
+    store.get('one')
+    store.get('two')
+    store.get('one')
+    assert renders == [('one', 'png'), ('two', 'png'), ('one', 'png')]
@@ -0,0 +1,26 @@
+import pytest
+
+import app as library
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = library.connect_db(str(tmp_path / 'library.db'))
+    library.migrate_db(conn)
+    yield conn
+    conn.close()
+
+
+def test_migrations_reach_latest_version(conn):
+    assert library.schema_version(conn) == library.MIGRATIONS[-1][0]
+
+
+def test_hot_queries_stay_index_backed(conn):
+    assert library.check_query_plans(conn) == []
+
+
+def test_full_scan_is_reported(conn):
+    queries = {'unindexed filter': ('SELECT * FROM books WHERE description = ?', ('x',))}
+    assert library.check_query_plans(conn, queries) == [
+        ('unindexed filter', 'SCAN books', 'full table scan')
+    ]
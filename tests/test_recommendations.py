@@ -0,0 +1,44 @@
+import threading
+
+import app as library
+
+
+def test_co_borrowed_books_come_first(client, conn):
+    conn.executemany(
+        "INSERT INTO borrow_history (isbn, borrower_name, status) VALUES (?, ?, 'returned')",
+        [('9780262033848', 'ann'), ('9780134494166', 'ann'), ('9780262033848', 'bob'), ('9780134494166', 'bob')]
+    )
+    conn.commit()
+    response = client.get('/api/books/9780262033848/recommendations', query_string={'limit': 3})
+    assert response.status_code == 200
+    picks = response.get_json()['recommendations']
+    assert picks[0]['isbn'] == '9780134494166'
+    assert picks[0]['reason'] == 'co-borrowed'
+
+
+def test_concurrent_first_requests_build_once(database, monkeypatch):
+    recommender = library.recommenders[library.DEFAULT_BRANCH]
+    loads = []
+    load = library.Recommender._load
+
+    def slow_load(self):
+        loads.append(1)
+        threading.Event().wait(0.1)
+        load(self)
+
+    monkeypatch.setattr(library.Recommender, '_load', slow_load)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def ask():
+        barrier.wait()
+        results.append(recommender.neighbours('9780262033848', 5))
+
+    threads = [threading.Thread(target=ask) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [1]
+    assert len(results) == 8
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import app as library
+
+
+@pytest.fixture
+def replicas(database, tmp_path, monkeypatch):
+    """The default branch's replica set in file mode, refreshed by hand rather than by its thread"""
+    monkeypatch.setattr(library, 'REPLICA_MODE', 'file')
+    monkeypatch.setattr(library, 'REPLICA_DIR', str(tmp_path))
+    monkeypatch.setattr(library, 'REPLICA_MAX_STALENESS', 30)
+    replicas = library.replica_sets[library.DEFAULT_BRANCH]
+    replicas._pid = os.getpid()
+    replicas.refresh()
+    yield replicas
+    replicas.close()
+
+
+def snapshot_files(tmp_path):
+    return sorted(path.name for path in tmp_path.glob('*.replica-*.db'))
+
+
+def add_book(conn, isbn='9780000000001'):
+    conn.execute("INSERT INTO books (isbn, title, author) VALUES (?, 'Dune', 'Frank Herbert')", (isbn,))
+    conn.commit()
+
+
+def listed_isbns(client, **params):
+    response = client.get('/api/books', query_string=dict(params, fields='isbn'))
+    assert response.status_code == 200
+    return {book['isbn'] for book in response.get_json()}
+
+
+def test_reads_within_the_staleness_bound_use_the_snapshot(client, conn, replicas):
+    add_book(conn)
+    assert '9780000000001' not in listed_isbns(client)
+    assert '9780000000001' in listed_isbns(client, max_staleness=0)
+
+    response = client.get('/api/books', query_string={'fields': 'isbn'}, headers={'X-Library-Max-Staleness': '0'})
+    assert '9780000000001' in {book['isbn'] for book in response.get_json()}
+
+    replicas.refresh()
+    assert '9780000000001' in listed_isbns(client)
+
+
+def test_invalid_staleness_is_rejected(client, replicas):
+    assert client.get('/api/books', query_string={'max_staleness': '-1'}).status_code == 400
+    assert client.get('/api/books', query_string={'max_staleness': 'soon'}).status_code == 400
+
+
+def test_writes_always_reach_the_primary(client, conn, replicas):
+    response = client.post('/api/books/9780262033848/borrow', json={'borrower_name': 'ann'})
+    assert response.status_code == 200
+    assert conn.execute("SELECT COUNT(*) FROM borrow_history WHERE borrower_name = 'ann'").fetchone()[0] == 1
+
+
+def test_stats_read_totals_and_recent_activity_from_one_snapshot(client, replicas):
+    before = client.get('/api/stats').get_json()
+    assert client.post('/api/books/9780262033848/borrow', json={'borrower_name': 'ann'}).status_code == 200
+
+    stale = client.get('/api/stats').get_json()
+    assert stale == before
+    assert all(loan['borrower_name'] != 'ann' for loan in stale['recent_activity'])
+
+    fresh = client.get('/api/stats', query_string={'max_staleness': 0}).get_json()
+    assert fresh['active_loans'] == before['active_loans'] + 1
+    assert fresh['recent_activity'][0]['borrower_name'] == 'ann'
+
+
+def test_pinned_generation_survives_a_refresh(conn, replicas, tmp_path):
+    generation = replicas.pin(30)
+    old_files = snapshot_files(tmp_path)
+    add_book(conn)
+    replicas.refresh()
+
+    # The old snapshot keeps serving its pinned reader, unchanged, until it is released
+    reader = generation.acquire()
+    try:
+        assert reader.execute("SELECT COUNT(*) FROM books WHERE isbn = '9780000000001'").fetchone()[0] == 0
+    finally:
+        reader.close()
+    assert set(old_files) < set(snapshot_files(tmp_path))
+
+    generation.unpin()
+    assert not set(old_files) & set(snapshot_files(tmp_path))
+    assert replicas.pin(30) is not generation
+
+
+def test_retired_snapshots_are_deleted(replicas, tmp_path):
+    for _ in range(3):
+        replicas.refresh()
+    assert len(snapshot_files(tmp_path)) == 1
+
+    replicas.close()
+    assert snapshot_files(tmp_path) == []
+
+
+def test_stale_snapshot_is_not_pinned(replicas, monkeypatch):
+    generation = replicas.pin(30)
+    generation.unpin()
+    monkeypatch.setattr(generation, 'taken', generation.taken - 60)
+    assert replicas.pin(30) is None
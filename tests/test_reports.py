@@ -0,0 +1,158 @@
+import statistics
+
+import pytest
+
+import app as library
+
+pytest.importorskip('numpy')
+
+LOANS = '(SELECT isbn, borrow_date, return_date, status FROM borrow_history UNION ALL ' \
+        'SELECT isbn, borrow_date, return_date, status FROM borrow_history_archive)'
+
+
+def report(client, name, **params):
+    response = client.get(f'/api/reports/{name}', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def sql_loans_per_month(conn, start='0001-01-01', end='9999-01-01'):
+    rows = conn.execute(f'''
+        SELECT strftime('%Y-%m', l.borrow_date), b.category, COUNT(*)
+        FROM {LOANS} l LEFT JOIN books b ON b.isbn = l.isbn
+        WHERE datetime(l.borrow_date) >= datetime(?) AND datetime(l.borrow_date) < datetime(?)
+        GROUP BY 1, 2 ORDER BY 1, COALESCE(b.category, '')
+    ''', (start, end)).fetchall()
+    return [{'month': month, 'category': category, 'loans': loans} for month, category, loans in rows]
+
+
+def sql_loan_duration(conn):
+    rows = conn.execute(f'''
+        SELECT b.category, (strftime('%s', l.return_date) - strftime('%s', l.borrow_date)) / 86400.0
+        FROM {LOANS} l LEFT JOIN books b ON b.isbn = l.isbn
+        WHERE l.status != 'borrowed' AND l.return_date IS NOT NULL
+    ''').fetchall()
+    days = [row[1] for row in rows]
+    by_category = {}
+    for category, value in rows:
+        by_category.setdefault(category, []).append(value)
+    return {
+        'returned_loans': len(days),
+        'open_loans': conn.execute(f"SELECT COUNT(*) FROM {LOANS} WHERE status = 'borrowed'").fetchone()[0],
+        'average_days': pytest.approx(statistics.fmean(days), abs=0.01),
+        'median_days': pytest.approx(statistics.median(days), abs=0.01),
+        'categories': {
+            category: (len(values), pytest.approx(statistics.fmean(values), abs=0.01))
+            for category, values in by_category.items()
+        }
+    }
+
+
+def sql_utilization(conn):
+    rows = conn.execute('''
+        SELECT category, COUNT(*), SUM(copies), SUM(copies - available) FROM books GROUP BY category
+    ''').fetchall()
+    return {
+        'copies': sum(row[2] for row in rows),
+        'on_loan': sum(row[3] for row in rows),
+        'categories': {category: (books, copies, on_loan) for category, books, copies, on_loan in rows}
+    }
+
+
+def sql_never_borrowed(conn):
+    rows = conn.execute(f'''
+        SELECT isbn FROM books WHERE isbn NOT IN (SELECT isbn FROM {LOANS}) ORDER BY title, isbn
+    ''').fetchall()
+    return [row[0] for row in rows]
+
+
+def assert_reports_match(client, conn):
+    assert report(client, 'loans-per-month') == sql_loans_per_month(conn)
+    assert report(client, 'loans-per-month', **{'from': '2024-02-01', 'to': '2024-03-15'}) == \
+        sql_loans_per_month(conn, '2024-02-01', '2024-03-15')
+
+    duration = report(client, 'loan-duration')
+    expected = sql_loan_duration(conn)
+    assert {key: duration[key] for key in ('returned_loans', 'open_loans', 'average_days', 'median_days')} == \
+        {key: expected[key] for key in ('returned_loans', 'open_loans', 'average_days', 'median_days')}
+    assert {row['category']: (row['returned_loans'], row['average_days']) for row in duration['categories']} == \
+        expected['categories']
+
+    utilization = report(client, 'utilization')
+    expected = sql_utilization(conn)
+    assert (utilization['copies'], utilization['on_loan']) == (expected['copies'], expected['on_loan'])
+    assert {row['category']: (row['books'], row['copies'], row['on_loan']) for row in utilization['categories']} == \
+        expected['categories']
+
+    never = report(client, 'never-borrowed', limit=1000)
+    assert [book['isbn'] for book in never['books']] == sql_never_borrowed(conn)
+    assert never['count'] == len(never['books'])
+
+
+@pytest.fixture
+def history(conn):
+    """Returned and open loans across several months, some already archived"""
+    conn.executemany(
+        'INSERT INTO borrow_history (isbn, borrower_name, borrow_date, return_date, status) VALUES (?, ?, ?, ?, ?)',
+        [('9780134494166', 'old', '2023-12-01 09:00:00', '2023-12-21 09:00:00', 'returned'),
+         ('9780262033848', 'ann', '2024-01-05 10:00:00', '2024-01-19 10:00:00', 'returned'),
+         ('9780134494166', 'ann', '2024-02-01 00:00:00', '2024-02-03 12:00:00', 'returned'),
+         ('9780262033848', 'bob', '2024-02-28 23:59:59', '2024-03-10 08:00:00', 'returned'),
+         ('9781449355739', 'cy', '2024-03-15 00:00:00', None, 'borrowed')]
+    )
+    # Archived the way archive_returned_loans does it, keeping the loan's id
+    conn.execute('''
+        INSERT INTO borrow_history_archive (id, isbn, borrower_name, borrower_email, borrow_date, return_date, status)
+        SELECT id, isbn, borrower_name, borrower_email, borrow_date, return_date, status
+        FROM borrow_history WHERE borrower_name = 'old'
+    ''')
+    conn.execute("DELETE FROM borrow_history WHERE borrower_name = 'old'")
+    conn.execute("UPDATE books SET available = available - 1 WHERE isbn = '9781449355739'")
+    conn.commit()
+    return conn
+
+
+def test_reports_match_sql_aggregates(client, history):
+    assert_reports_match(client, history)
+
+
+def test_incremental_refresh_matches_sql_aggregates(client, history, monkeypatch):
+    assert_reports_match(client, history)
+    snapshot = library.circulation_snapshots[library.DEFAULT_BRANCH]
+    resets = []
+    reset = library.CirculationSnapshot._reset
+    monkeypatch.setattr(library.CirculationSnapshot, '_reset', lambda self: resets.append(1) or reset(self))
+    version = snapshot.version
+
+    # New loans, returns of old and new loans, and catalog edits, all applied incrementally
+    assert client.post('/api/books/9780262033848/borrow', json={'borrower_name': 'dee'}).status_code == 200
+    assert client.post('/api/checkout', json={'borrower_name': 'eve', 'isbns': ['9780134494166', '9780132350884']}).status_code == 200
+    assert client.post('/api/books/9781449355739/return', json={'borrower_name': 'cy'}).status_code == 200
+    assert_reports_match(client, history)
+
+    assert client.post('/api/books/9780134494166/return', json={'borrower_name': 'eve'}).status_code == 200
+    assert client.put('/api/books/9780262033848', json={'category': 'Algorithms'}).status_code == 200
+    assert client.post('/api/books', json={'isbn': '9780000000001', 'title': 'Dune', 'author': 'Frank Herbert',
+                                           'category': 'Fiction'}).status_code == 201
+    assert client.delete('/api/books/9781449355739').status_code == 200
+    assert_reports_match(client, history)
+
+    assert resets == []
+    assert snapshot.version > version
+
+
+def test_incremental_and_full_loads_agree(client, history):
+    report(client, 'utilization')
+    assert client.post('/api/books/9780262033848/borrow', json={'borrower_name': 'dee'}).status_code == 200
+    assert client.post('/api/books/9780262033848/return', json={'borrower_name': 'dee'}).status_code == 200
+    assert client.put('/api/books/9780134494166', json={'category': None}).status_code == 200
+    incremental = {name: report(client, name) for name in library.REPORTS}
+
+    library.circulation_snapshots[library.DEFAULT_BRANCH] = library.CirculationSnapshot(library.DEFAULT_BRANCH)
+    assert {name: report(client, name) for name in library.REPORTS} == incremental
+
+
+def test_bad_parameters(client):
+    assert client.get('/api/reports/unknown').status_code == 404
+    assert client.get('/api/reports/loans-per-month', query_string={'from': 'soon'}).status_code == 400
+    assert client.get('/api/reports/never-borrowed', query_string={'limit': 0}).status_code == 400
@@ -0,0 +1,65 @@
+import pytest
+
+import app as library
+
+pytestmark = pytest.mark.skipif(not library.FTS5_AVAILABLE, reason='SQLite was built without FTS5')
+
+
+@pytest.fixture
+def catalog(conn):
+    conn.executemany(
+        'INSERT INTO books (isbn, title, author, category, description) VALUES (?, ?, ?, ?, ?)',
+        [('9780000000001', 'Zephyr Winds', 'Ann Author', 'Fiction', 'A novel'),
+         ('9780000000002', 'Calm Seas', 'Bob Writer', 'Fiction', 'Sailing on a zephyr'),
+         ('9780000000003', 'The Quick Red Fox', 'Cy Scribe', 'Nature', 'Foxes in the wild'),
+         ('9780000000004', 'Red And Fox', 'Dee Poet', 'Nature', 'Two words apart')]
+    )
+    conn.commit()
+    return conn
+
+
+def search(client, query):
+    response = client.get('/api/search', query_string={'q': query, 'fuzzy': '0'})
+    assert response.status_code == 200, response.get_json()
+    return [book['isbn'] for book in response.get_json()]
+
+
+def test_title_hits_outrank_description_hits(client, catalog):
+    assert search(client, 'zephyr') == ['9780000000001', '9780000000002']
+
+
+def test_words_match_by_prefix(client, catalog):
+    assert search(client, 'zeph') == ['9780000000001', '9780000000002']
+    assert search(client, 'scrib') == ['9780000000003']
+
+
+def test_quoted_phrases_match_exactly(client, catalog):
+    assert search(client, '"red fox"') == ['9780000000003']
+    assert sorted(search(client, 'red fox')) == ['9780000000003', '9780000000004']
+    assert search(client, '"red fo"') == []
+
+
+@pytest.mark.parametrize('query', ['"red fox', 'red fox"', '"', 'AND', 'red AND', 'OR fox', 'NOT', 'NEAR(red fox)',
+                                   'red*', '-fox', '(red', 'title:red', '^red', '+'])
+def test_user_input_never_breaks_the_match_syntax(client, catalog, query):
+    search(client, query)
+
+
+def test_unbalanced_quote_still_matches(client, catalog):
+    assert search(client, '"quick red') == ['9780000000003']
+
+
+def test_index_follows_updates_and_deletes(client, catalog):
+    assert client.put('/api/books/9780000000001', json={'title': 'Mistral Winds'}).status_code == 200
+    assert search(client, 'zephyr') == ['9780000000002']
+    assert search(client, 'mistral') == ['9780000000001']
+
+    assert client.delete('/api/books/9780000000002').status_code == 200
+    assert search(client, 'zephyr') == []
+    assert search(client, 'calm') == []
+
+
+def test_build_fts_query():
+    assert library.build_fts_query('clean arch') == '"clean"* "arch"*'
+    assert library.build_fts_query('"red fox" AND') == '"red fox" "AND"*'
+    assert library.build_fts_query('" -( *') == ''
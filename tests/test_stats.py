@@ -0,0 +1,84 @@
+import pytest
+
+
+def recomputed(conn):
+    totals = conn.execute('''
+        SELECT COUNT(*), COALESCE(SUM(copies), 0), COALESCE(SUM(available), 0),
+               (SELECT COUNT(*) FROM borrow_history WHERE status = 'borrowed')
+        FROM books
+    ''').fetchone()
+    categories = conn.execute('''
+        SELECT category, COUNT(*) FROM books WHERE category IS NOT NULL GROUP BY category
+    ''').fetchall()
+    return tuple(totals), dict(categories)
+
+
+def maintained(conn):
+    totals = conn.execute('''
+        SELECT total_books, total_copies, available_copies, active_loans FROM library_stats WHERE id = 1
+    ''').fetchone()
+    categories = conn.execute('SELECT category, count FROM category_stats WHERE count > 0').fetchall()
+    return tuple(totals), dict(categories)
+
+
+@pytest.fixture
+def check(conn):
+    def check():
+        assert maintained(conn) == recomputed(conn)
+    check()
+    return check
+
+
+def test_add_update_and_delete(client, check):
+    book = {'isbn': '9780000000001', 'title': 'Dune', 'author': 'Frank Herbert', 'category': 'Fiction', 'copies': 4}
+    assert client.post('/api/books', json=book).status_code == 201
+    check()
+
+    assert client.put('/api/books/9780000000001', json={'copies': 6, 'available': 6}).status_code == 200
+    check()
+    assert client.put('/api/books/9780000000001', json={'category': 'Science Fiction'}).status_code == 200
+    check()
+    assert client.put('/api/books/9780000000001', json={'category': None}).status_code == 200
+    check()
+
+    assert client.delete('/api/books/9780000000001').status_code == 200
+    check()
+
+
+def test_borrow_return_and_checkout(client, check):
+    assert client.post('/api/books/9780262033848/borrow', json={'borrower_name': 'ann'}).status_code == 200
+    check()
+    assert client.post('/api/checkout', json={
+        'borrower_name': 'bob', 'isbns': ['9780262033848', '9780134494166']
+    }).status_code == 200
+    check()
+    assert client.post('/api/books/9780262033848/return', json={'borrower_name': 'ann'}).status_code == 200
+    check()
+
+
+def test_batch_writes_and_import(client, check):
+    assert client.post('/api/books:batchUpdate', json={'updates': [
+        {'isbn': '9780262033848', 'copies': 9, 'available': 9, 'category': 'Algorithms'},
+        {'isbn': '9780134494166', 'category': 'Algorithms'},
+    ]}).status_code == 200
+    check()
+
+    body = '{"isbn": "9780000000001", "title": "Dune", "author": "Frank Herbert", "category": "Fiction", "copies": 2}\n'
+    assert client.post('/api/books/import', data=body, content_type='application/x-ndjson').status_code == 200
+    check()
+
+    assert client.post('/api/books:batchDelete', json={'isbns': ['9780000000001', '9780262033848']}).status_code == 200
+    check()
+
+
+def test_archiving_returned_loans(client, conn, check):
+    for name in ('ann', 'bob'):
+        assert client.post('/api/books/9780262033848/borrow', json={'borrower_name': name}).status_code == 200
+    assert client.post('/api/books/9780262033848/return', json={'borrower_name': 'ann'}).status_code == 200
+    conn.execute("UPDATE borrow_history SET borrow_date = '2000-01-01', return_date = '2000-01-02' WHERE status = 'returned'")
+    conn.commit()
+    check()
+
+    response = client.post('/api/borrow-history/archive', json={'days': 1})
+    assert response.get_json()['archived'] > 0
+    check()
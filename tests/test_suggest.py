@@ -0,0 +1,52 @@
+import app as library
+
+
+def suggest(client, query):
+    response = client.get('/api/suggest', query_string={'q': query})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_prefix_matches_title_author_and_isbn(client):
+    assert any(item['title'] == 'Clean Code: A Handbook of Agile Software Craftsmanship'
+               for item in suggest(client, 'clean co'))
+    assert any(item['matched'] == 'author' for item in suggest(client, 'cormen'))
+    assert suggest(client, '978-0-262-03384')[0]['isbn'] == '9780262033848'
+
+
+def test_popularity_counts_archived_and_new_loans(client, conn):
+    isbn = '9780262033848'
+    for name in ('ann', 'bob'):
+        conn.execute("INSERT INTO borrow_history (isbn, borrower_name, status) VALUES (?, ?, 'returned')", (isbn, name))
+    conn.execute("INSERT INTO borrow_history_archive (id, isbn, borrower_name, status) VALUES (100000, ?, 'old', 'returned')", (isbn,))
+    conn.commit()
+    assert suggest(client, 'introduction to alg')[0]['popularity'] == 3
+
+    assert client.post(f'/api/books/{isbn}/borrow', json={'borrower_name': 'cy'}).status_code == 200
+    conn.execute("INSERT INTO borrow_history (isbn, borrower_name) VALUES (?, 'other worker')", (isbn,))
+    conn.commit()
+    assert suggest(client, 'introduction to alg')[0]['popularity'] == 5
+
+
+def test_writes_from_other_processes_are_picked_up(client, conn):
+    assert suggest(client, 'dune') == []
+    conn.execute("INSERT INTO books (isbn, title, author) VALUES ('9780000000001', 'Dune', 'Frank Herbert')")
+    conn.commit()
+    assert [item['isbn'] for item in suggest(client, 'dune')] == ['9780000000001']
+
+    conn.execute("DELETE FROM books WHERE isbn = '9780000000001'")
+    conn.commit()
+    assert suggest(client, 'dune') == []
+
+
+def test_import_catches_up_without_rebuilding(client, monkeypatch):
+    suggest(client, 'a')
+    builds = []
+    build = library.SuggestIndex._build
+    monkeypatch.setattr(library.SuggestIndex, '_build', lambda self, conn: builds.append(1) or build(self, conn))
+
+    response = client.post('/api/books/import', data='{"isbn": "9780000000001", "title": "Dune", "author": "Frank Herbert"}\n',
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert [item['isbn'] for item in suggest(client, 'dune')] == ['9780000000001']
+    assert builds == []